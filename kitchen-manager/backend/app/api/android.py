@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-import requests
-import os
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from ..services.container import get_label_printer
+from ..services.label_raster import render_raster
+from ..services.label_templates import render_label
+from ..services.printer_health import PrinterUnavailableError
+from ..services.printer_registry import PrinterNotFoundError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -16,6 +19,8 @@ class PrinterSettings(BaseModel):
     useQRCode: bool = False
     printLogo: bool = False
     darkMode: bool = False
+    rasterize: bool = False
+    dotWidth: int = 384
 
 class PrintTextRequest(BaseModel):
     text: str
@@ -25,6 +30,20 @@ class PrintLabelRequest(BaseModel):
     label_data: Dict[str, Any]
     settings: Optional[PrinterSettings] = None
 
+def _label_lines(label_data: Dict[str, Any]) -> List[str]:
+    """The text lines of a label: its rendered content, or the prep-bag layout of its fields."""
+    if label_data.get("content"):
+        return [str(line) for line in label_data["content"]]
+    return list(render_label("prep_bag", {
+        "dish_name": label_data.get("dishName", ""),
+        "prep_date": label_data.get("prepDate", ""),
+        "expiry_date": label_data.get("expiryDate", ""),
+        "ingredients": label_data.get("ingredients") or [],
+        "allergens": label_data.get("allergens") or [],
+        "notes": label_data.get("notes") or "",
+        "tray_id": label_data.get("trayId") or "",
+    }).lines)
+
 @router.get("/awaken")
 async def awaken():
     """
@@ -33,10 +52,18 @@ async def awaken():
     return {"status": "awake", "message": "API is ready"}
 
 @router.post("/print-text")
-async def print_text(request: PrintTextRequest):
+async def print_text(
+    request: PrintTextRequest,
+    printer_id: Optional[str] = None,
+    printer_service=Depends(get_label_printer),
+):
     try:
-        # Get the Android printer service URL from environment
-        android_service_url = os.environ.get('LABEL_DETECTOR_URL', 'http://localhost:8080')
+        # Requests go through the printer's pooled async dispatcher
+        if printer_id:
+            dispatcher = printer_service.registry.get(printer_id).dispatcher
+        else:
+            dispatcher = printer_service.dispatcher
+        android_service_url = dispatcher.base_url
         
         # Send the print request to the Android service
         # The Android app will use the provided settings or fall back to defaults
@@ -47,28 +74,44 @@ async def print_text(request: PrintTextRequest):
             "text": request.text,
             "settings": request.settings.dict() if request.settings else None
         }
+        if request.settings and request.settings.rasterize:
+            request_data["raster"] = render_raster(request.text.splitlines(), request_data["settings"]).to_payload()
         
-        response = requests.post(
-            f"{android_service_url}/print-text",
-            json=request_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+        response = await dispatcher.post("/print-text", request_data)
         
         if response.status_code == 200:
             return {"success": True, "status": "printed"}
         else:
             raise HTTPException(status_code=500, detail="Failed to print text")
             
+    except PrinterUnavailableError as e:
+        # Fail fast while the phone is known to be unreachable
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error sending print request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/print-label")
-async def print_label(request: PrintLabelRequest):
+async def print_label(
+    request: PrintLabelRequest,
+    printer_id: Optional[str] = None,
+    printer_service=Depends(get_label_printer),
+):
     try:
-        # Get the Android printer service URL from environment
-        android_service_url = os.environ.get('LABEL_DETECTOR_URL', 'http://localhost:8080')
+        # Requests go through the printer's pooled async dispatcher
+        if printer_id:
+            dispatcher = printer_service.registry.get(printer_id).dispatcher
+        else:
+            dispatcher = printer_service.dispatcher
+        android_service_url = dispatcher.base_url
         
         # Send the print request to the Android service
         logger.info(f"Sending label print request to Android service at {android_service_url}")
@@ -78,19 +121,30 @@ async def print_label(request: PrintLabelRequest):
             "label_data": request.label_data,
             "settings": request.settings.dict() if request.settings else None
         }
+        if request.settings and request.settings.rasterize:
+            request_data["raster"] = render_raster(
+                _label_lines(request.label_data), request_data["settings"],
+                qr_data=request.label_data.get("trayId"),
+            ).to_payload()
         
-        response = requests.post(
-            f"{android_service_url}/print-label",
-            json=request_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+        response = await dispatcher.post("/print-label", request_data)
         
         if response.status_code == 200:
             return {"success": True, "status": "printed"}
         else:
             raise HTTPException(status_code=500, detail="Failed to print label")
             
+    except PrinterUnavailableError as e:
+        # Fail fast while the phone is known to be unreachable
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error sending print request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -0,0 +1,123 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional, Set
+import asyncio
+import json
+import logging
+import os
+from ..services.container import get_event_bus
+from ..services.event_bus import TOPICS
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Seconds between SSE keep-alive comments, so proxies don't drop idle streams
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+
+def parse_topics(topics) -> Optional[Set[str]]:
+    """Parse a comma-separated topic list (or a list of topics). None means every topic."""
+    if not topics:
+        return None
+    if isinstance(topics, str):
+        topics = topics.split(",")
+    parsed = {topic.strip() for topic in topics if topic.strip()}
+    unknown = parsed - set(TOPICS)
+    if unknown:
+        raise ValueError(f"Unknown topics: {', '.join(sorted(unknown))}. Available: {', '.join(TOPICS)}")
+    return parsed
+
+async def _send_events(websocket: WebSocket, subscription):
+    try:
+        while True:
+            await websocket.send_json(await subscription.get())
+    except EOFError:
+        # Subscriber fell behind; the client should reconnect with its last event ID
+        await websocket.close(code=1013)
+
+@router.websocket("/ws")
+async def event_socket(
+    websocket: WebSocket,
+    topics: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    event_bus=Depends(get_event_bus),
+):
+    """
+    Push events over a WebSocket.
+
+    Query parameters pick the initial topics (comma-separated, default all)
+    and the last event ID seen, to resume after a reconnect. The client can
+    change its topics at any time by sending
+    ``{"action": "subscribe" | "unsubscribe", "topics": [...]}``.
+    """
+    try:
+        initial_topics = parse_topics(topics)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    await websocket.accept()
+    subscription = event_bus.subscribe(initial_topics, last_event_id)
+    sender = asyncio.create_task(_send_events(websocket, subscription))
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                action = message.get("action")
+                requested = parse_topics(message.get("topics")) or set(TOPICS)
+            except (ValueError, AttributeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+
+            if action == "subscribe":
+                subscription.subscribe(requested)
+            elif action == "unsubscribe":
+                subscription.unsubscribe(requested)
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown action: {action}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        subscription.close()
+
+@router.get("/stream")
+async def event_stream(
+    request: Request,
+    topics: Optional[str] = None,
+    last_event_id: Optional[int] = Query(None, description="Resume after this event ID"),
+    event_bus=Depends(get_event_bus),
+):
+    """
+    Push events as Server-Sent Events, for clients that can't use the
+    WebSocket. Browsers resume automatically through the Last-Event-ID header.
+    """
+    try:
+        subscribed = parse_topics(topics)
+        header = request.headers.get("last-event-id")
+        if header:
+            last_event_id = int(header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    subscription = event_bus.subscribe(subscribed, last_event_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(timeout=SSE_HEARTBEAT)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except EOFError:
+            # Subscriber fell behind; ending the stream makes the client reconnect
+            pass
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
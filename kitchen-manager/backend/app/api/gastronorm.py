@@ -1,128 +1,93 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-import json
-import os
-from pathlib import Path
-from .state import SELECTED_TRAYS
-import logging
+from typing import List, Dict, Any, Optional
+from ..services.container import get_prep_state, get_tray_repository, get_tray_selection
+from ..services.tray_repository import TrayNotFoundError
+from ..services.tray_packing import pack_bags
 
 router = APIRouter()
 
-# Path to the GN.json file in the prep tracking app
-# Use a more reliable path that doesn't depend on relative paths
-GN_JSON_PATH = "/home/mckrotsky/projects/prep-tracker/prep-tracking-app/assets/documents/GN.json"
-
-def load_all_trays():
-    """
-    Load all trays from the JSON file.
-    """
-    try:
-        if not os.path.exists(GN_JSON_PATH):
-            logging.warning(f"Gastronorm trays data not found at {GN_JSON_PATH}")
-            # Return empty list instead of raising an error
-            return []
-            
-        with open(GN_JSON_PATH, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Error reading gastronorm trays: {str(e)}")
-        # Return empty list instead of raising an error
-        return []
-
 class SelectedTraysRequest(BaseModel):
     tray_ids: List[str]
 
+class PackRequest(BaseModel):
+    # Pans to pack into; defaults to the selected trays, or all trays if none are selected
+    tray_ids: Optional[List[str]] = None
+    # Allow bags of different dishes to share a pan
+    mix_dishes: bool = False
+
 @router.post("/select")
-async def select_trays(request: SelectedTraysRequest):
+async def select_trays(
+    request: SelectedTraysRequest,
+    tray_repository=Depends(get_tray_repository),
+    selection=Depends(get_tray_selection),
+):
     """
     Set the list of selected gastronorm trays.
     """
     try:
-        # Load all trays to validate the IDs
-        all_trays = load_all_trays()
-        valid_ids = {tray["id"] for tray in all_trays}
-        
         # Validate that all requested tray IDs exist
-        invalid_ids = set(request.tray_ids) - valid_ids
+        invalid_ids = {tray_id for tray_id in request.tray_ids if tray_repository.get(tray_id) is None}
         if invalid_ids:
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid tray IDs: {', '.join(invalid_ids)}"
             )
-        
-        # Update the selected trays
-        global SELECTED_TRAYS
-        SELECTED_TRAYS = request.tray_ids
-        
-        return {"message": "Selected trays updated successfully", "selected_trays": SELECTED_TRAYS}
+
+        # Swap in the new selection; every router and worker sees it at once
+        selected = selection.replace(request.tray_ids)
+
+        return {"message": "Selected trays updated successfully", "selected_trays": selected}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating selected trays: {str(e)}")
 
 @router.get("/list")
-async def list_gastronorm_trays():
+async def list_gastronorm_trays(tray_repository=Depends(get_tray_repository), selection=Depends(get_tray_selection)):
     """
     Get all gastronorm trays from the JSON file.
     If there are selected trays, only return those.
     Otherwise, return all trays.
     """
     try:
-        # Load all trays
-        all_trays = load_all_trays()
-        
         # If there are selected trays, filter to only include those
-        if SELECTED_TRAYS:
-            trays = [tray for tray in all_trays if tray["id"] in SELECTED_TRAYS]
+        if selection:
+            trays = tray_repository.selected()
         else:
-            trays = all_trays
-            
+            trays = tray_repository.all()
+
         return JSONResponse(content=trays)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading gastronorm trays: {str(e)}")
 
 @router.get("/{tray_id}")
-async def get_tray(tray_id: str):
+async def get_tray(tray_id: str, tray_repository=Depends(get_tray_repository)):
     """
     Get a specific gastronorm tray by ID, but only if it's selected.
     """
     try:
-        # Check if the requested tray is selected
-        if tray_id not in SELECTED_TRAYS:
-            raise HTTPException(status_code=404, detail=f"Tray with ID {tray_id} is not currently selected")
-        
-        # Load all trays
-        all_trays = load_all_trays()
-        
-        # Find the requested tray
-        tray = next((t for t in all_trays if t["id"] == tray_id), None)
-        if not tray:
-            raise HTTPException(status_code=404, detail=f"Tray with ID {tray_id} not found")
-            
+        tray = tray_repository.get_selected(tray_id)
         return JSONResponse(content=tray)
-    except HTTPException:
-        raise
+    except TrayNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading gastronorm tray: {str(e)}")
 
 @router.get("/stats/selected")
-async def get_selected_tray_stats():
+async def get_selected_tray_stats(tray_repository=Depends(get_tray_repository)):
     """
     Get statistics about the currently selected trays.
     """
     try:
-        # Load all trays
-        all_trays = load_all_trays()
-        
         # Filter to only include selected trays
-        selected_trays = [tray for tray in all_trays if tray["id"] in SELECTED_TRAYS]
-        
+        selected_trays = tray_repository.selected()
+
         # Calculate statistics
         total_volume = sum(tray["volumeLiters"] for tray in selected_trays)
         materials = set(tray["material"] for tray in selected_trays)
-        
+
         return {
             "total_trays": len(selected_trays),
             "total_volume_liters": total_volume,
@@ -131,36 +96,55 @@ async def get_selected_tray_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating tray statistics: {str(e)}")
 
+@router.post("/pack")
+async def pack_completed_bags(
+    request: PackRequest = PackRequest(),
+    tray_repository=Depends(get_tray_repository),
+    selection=Depends(get_tray_selection),
+    prep_state=Depends(get_prep_state),
+):
+    """
+    Suggest which pan each completed prep bag should go into, using as few
+    pans as possible. Bag volumes are the same estimates as in the prep
+    data (ingredients plus a 20% buffer). By default each pan holds a
+    single dish.
+    """
+    if request.tray_ids is not None:
+        unknown = [tray_id for tray_id in request.tray_ids if tray_repository.get(tray_id) is None]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Invalid tray IDs: {', '.join(unknown)}")
+        trays = [tray_repository.get(tray_id) for tray_id in dict.fromkeys(request.tray_ids)]
+    elif selection:
+        trays = tray_repository.selected()
+    else:
+        trays = tray_repository.all()
+
+    try:
+        bags = [{**bag, "dish": bag["dish_name"] or bag["dish_id"]} for bag in prep_state.completed_bags()]
+        return pack_bags(bags, trays, mix_dishes=request.mix_dishes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error packing prep bags: {str(e)}")
+
 @router.get("/{tray_id}/contents")
-async def get_tray_contents(tray_id: str):
+async def get_tray_contents(tray_id: str, tray_repository=Depends(get_tray_repository)):
     """
     Get the contents of a specific tray, including prep data.
     """
     try:
-        # Check if the requested tray is selected
-        if tray_id not in SELECTED_TRAYS:
-            raise HTTPException(status_code=404, detail=f"Tray with ID {tray_id} is not currently selected")
-        
-        # Load all trays
-        all_trays = load_all_trays()
-        
-        # Find the requested tray
-        tray = next((t for t in all_trays if t["id"] == tray_id), None)
-        if not tray:
-            raise HTTPException(status_code=404, detail=f"Tray with ID {tray_id} not found")
-        
+        tray = tray_repository.get_selected(tray_id)
+
         # Get prep data for this tray
         from .prep_tracking import get_prep_data_for_tray
         prep_data = await get_prep_data_for_tray(tray_id)
-        
+
         # Combine tray data with prep data
         tray_contents = {
             "tray": tray,
             "prep_data": prep_data
         }
-            
+
         return JSONResponse(content=tray_contents)
-    except HTTPException:
-        raise
+    except TrayNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting tray contents: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting tray contents: {str(e)}")
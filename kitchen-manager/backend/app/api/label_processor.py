@@ -1,28 +1,30 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from typing import Dict, Any, List
-import cv2
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
+from typing import Dict, Any, List, Optional
 import numpy as np
 import logging
 import uuid
 from datetime import datetime
-from ..services.label_storage import LabelStorage
-from ..services.image_processor import ImageProcessor
 from ..services.text_parser import parse_label_text, find_closest_match
-from ..services.db_client import DatabaseClient
+from ..services.label_templates import render_label
+from ..services.container import get_image_processor, get_db_client, get_label_store, get_label_printer
+from ..services.print_spool import SpoolFullError
+from ..services.write_behind import LabelBufferFullError
+from .labels import print_status, spool_full_exception
 import asyncio
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Initialize services
-label_storage = LabelStorage()
-image_processor = ImageProcessor()
-db_client = DatabaseClient()
-
 @router.post("/process-image")
-async def process_image(file: UploadFile = File(...)) -> List[Dict[str, Any]]:
+async def process_image(
+    file: UploadFile = File(...),
+    image_processor=Depends(get_image_processor),
+    db_client=Depends(get_db_client),
+) -> List[Dict[str, Any]]:
     """Process an image to detect and extract label information."""
     try:
+        import cv2
+
         # Record file info for debugging
         file_size = 0
         contents = await file.read()
@@ -128,63 +130,60 @@ async def process_image(file: UploadFile = File(...)) -> List[Dict[str, Any]]:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/save-label")
-async def save_label(label_data: Dict[str, Any]) -> Dict[str, Any]:
+async def save_label(label_data: Dict[str, Any], label_store=Depends(get_label_store)) -> Dict[str, Any]:
     """Save a label to the database."""
     try:
-        saved_label = db_client.save_label(label_data)
+        saved_label = label_store.save_label(label_data)
         return {"status": "success", "label": saved_label}
+    except LabelBufferFullError as e:
+        logger.error(f"Error saving label: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(round(e.retry_after))))}
+        )
     except Exception as e:
         logger.error(f"Error saving label: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/get-labels")
-async def get_labels() -> List[Dict[str, Any]]:
+async def get_labels(label_store=Depends(get_label_store)) -> List[Dict[str, Any]]:
     """Get all saved labels."""
     try:
-        return db_client.get_labels()
+        return label_store.get_labels()
     except Exception as e:
         logger.error(f"Error getting labels: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/print-saved-label/{label_id}")
-async def print_saved_label(label_id: str):
+async def print_saved_label(
+    label_id: str,
+    station: Optional[str] = None,
+    label_store=Depends(get_label_store),
+    printer_service=Depends(get_label_printer),
+):
     """Print a saved label by its ID."""
     try:
         # Get the label from the database
-        label = db_client.get_label_by_id(label_id)
+        label = label_store.get_label_by_id(label_id)
         if not label:
             raise HTTPException(status_code=404, detail=f"Label with ID {label_id} not found")
         
-        # Initialize printer service
-        from ..services.label_printer import LabelPrinterService
-        printer_service = LabelPrinterService()
-        
         # Format product name and dates for printing
-        product_name = label.get("parsed_data", {}).get("product_name", "Unknown Product")
-        dates = label.get("parsed_data", {}).get("dates", [])
-        employee_name = label.get("parsed_data", {}).get("employee_name", "Unknown Employee")
-        
-        # Get content for printing
-        content = [
-            f"Product: {product_name}",
-            f"Employee: {employee_name}"
-        ]
-        
-        # Add dates
-        if dates:
-            content.append("Dates:")
-            for date in dates:
-                content.append(f"- {date}")
+        parsed_data = label.get("parsed_data", {})
+        rendered = render_label("saved_label", {
+            "product_name": parsed_data.get("product_name", "Unknown Product"),
+            "employee_name": parsed_data.get("employee_name", "Unknown Employee"),
+            "dates": parsed_data.get("dates", []),
+        })
         
         # Print content
-        formatted_content = "\n".join(content)
-        success = printer_service.print_text(formatted_content)
+        formatted_content = rendered.text
+        job_id = await printer_service.print_text(formatted_content, station=station)
         
-        return {
-            "success": success, 
-            "status": "printed" if success else "error",
-            "label_id": label_id
-        }
+        return {**print_status(job_id), "label_id": label_id}
+    except SpoolFullError as e:
+        raise spool_full_exception(e)
     except HTTPException:
         raise
     except Exception as e:
@@ -192,10 +191,10 @@ async def print_saved_label(label_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/delete-label")
-async def delete_label(label_id: str) -> Dict[str, Any]:
+async def delete_label(label_id: str, label_store=Depends(get_label_store)) -> Dict[str, Any]:
     """Delete a label by ID."""
     try:
-        success = db_client.delete_label(label_id)
+        success = label_store.delete_label(label_id)
         if not success:
             raise HTTPException(status_code=404, detail=f"Label with ID {label_id} not found")
         return {"status": "success"}
@@ -203,4 +202,4 @@ async def delete_label(label_id: str) -> Dict[str, Any]:
         raise
     except Exception as e:
         logger.error(f"Error deleting label: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
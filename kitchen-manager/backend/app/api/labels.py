@@ -1,9 +1,33 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict
-from pydantic import BaseModel
-from ..services.label_generator import LabelGenerator
-from ..services.label_printer import LabelPrinterService
+from pydantic import BaseModel, ValidationError
+from ..services.container import get_label_generator, get_label_printer
+from ..services.tray_repository import TrayNotFoundError
+from ..services.print_spool import SpoolFullError
+from ..services.printer_registry import PrinterNotFoundError
 from datetime import datetime
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def spool_full_exception(e: SpoolFullError) -> HTTPException:
+    """429 telling the client when the printer's queue should have room again."""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(round(e.retry_after))))}
+    )
+
+def print_status(job_id: Optional[str]) -> Dict:
+    return {
+        "success": job_id is not None,
+        "status": "queued" if job_id else "error",
+        "job_id": job_id
+    }
 
 # Define models directly in this file
 class LabelCreate(BaseModel):
@@ -31,56 +55,127 @@ class LabelBatch(BaseModel):
         extra = "allow"
 
 router = APIRouter()
-label_generator = LabelGenerator()
-printer_service = LabelPrinterService()
+
+# Labels per streamed chunk in /generate-bulk
+BULK_CHUNK_LINES = 200
 
 @router.post("/generate", response_model=List[Label])
-async def generate_labels(label_batch: LabelBatch):
+async def generate_labels(label_batch: LabelBatch, label_generator=Depends(get_label_generator)):
     try:
-        # Debug the incoming data
-        print(f"Received label batch: {label_batch}")
-        
-        # Extract the raw data from the Pydantic model
-        labels_data = []
-        for label in label_batch.labels:
-            # Convert Pydantic model to dict
-            label_dict = label.dict()
-            print(f"Processing label: {label_dict}")
-            labels_data.append(label_dict)
-        
-        # Generate labels
-        generated_labels = label_generator.generate_labels(labels_data)
-        return generated_labels
+        logger.debug(f"Received label batch of {len(label_batch.labels)} labels")
+
+        # Generate labels from the validated request data
+        return label_generator.generate_labels([label.dict() for label in label_batch.labels])
     except Exception as e:
-        import traceback
-        print(f"Error generating labels: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error generating labels")
         raise HTTPException(status_code=500, detail=str(e))
 
+class _RequestStreamingResponse(StreamingResponse):
+    """
+    A streaming response whose body is produced while the request body is
+    still being read. Starlette listens for client disconnects on the same
+    receive channel, which would swallow request body messages, so it only
+    starts listening once ``body_read`` is set. A disconnect before then
+    surfaces as ``ClientDisconnect`` from ``request.stream()``.
+    """
+
+    def __init__(self, content, body_read: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive):
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+@router.post("/generate-bulk")
+async def generate_labels_bulk(request: Request, label_generator=Depends(get_label_generator)):
+    """
+    Generate labels for large batches as a stream.
+
+    The request body is NDJSON with one label per line. It is read as it
+    arrives, lines are validated and turned into labels one at a time, and
+    results are streamed back as NDJSON lines, so only a partial line of
+    input and a chunk of output are held at once. Invalid lines produce
+    ``{"line": n, "error": [...]}`` instead of a label.
+    """
+    body_read = asyncio.Event()
+    counts = {"generated": 0, "failed": 0}
+
+    def convert(lines: List[bytes], first_line_number: int) -> List[str]:
+        out = []
+        for line_number, line in enumerate(lines, start=first_line_number):
+            if not line.strip():
+                continue
+            try:
+                label_data = LabelCreate.model_validate_json(line).dict()
+            except ValidationError as e:
+                counts["failed"] += 1
+                out.append(json.dumps({
+                    "line": line_number,
+                    "error": e.errors(include_url=False, include_input=False)
+                }, default=str))
+            else:
+                counts["generated"] += 1
+                out.append(json.dumps(label_generator.build_label(label_data)))
+        return out
+
+    async def results():
+        line_number = 1
+        pending = b""
+        chunk = []
+        try:
+            async for data in request.stream():
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                if not lines:
+                    continue
+                # Validation and label building run off the event loop
+                chunk.extend(await asyncio.to_thread(convert, lines, line_number))
+                line_number += len(lines)
+                # Send lines in small groups to keep per-message overhead down
+                if len(chunk) >= BULK_CHUNK_LINES:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+        finally:
+            body_read.set()
+        chunk.extend(convert([pending], line_number))
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+        logger.info(f"Streamed {counts['generated']} generated labels ({counts['failed']} invalid lines)")
+
+    return _RequestStreamingResponse(results(), body_read=body_read, media_type="application/x-ndjson")
+
 @router.post("/generate-enhanced/{tray_id}")
-async def generate_enhanced_label(tray_id: str):
+async def generate_enhanced_label(tray_id: str, label_generator=Depends(get_label_generator)):
     """
     Generate an enhanced label with data from other applications.
     """
     try:
         label = await label_generator.generate_enhanced_label(tray_id)
         return {"tray_id": tray_id, "label": label}
+    except TrayNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-enhanced-batch")
-async def generate_enhanced_batch_labels(tray_ids: List[str]):
+async def generate_enhanced_batch_labels(tray_ids: List[str], label_generator=Depends(get_label_generator)):
     """
     Generate enhanced labels for multiple trays.
     """
     try:
-        labels = await label_generator.generate_enhanced_batch_labels(tray_ids)
-        return {"labels": [{"tray_id": tray_id, "label": label} for tray_id, label in zip(tray_ids, labels)]}
+        batch = await label_generator.generate_enhanced_batch_labels(tray_ids)
+        return {"labels": batch["results"], "elapsed_ms": batch["elapsed_ms"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/print")
-async def print_labels(label_batch: LabelBatch):
+async def print_labels(
+    label_batch: LabelBatch,
+    station: Optional[str] = None,
+    label_generator=Depends(get_label_generator),
+    printer_service=Depends(get_label_printer),
+):
     try:
         # Generate labels
         generated_labels = label_generator.generate_labels(label_batch.labels)
@@ -92,29 +187,50 @@ async def print_labels(label_batch: LabelBatch):
             prep_date = datetime.strptime(label["prep_date"], "%Y-%m-%d")
             expiry_date = datetime.strptime(label["expiry_date"], "%Y-%m-%d")
             
-            # Print the label using our new service
-            success = printer_service.print_label(
-                dish_name=label["dish_name"],
-                prep_date=prep_date,
-                expiry_date=expiry_date,
-                ingredients=label.get("ingredients", []),
-                allergens=label.get("allergens", []),
-                notes=label.get("notes", ""),
-                tray_id=label["tray_id"]
-            )
-            
-            results.append({
-                "tray_id": label["tray_id"],
-                "success": success,
-                "status": "printed" if success else "error"
-            })
+            # Queue the label on the print spool
+            try:
+                job_id = await printer_service.print_label(
+                    dish_name=label["dish_name"],
+                    prep_date=prep_date,
+                    expiry_date=expiry_date,
+                    ingredients=label.get("ingredients", []),
+                    allergens=label.get("allergens", []),
+                    notes=label.get("notes", ""),
+                    tray_id=label["tray_id"],
+                    # A label's own station wins over the request's
+                    station=label.get("station") or station
+                )
+            except SpoolFullError as e:
+                results.append({
+                    "tray_id": label["tray_id"],
+                    "success": False,
+                    "status": "rejected",
+                    "retry_after": e.retry_after
+                })
+                continue
+            except PrinterNotFoundError as e:
+                # Labels already queued stay queued; only this one fails
+                results.append({
+                    "tray_id": label["tray_id"],
+                    "success": False,
+                    "status": "error",
+                    "error": str(e)
+                })
+                continue
+
+            results.append({"tray_id": label["tray_id"], **print_status(job_id)})
         
         return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/print-enhanced/{tray_id}")
-async def print_enhanced_label(tray_id: str):
+async def print_enhanced_label(
+    tray_id: str,
+    station: Optional[str] = None,
+    label_generator=Depends(get_label_generator),
+    printer_service=Depends(get_label_printer),
+):
     """
     Generate and print an enhanced label with data from other applications.
     """
@@ -126,76 +242,112 @@ async def print_enhanced_label(tray_id: str):
         prep_date = datetime.strptime(label["prep_date"], "%Y-%m-%d")
         expiry_date = datetime.strptime(label["expiry_date"], "%Y-%m-%d")
         
-        # Print the label using our new service
-        success = printer_service.print_label(
+        # Queue the label on the print spool
+        job_id = await printer_service.print_label(
             dish_name=label["dish_name"],
             prep_date=prep_date,
             expiry_date=expiry_date,
             ingredients=label.get("ingredients", []),
             allergens=label.get("allergens", []),
             notes=label.get("notes", ""),
-            tray_id=tray_id
+            tray_id=tray_id,
+            station=station
         )
         
-        return {
-            "tray_id": tray_id,
-            "success": success,
-            "status": "printed" if success else "error"
-        }
+        return {"tray_id": tray_id, **print_status(job_id)}
+    except SpoolFullError as e:
+        raise spool_full_exception(e)
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/print-enhanced-batch")
-async def print_enhanced_batch_labels(tray_ids: List[str]):
+async def print_enhanced_batch_labels(
+    tray_ids: List[str],
+    station: Optional[str] = None,
+    label_generator=Depends(get_label_generator),
+    printer_service=Depends(get_label_printer),
+):
     """
     Generate and print enhanced labels for multiple trays.
     """
     try:
-        # Generate enhanced labels
-        labels = await label_generator.generate_enhanced_batch_labels(tray_ids)
-        
-        # Print each label
-        results = []
-        for tray_id, label in zip(tray_ids, labels):
+        started = time.perf_counter()
+
+        # Generate enhanced labels, one result per tray in request order
+        batch = await label_generator.generate_enhanced_batch_labels(tray_ids)
+
+        async def print_result(result):
+            tray_id = result["tray_id"]
+            label = result["label"]
+            if label is None:
+                return {
+                    "tray_id": tray_id,
+                    "success": False,
+                    "status": "error",
+                    "error": result["error"]
+                }
+
             # Parse dates
             prep_date = datetime.strptime(label["prep_date"], "%Y-%m-%d")
             expiry_date = datetime.strptime(label["expiry_date"], "%Y-%m-%d")
-            
-            # Print the label using our new service
-            success = printer_service.print_label(
-                dish_name=label["dish_name"],
-                prep_date=prep_date,
-                expiry_date=expiry_date,
-                ingredients=label.get("ingredients", []),
-                allergens=label.get("allergens", []),
-                notes=label.get("notes", ""),
-                tray_id=tray_id
-            )
-            
-            results.append({
-                "tray_id": tray_id,
-                "success": success,
-                "status": "printed" if success else "error"
-            })
-        
-        return {"results": results}
+
+            try:
+                job_id = await printer_service.print_label(
+                    dish_name=label["dish_name"],
+                    prep_date=prep_date,
+                    expiry_date=expiry_date,
+                    ingredients=label.get("ingredients", []),
+                    allergens=label.get("allergens", []),
+                    notes=label.get("notes", ""),
+                    tray_id=tray_id,
+                    station=station
+                )
+            except SpoolFullError as e:
+                return {
+                    "tray_id": tray_id,
+                    "success": False,
+                    "status": "rejected",
+                    "retry_after": e.retry_after
+                }
+            except PrinterNotFoundError as e:
+                return {
+                    "tray_id": tray_id,
+                    "success": False,
+                    "status": "error",
+                    "error": str(e)
+                }
+
+            return {"tray_id": tray_id, **print_status(job_id)}
+
+        # Queue one label at a time so jobs enter the spool in tray order;
+        # queueing is only a journal append, the printing happens later
+        results = [await print_result(result) for result in batch["results"]]
+
+        return {
+            "results": results,
+            "generation_ms": batch["elapsed_ms"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/printer/status", response_model=Dict[str, str])
-async def get_printer_status():
+@router.get("/printer/status")
+async def get_printer_status(printer_service=Depends(get_label_printer)):
     """
-    Get the current status of the label printer.
+    Get the current status of the label printer from the cached health
+    check: Ready, Unreachable, Unknown (not checked yet) or Disabled, plus
+    latency and circuit breaker state.
     """
     try:
-        # In a real implementation, this would check the actual printer status
-        # For now, we'll just return a mock status
-        return {"status": "Ready"}
+        health = printer_service.status()
+        return {**health, "status": health["status"].capitalize()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking printer status: {str(e)}")
 
 @router.get("/preview/{tray_id}")
-async def preview_label(tray_id: str):
+async def preview_label(tray_id: str, label_generator=Depends(get_label_generator)):
     """
     Preview a label for a specific tray without printing it.
     """
@@ -215,7 +367,7 @@ async def preview_label(tray_id: str):
         raise HTTPException(status_code=500, detail=f"Error previewing label: {str(e)}")
 
 @router.get("/{tray_id}/text")
-async def get_label_text(tray_id: str):
+async def get_label_text(tray_id: str, label_generator=Depends(get_label_generator)):
     try:
         # Get the tray data
         tray = await get_tray(tray_id)
@@ -228,10 +380,3 @@ async def get_label_text(tray_id: str):
         return {"text": label_text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-@router.on_event("shutdown")
-async def shutdown_event():
-    """
-    Clean up resources when the application shuts down.
-    """
-    await label_generator.close() 
\ No newline at end of file
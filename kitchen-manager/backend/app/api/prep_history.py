@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date
+from typing import Optional
+import logging
+
+from ..services.container import get_prep_history
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Report endpoints are plain functions so FastAPI runs them in its threadpool;
+# a query may briefly wait for an append that is being fsynced.
+
+def check_range(start: Optional[date], end: Optional[date]):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+@router.get("/daily")
+def get_daily(start: Optional[date] = None, end: Optional[date] = None, prep_history=Depends(get_prep_history)):
+    """
+    Bags completed per day between ``start`` and ``end`` (inclusive, both
+    optional), with the dishes and trays they went into.
+    """
+    check_range(start, end)
+    try:
+        return prep_history.daily(start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dishes")
+def get_dishes(start: Optional[date] = None, end: Optional[date] = None, prep_history=Depends(get_prep_history)):
+    """
+    Bags completed per dish, with the days it was prepped and the average and
+    peak bags on those days, for setting par levels.
+    """
+    check_range(start, end)
+    try:
+        return prep_history.dishes(start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingredients")
+def get_ingredients(start: Optional[date] = None, end: Optional[date] = None, prep_history=Depends(get_prep_history)):
+    """
+    Weight prepped per ingredient and unit, including added ingredients, for
+    comparing usage against deliveries and waste.
+    """
+    check_range(start, end)
+    try:
+        return prep_history.ingredients(start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/trays")
+def get_trays(start: Optional[date] = None, end: Optional[date] = None, prep_history=Depends(get_prep_history)):
+    """
+    Bags completed per gastronorm tray.
+    """
+    check_range(start, end)
+    try:
+        return prep_history.trays(start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/events")
+def get_recent_events(limit: int = Query(100, ge=1, le=500), prep_history=Depends(get_prep_history)):
+    """
+    The most recent completion events, newest first.
+    """
+    try:
+        return prep_history.recent(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
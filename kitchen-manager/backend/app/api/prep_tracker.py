@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import Dict, Any
 from pydantic import BaseModel
 from datetime import datetime
-from ..services.prep_tracker_service import PrepTrackerService
+from ..services.container import get_prep_tracker_service
+from ..services.print_spool import SpoolFullError
+from .labels import spool_full_exception
 
 router = APIRouter()
-prep_tracker_service = PrepTrackerService()
 
 class PrepData(BaseModel):
     dish_name: str
@@ -14,9 +15,10 @@ class PrepData(BaseModel):
     allergens: list[str] = []
     notes: str = ""
     tray_id: str = None
+    station: str = None
 
 @router.post("/prep-data")
-async def receive_prep_data(data: PrepData):
+async def receive_prep_data(data: PrepData, prep_tracker_service=Depends(get_prep_tracker_service)):
     """
     Receive prep tracker data and trigger label printing.
     """
@@ -25,12 +27,14 @@ async def receive_prep_data(data: PrepData):
         data_dict = data.dict()
         
         # Handle the prep data and print label
-        success = await prep_tracker_service.handle_prep_data(data_dict)
+        job_id = await prep_tracker_service.handle_prep_data(data_dict)
         
-        if success:
-            return {"status": "success", "message": "Label printed successfully"}
+        if job_id:
+            return {"status": "success", "message": "Label queued for printing", "job_id": job_id}
         else:
             raise HTTPException(status_code=500, detail="Failed to print label")
             
+    except SpoolFullError as e:
+        raise spool_full_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing prep data: {str(e)}") 
\ No newline at end of file
@@ -1,239 +1,297 @@
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Request, Response, Depends
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from typing import List, Dict, Any, Literal, Optional
+from typing_extensions import NotRequired, TypedDict
+import asyncio
 import logging
-import json
 from datetime import datetime
 import os
 from pathlib import Path
 import httpx
-from ..core.config import settings
-from .state import SELECTED_TRAYS
+from ..core.logging_config import Payload
+from ..services.container import services, get_event_bus, get_prep_history, get_prep_state, get_recipe_cache, get_tray_selection
+from ..services.prep_state import PrepVersionConflict
+from ..services.recipe_cache import RecipeUpstreamError
 
-# Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# Create a file handler
-handler = logging.FileHandler('prep_tracking.log')
-handler.setLevel(logging.INFO)
-
-# Create a formatting for the logs
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-
-# Add the handler to the logger
-logger.addHandler(handler)
 
 router = APIRouter()
 
-# In-memory storage for prep data
-PREP_DATA = {
-    "dishes": [],
-    "tray_contents": {}  # Map of tray_id to prep data
-}
-
-class Ingredient(BaseModel):
+# The snapshot is validated into plain typed dicts rather than models: a busy
+# prep list holds tens of thousands of ingredients, and building a model for
+# each costs several times more than parsing the JSON. Fields not declared
+# here are kept as sent, as they are on the delta path.
+class Ingredient(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="allow")
     name: str
-    weight: float
-    unit: str
+    weight: NotRequired[float]
+    unit: NotRequired[str]
 
-class PrepBag(BaseModel):
+class PrepBag(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="allow")
     id: str
-    dishName: str
-    ingredients: List[Ingredient]
-    addedIngredients: List[Ingredient]
-    isComplete: bool
+    dishName: NotRequired[Optional[str]]
+    ingredients: NotRequired[List[Ingredient]]
+    addedIngredients: NotRequired[List[Ingredient]]
+    isComplete: NotRequired[bool]
 
-class Dish(BaseModel):
+class Dish(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="allow")
     id: str
     name: str
-    prepBags: List[PrepBag]
-    completedPrepBags: Optional[List[PrepBag]] = None
-    ingredients: List[Ingredient]
-    quantity: int
-    colour: Optional[str] = None
+    trayId: NotRequired[Optional[str]]
+    prepBags: NotRequired[List[PrepBag]]
+    completedPrepBags: NotRequired[Optional[List[PrepBag]]]
+    ingredients: NotRequired[List[Ingredient]]
+    quantity: NotRequired[int]
+    colour: NotRequired[Optional[str]]
 
-class PrepTrackingData(BaseModel):
-    dishes: List[Dish]
-    selectedTrays: List[str]
+class PrepTrackingData(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="allow")
+    dishes: NotRequired[List[Dish]]
+    selectedTrays: NotRequired[List[str]]
+
+prep_tracking_data = TypeAdapter(PrepTrackingData)
+
+async def record_history(prep_state, prep_history):
+    """Append the bag completions from the last change to the prep history."""
+    events = prep_state.take_events()
+    if not events:
+        return
+    try:
+        await asyncio.to_thread(prep_history.record, events)
+    except Exception as e:
+        logger.error(f"Error recording {len(events)} prep history events: {str(e)}")
+
+def validation_errors(e: ValidationError) -> List[Dict[str, Any]]:
+    """Field-level errors, e.g. ``{"loc": ["dishes", 3, "quantity"], "msg": ..., "type": ...}``."""
+    return [{"loc": list(error["loc"]), "msg": error["msg"], "type": error["type"]} for error in e.errors()]
+
+class PrepDeltaOp(BaseModel):
+    op: Literal["upsert_dish", "remove_dish", "upsert_bag", "remove_bag"]
+    # Per-dish or per-bag version; stale operations are ignored
+    version: Optional[int] = None
+    dish: Optional[Dict[str, Any]] = None
+    dish_id: Optional[str] = None
+    bag: Optional[Dict[str, Any]] = None
+    bag_id: Optional[str] = None
+
+class PrepDelta(BaseModel):
+    # Seq returned by the last snapshot or delta this client sent
+    base_seq: Optional[int] = None
+    ops: List[PrepDeltaOp] = []
+    selectedTrays: Optional[List[str]] = None
 
 @router.post("/receive-prep-data")
-async def receive_prep_data_post(request: Request):
+async def receive_prep_data_post(
+    request: Request,
+    strict: bool = False,
+    event_bus=Depends(get_event_bus),
+    prep_state=Depends(get_prep_state),
+    selection=Depends(get_tray_selection),
+    prep_history=Depends(get_prep_history),
+):
     """
-    Receive prep data from the prep-tracker app via POST request.
+    Receive a full snapshot of prep data from the prep-tracker app via POST
+    request. Small changes can be sent to /prep-data/delta instead.
+
+    The body is parsed and validated in one pass, straight from the raw
+    bytes into typed dishes, bags and ingredients; fields the app does not
+    send are left out rather than defaulted. By default numbers sent
+    as strings and the like are coerced; with ``?strict=true`` they are
+    refused and a 422 lists every offending field.
     """
+    body = await request.body()
     try:
-        # Log the raw request body for debugging
-        body = await request.body()
-        logger.info(f"Received raw request body: {body.decode()}")
-        
-        # Parse the JSON data
-        data = await request.json()
-        logger.info(f"Parsed JSON data: {json.dumps(data, indent=2)}")
-        
-        if not data.get("dishes") or not data.get("selectedTrays"):
+        data = prep_tracking_data.validate_json(body, strict=strict)
+    except ValidationError as e:
+        errors = validation_errors(e)
+        logger.warning(f"Invalid prep data ({len(body)} bytes): {e.error_count()} errors, first: {errors[0]}")
+        if strict:
+            raise HTTPException(status_code=422, detail=errors)
+        return {
+            "message": f"Error processing prep data: {e.error_count()} invalid fields",
+            "errors": errors,
+            "completed_prep_bags": [],
+            "selected_trays": selection.ids()
+        }
+
+    try:
+        dishes = data.get("dishes") or []
+        selected_trays = data.get("selectedTrays") or []
+        logger.info(f"Received prep data: {len(dishes)} dishes, {len(selected_trays)} trays, {len(body)} bytes")
+
+        if not dishes or not selected_trays:
             logger.warning("Missing required data in request")
             return {
                 "message": "No data received",
                 "completed_prep_bags": [],
-                "selected_trays": SELECTED_TRAYS
+                "selected_trays": selection.ids()
             }
 
         # Update the selected tray IDs
-        SELECTED_TRAYS.clear()
-        SELECTED_TRAYS.extend(data["selectedTrays"])
-        logger.info(f"Updated selected trays: {SELECTED_TRAYS}")
-        
-        # Store the prep data
-        PREP_DATA["dishes"] = data["dishes"]
-        
-        # Process completed prep bags
-        completed_prep_bags = []
-        for dish in data["dishes"]:
-            for prep_bag in dish.get("prepBags", []):
-                if prep_bag.get("isComplete"):
-                    completed_prep_bags.append({
-                        "id": prep_bag["id"],
-                        "name": f"{dish['name']} - {prep_bag['id']}",
-                        "volume": calculate_volume(prep_bag),
-                        "dish_name": dish["name"]
-                    })
-        
-        # Process tray contents
-        PREP_DATA["tray_contents"] = {}
-        for dish in data["dishes"]:
-            if "trayId" in dish and dish["trayId"]:
-                tray_id = dish["trayId"]
-                if tray_id not in PREP_DATA["tray_contents"]:
-                    PREP_DATA["tray_contents"][tray_id] = {
-                        "dishes": [],
-                        "total_bags": 0,
-                        "ingredients": {}
-                    }
-                
-                # Add dish to tray
-                PREP_DATA["tray_contents"][tray_id]["dishes"].append({
-                    "id": dish["id"],
-                    "name": dish["name"],
-                    "quantity": dish.get("quantity", 1),
-                    "prep_bags": [bag for bag in dish.get("prepBags", []) if bag.get("isComplete")]
-                })
-                
-                # Count total bags
-                PREP_DATA["tray_contents"][tray_id]["total_bags"] += len([bag for bag in dish.get("prepBags", []) if bag.get("isComplete")])
-                
-                # Aggregate ingredients
-                for prep_bag in dish.get("prepBags", []):
-                    if prep_bag.get("isComplete"):
-                        for ingredient in prep_bag.get("ingredients", []):
-                            name = ingredient.get("name", "Unknown")
-                            if name not in PREP_DATA["tray_contents"][tray_id]["ingredients"]:
-                                PREP_DATA["tray_contents"][tray_id]["ingredients"][name] = {
-                                    "total_weight": 0,
-                                    "unit": ingredient.get("unit", "g")
-                                }
-                            
-                            weight = float(ingredient.get("weight", 0))
-                            PREP_DATA["tray_contents"][tray_id]["ingredients"][name]["total_weight"] += weight
-        
-        logger.info(f"Processed tray contents: {json.dumps(PREP_DATA['tray_contents'], indent=2)}")
-        
+        selected = selection.replace(selected_trays)
+        logger.info("Updated selected trays: %s", Payload(selected))
+
+        # Replace the prep state; tray contents are aggregated as dishes load
+        seq = prep_state.replace(dishes)
+        await record_history(prep_state, prep_history)
+
+        # Completed prep bags, with the volumes measured while the state loaded
+        completed_prep_bags = [
+            {
+                "id": bag["id"],
+                "name": f"{bag['dish_name']} - {bag['id']}",
+                "volume": bag["volume"],
+                "dish_name": bag["dish_name"]
+            }
+            for bag in prep_state.completed_bags()
+        ]
+
+        tray_contents = prep_state.tray_contents()
+        logger.info(f"Processed tray contents for {len(tray_contents)} trays")
+
+        # Push the update to subscribed scanners and dashboards
+        event_bus.publish("prep", "prep.updated", {
+            "seq": seq,
+            "selected_trays": selected,
+            "completed_prep_bags": completed_prep_bags,
+            "tray_contents": tray_contents
+        })
+
         return {
             "message": "Prep data received and processed successfully",
             "completed_prep_bags": completed_prep_bags,
-            "selected_trays": SELECTED_TRAYS
+            "selected_trays": selected,
+            "seq": seq
         }
     except Exception as e:
         logger.error(f"Error processing prep data: {str(e)}")
         return {
             "message": f"Error processing prep data: {str(e)}",
             "completed_prep_bags": [],
-            "selected_trays": SELECTED_TRAYS
+            "selected_trays": selection.ids()
         }
 
+@router.post("/prep-data/delta")
+async def receive_prep_data_delta(
+    delta: PrepDelta,
+    event_bus=Depends(get_event_bus),
+    prep_state=Depends(get_prep_state),
+    selection=Depends(get_tray_selection),
+    prep_history=Depends(get_prep_history),
+):
+    """
+    Apply incremental changes from the prep-tracker app: upserts and
+    removals of whole dishes or single prep bags. Only the trays touched by
+    the change are re-aggregated.
+
+    If ``base_seq`` is given and the server has moved on since, nothing is
+    applied and 409 is returned with the current seq; the app should then
+    send a full snapshot to /receive-prep-data.
+    """
+    try:
+        result = prep_state.apply_delta([op.dict(exclude_none=True) for op in delta.ops], delta.base_seq)
+    except PrepVersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "seq": e.seq})
+    await record_history(prep_state, prep_history)
+
+    if delta.selectedTrays is not None:
+        selection.replace(delta.selectedTrays)
+    if result["rejected"]:
+        logger.warning(f"Rejected prep delta operations: {result['rejected']}")
+
+    if result["applied"] or delta.selectedTrays is not None:
+        # Push only the trays that changed
+        event_bus.publish("prep", "prep.delta", {
+            "seq": result["seq"],
+            "selected_trays": selection.ids(),
+            "tray_contents": {tray_id: prep_state.tray(tray_id) for tray_id in result["changed_trays"]}
+        })
+
+    return {**result, "selected_trays": selection.ids()}
+
 @router.get("/receive-prep-data")
-async def receive_prep_data_get():
+async def receive_prep_data_get(prep_state=Depends(get_prep_state), selection=Depends(get_tray_selection)):
     """
     Get the current prep data state.
     """
     return {
         "message": "Current prep data state",
         "completed_prep_bags": [],
-        "selected_trays": SELECTED_TRAYS
+        "selected_trays": selection.ids(),
+        "seq": prep_state.seq
     }
 
-def calculate_volume(prep_bag: Dict[str, Any]) -> float:
-    """
-    Calculate the approximate volume needed for a prep bag based on its ingredients.
-    """
-    total_volume = 0.0
-    
-    # Calculate volume for main ingredients
-    for ingredient in prep_bag.get("ingredients", []):
-        weight = float(ingredient.get("weight", 0))
-        unit = ingredient.get("unit", "").lower()
-        
-        # Convert to liters based on unit
-        if unit == "kg":
-            total_volume += weight
-        elif unit == "g":
-            total_volume += weight / 1000
-        elif unit == "l":
-            total_volume += weight
-        elif unit == "ml":
-            total_volume += weight / 1000
-    
-    # Add some buffer for added ingredients
-    for ingredient in prep_bag.get("addedIngredients", []):
-        weight = float(ingredient.get("weight", 0))
-        unit = ingredient.get("unit", "").lower()
-        
-        if unit == "kg":
-            total_volume += weight
-        elif unit == "g":
-            total_volume += weight / 1000
-        elif unit == "l":
-            total_volume += weight
-        elif unit == "ml":
-            total_volume += weight / 1000
-    
-    # Add 20% buffer for mixing and handling
-    return total_volume * 1.2
-
 @router.get("/selected-trays")
-async def get_selected_trays():
+async def get_selected_trays(selection=Depends(get_tray_selection)):
     """
     Get the list of currently selected trays.
     """
-    return SELECTED_TRAYS 
+    return selection.ids()
 
 async def get_prep_data_for_tray(tray_id: str) -> Dict[str, Any]:
     """
     Get prep data for a specific tray.
     """
-    if tray_id not in PREP_DATA["tray_contents"]:
-        return {
-            "dishes": [],
-            "total_bags": 0,
-            "ingredients": {}
-        }
-    
-    return PREP_DATA["tray_contents"][tray_id] 
+    return services.get("prep_state").tray(tray_id)
+
+def _upstream_response(response: httpx.Response) -> Response:
+    # Upstream answers in JSON or plain text; pass both through unchanged
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+    )
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header names ``etag``, weakly compared as RFC 9110 asks, or is ``*``."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
 
 @router.get("/recipes")
-async def get_recipes():
+async def get_recipes(request: Request, recipe_cache=Depends(get_recipe_cache)):
     """
-    Proxy request to get recipes from the recipe-upscaler backend.
+    Recipes from the recipe-upscaler backend, through a short-lived cache.
+    Tablets sending the ETag they got back with If-None-Match get a 304 while
+    the list is unchanged; X-Cache says whether upstream was asked.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{settings.RECIPE_UPSCALER_URL}/api/recipes")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Failed to fetch recipes from recipe-upscaler: {response.status_code}")
-                raise HTTPException(status_code=response.status_code, detail="Failed to fetch recipes")
+        recipes, status = await recipe_cache.recipes()
+    except RecipeUpstreamError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching recipes: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {"ETag": recipes.etag, "X-Cache": status}
+    if _etag_matches(request.headers.get("if-none-match", ""), recipes.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=recipes.body, media_type="application/json", headers=headers)
+
+@router.post("/recipes")
+async def create_recipe(recipe: Dict[str, Any], recipe_cache=Depends(get_recipe_cache)):
+    """
+    Create a recipe in the recipe-upscaler backend and drop the cached list.
+    """
+    try:
+        return _upstream_response(await recipe_cache.create(recipe))
+    except Exception as e:
+        logger.error(f"Error creating recipe: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/recipes/{recipe_id}")
+async def delete_recipe(recipe_id: str, recipe_cache=Depends(get_recipe_cache)):
+    """
+    Delete a recipe in the recipe-upscaler backend and drop the cached list.
+    """
+    try:
+        return _upstream_response(await recipe_cache.delete(recipe_id))
+    except Exception as e:
+        logger.error(f"Error deleting recipe: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
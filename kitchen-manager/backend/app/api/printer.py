@@ -1,17 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import Dict, List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import uuid
-from ..services.label_generator import LabelGenerator
-from ..services.label_printer import LabelPrinterService
+from ..services.container import get_label_generator, get_label_printer, get_pending_label_queue
+from ..services.tray_repository import TrayNotFoundError
+from ..services.printer_registry import PrinterNotFoundError
 
 router = APIRouter()
-label_generator = LabelGenerator()
-printer_service = LabelPrinterService()
-
-# Store pending labels in memory (in a real app, this would be in a database)
-pending_labels = []
 
 class PrinterLabel(BaseModel):
     id: str
@@ -29,85 +25,126 @@ class PrinterSettings(BaseModel):
     useQRCode: bool
     printLogo: bool
     darkMode: bool
+    rasterize: bool = False
+    dotWidth: int = 384
 
-# Store settings in memory (in a real app, this would be in a database)
-current_settings = PrinterSettings(
-    linesPerFeed=3,
-    fontSize=1.0,
-    fontStyle="normal",
-    alignment="left",
-    useQRCode=False,
-    printLogo=False,
-    darkMode=False
-)
-
-@router.get("/status", response_model=Dict[str, str])
-async def get_printer_status():
+@router.get("/status")
+async def get_printer_status(printer_service=Depends(get_label_printer)):
     """
-    Get the current status of the label printer.
-    For now, this is a mock implementation that always returns 'Ready'.
-    In a real implementation, this would check the actual printer status.
+    Get the current status of the label printer from the cached health
+    check: Ready, Unreachable, Unknown (not checked yet) or Disabled, plus
+    latency and circuit breaker state.
     """
     try:
-        # Mock printer status - in a real implementation, this would check the actual printer
-        return {"status": "Ready"}
+        health = printer_service.status()
+        return {**health, "status": health["status"].capitalize()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking printer status: {str(e)}")
 
+@router.get("/spool")
+async def get_spool_stats(printer_service=Depends(get_label_printer)):
+    """Queue depth, oldest job age and failure counts for the print spool."""
+    try:
+        return printer_service.spool.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching spool stats: {str(e)}")
+
+@router.get("/spool/jobs/{job_id}")
+async def get_spool_job(job_id: str, printer_service=Depends(get_label_printer)):
+    """
+    Get a queued or failed print job. Jobs that have been printed are no
+    longer tracked and return 404.
+    """
+    job = printer_service.spool.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Print job {job_id} not found")
+    return {key: value for key, value in job.items() if key != "payload"}
+
+@router.get("/printers")
+async def get_printers(printer_service=Depends(get_label_printer)):
+    """List the registered printers with their settings, cached health and queue depth."""
+    try:
+        return [printer_service.printer_status(printer) for printer in printer_service.registry.all()]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching printers: {str(e)}")
+
+@router.get("/printers/{printer_id}")
+async def get_printer(printer_id: str, printer_service=Depends(get_label_printer)):
+    """Get one printer's settings, cached health and queue depth."""
+    try:
+        return printer_service.printer_status(printer_service.registry.get(printer_id))
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching printer: {str(e)}")
+
 @router.get("/settings", response_model=PrinterSettings)
-async def get_printer_settings():
+async def get_printer_settings(
+    printer_id: Optional[str] = Query(None, description="Printer to read; the default printer if omitted"),
+    printer_service=Depends(get_label_printer),
+):
     """Get the current printer settings."""
     try:
-        return current_settings
+        if printer_id:
+            return printer_service.registry.get(printer_id).settings
+        return printer_service.settings
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching printer settings: {str(e)}")
 
 @router.put("/settings", response_model=PrinterSettings)
-async def update_printer_settings(settings: PrinterSettings):
+async def update_printer_settings(
+    settings: PrinterSettings,
+    printer_id: Optional[str] = Query(None, description="Printer to update; the default printer if omitted"),
+    printer_service=Depends(get_label_printer),
+):
     """Update the printer settings."""
     try:
-        global current_settings
-        current_settings = settings
-        # Update the printer service with new settings
-        printer_service.update_settings(settings.dict())
-        return current_settings
+        printer_service.update_settings(settings.dict(), printer_id)
+        return settings
+    except PrinterNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating printer settings: {str(e)}")
 
 @router.get("/pending", response_model=List[PrinterLabel])
-async def get_pending_labels():
+async def get_pending_labels(
+    wait: float = Query(0, ge=0, le=60, description="Seconds to wait for a label if none are pending"),
+    queue=Depends(get_pending_label_queue),
+):
     """
     Get all pending labels that haven't been printed yet.
     This endpoint is used by the printer driver to fetch labels to print.
+    With ``wait`` set, the request is held open until a label arrives or the
+    wait runs out, so drivers don't need to poll in a tight loop.
     """
     try:
-        # Return only labels that haven't been printed yet
-        return [label for label in pending_labels if not label.printed]
+        return await queue.wait_for_pending(wait)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching pending labels: {str(e)}")
 
 @router.post("/mark-printed/{label_id}")
-async def mark_label_printed(label_id: str):
+async def mark_label_printed(label_id: str, queue=Depends(get_pending_label_queue)):
     """
     Mark a label as printed.
     This endpoint is used by the printer driver to mark a label as printed.
     """
     try:
-        # Find the label in the pending labels list
-        for label in pending_labels:
-            if label.id == label_id:
-                label.printed = True
-                return {"status": "success", "message": f"Label {label_id} marked as printed"}
-        
-        # If the label is not found, return a 404 error
-        raise HTTPException(status_code=404, detail=f"Label {label_id} not found")
+        if queue.mark_printed(label_id) is None:
+            raise HTTPException(status_code=404, detail=f"Label {label_id} not found")
+        return {"status": "success", "message": f"Label {label_id} marked as printed"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error marking label as printed: {str(e)}")
 
 @router.post("/add-label")
-async def add_label(tray_id: str):
+async def add_label(
+    tray_id: str,
+    label_generator=Depends(get_label_generator),
+    queue=Depends(get_pending_label_queue),
+):
     """
     Add a label to the pending labels list.
     This endpoint is used by the kitchen manager to add a label to the pending labels list.
@@ -116,41 +153,34 @@ async def add_label(tray_id: str):
         # Generate an enhanced label for the tray
         label_data = await label_generator.generate_enhanced_label(tray_id)
         
+        formatted = label_generator.format_for_printer(label_data)
+        
         # Create a new printer label
         new_label = PrinterLabel(
             id=str(uuid.uuid4()),
             tray_id=tray_id,
-            formatted_label=label_data["formatted_label"],
-            raw_data=label_data["raw_data"],
+            formatted_label="\n".join(formatted["content"]),
+            raw_data=label_data,
             created_at=datetime.now().isoformat(),
             printed=False
         )
         
-        # Add the label to the pending labels list
-        pending_labels.append(new_label)
+        # Queue the label and wake any driver waiting on /pending
+        queue.add(new_label.dict())
         
         return {"status": "success", "message": f"Label for tray {tray_id} added to pending list", "label_id": new_label.id}
+    except TrayNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding label: {str(e)}")
 
 @router.get("/labels", response_model=List[PrinterLabel])
-async def get_all_labels():
+async def get_all_labels(queue=Depends(get_pending_label_queue)):
     """
-    Get all labels, including those that have been printed.
+    Get all labels, including recently printed ones.
     This endpoint is used by the printer driver to fetch all labels.
     """
     try:
-        return pending_labels
+        return queue.all()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching labels: {str(e)}")
-
-@router.on_event("shutdown")
-async def shutdown_event():
-    """
-    Clean up resources when the application shuts down.
-    """
-    try:
-        # Close the printer connection
-        await printer_service.close()
-    except Exception as e:
-        print(f"Error closing printer connection: {str(e)}") 
\ No newline at end of file
@@ -1,35 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from typing import Dict, Any
-import cv2
 import numpy as np
 import logging
 import os
 
-# Try to import the image processor, but make it optional
-try:
-    from ..services.image_processor import ImageProcessor
-    IMAGE_PROCESSOR_AVAILABLE = True
-    image_processor = ImageProcessor()
-except Exception as e:
-    IMAGE_PROCESSOR_AVAILABLE = False
-    logging.warning(f"Image processor not available: {str(e)}")
-    logging.warning("Recipe image processing will be limited.")
+# The image processor is optional; it is built lazily by the service container
+# and resolves to None when its dependencies are not installed
+from ..services.container import get_optional_image_processor
 
 router = APIRouter()
 
 @router.post("/process-recipe")
-async def process_recipe_image(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def process_recipe_image(
+    file: UploadFile = File(...),
+    image_processor=Depends(get_optional_image_processor),
+) -> Dict[str, Any]:
     """
     Process a recipe image to extract text and structure it.
     """
     try:
         # Check if image processing is available
-        if not IMAGE_PROCESSOR_AVAILABLE:
+        if image_processor is None:
             return {
                 "error": "Image processing is not available. Please install required dependencies.",
                 "status": "error"
             }
             
+        import cv2
+
         # Read the image file
         contents = await file.read()
         nparr = np.frombuffer(contents, np.uint8)
@@ -57,21 +55,22 @@ async def process_recipe_image(file: UploadFile = File(...)) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=str(e))
         
 @router.get("/status")
-async def get_processor_status() -> Dict[str, Any]:
+async def get_processor_status(image_processor=Depends(get_optional_image_processor)) -> Dict[str, Any]:
     """
     Get the status of the image processor and available features.
     """
+    available = image_processor is not None
     status = {
-        "image_processor_available": IMAGE_PROCESSOR_AVAILABLE,
+        "image_processor_available": available,
         "features": {
-            "perspective_correction": IMAGE_PROCESSOR_AVAILABLE,
-            "text_extraction": IMAGE_PROCESSOR_AVAILABLE,
+            "perspective_correction": available,
+            "text_extraction": available,
             "google_cloud_vision": False,
             "tesseract_ocr": False
         }
     }
     
-    if IMAGE_PROCESSOR_AVAILABLE:
+    if available:
         # Check if Google Cloud Vision is available
         if hasattr(image_processor, 'vision_client') and image_processor.vision_client is not None:
             status["features"]["google_cloud_vision"] = True
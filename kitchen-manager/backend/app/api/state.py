@@ -1,4 +0,0 @@
-from typing import List
-
-# In-memory storage for selected trays
-SELECTED_TRAYS: List[str] = [] 
\ No newline at end of file
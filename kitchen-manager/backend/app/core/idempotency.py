@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+from starlette.datastructures import Headers
+
+logger = logging.getLogger(__name__)
+
+# Endpoints that print. A repeated request to one of these replays the first
+# response instead of printing the label again.
+PRINT_PATHS = (
+    r"^/api/labels/print(-enhanced(-batch)?)?(/[^/]+)?$",
+    r"^/api/label-processor/print-saved-label/[^/]+$",
+    r"^/api/android/print-(text|label)$",
+    r"^/api/prep-tracker/prep-data$",
+    r"^/api/printer/add-label$",
+)
+
+# Prefix of the state store keys holding the entries every worker can see,
+# one key per idempotency key
+SHARED_PREFIX = "idempotency-"
+
+# How long another worker's in-flight request holds its key. Duplicates wait
+# for it until then; past that its worker is taken to have died.
+PENDING_TTL = 60.0
+
+# Outcomes of claiming a key in the shared store besides a stored response
+_MISMATCH = "mismatch"
+_PENDING = "pending"
+
+# status, headers, body
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "response")
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        # Resolves once the first request has finished
+        self.response: "asyncio.Future[StoredResponse]" = asyncio.get_running_loop().create_future()
+
+
+class IdempotencyStore:
+    """
+    Responses to recent print requests, keyed by idempotency key or request
+    hash. Entries expire after their TTL and the oldest are evicted beyond
+    ``max_entries``, so memory stays bounded. Must be used from the event
+    loop.
+
+    With a ``shared`` state store, keys are also claimed there, so a
+    duplicate that lands on another worker waits for and replays the first
+    response instead of printing again. Each key is a store entry of its
+    own with its own lock, so a request only touches its own entry. Shared
+    entries use wall-clock expiry, since the workers share no monotonic
+    clock; an expired entry is taken over by the next request for its key,
+    and every ``sweep_interval`` seconds expired entries are deleted in
+    the background. ``max_entries`` only bounds the in-process entries.
+    """
+
+    def __init__(self, ttl: float = None, content_ttl: float = None, max_entries: int = None, shared=None,
+                 sweep_interval: float = None):
+        self.ttl = ttl or float(os.environ.get('IDEMPOTENCY_TTL', '3600'))
+        self.content_ttl = content_ttl or float(os.environ.get('IDEMPOTENCY_CONTENT_TTL', '10'))
+        self.max_entries = max_entries or int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+        self.sweep_interval = sweep_interval or float(os.environ.get('IDEMPOTENCY_SWEEP_INTERVAL', '60'))
+        self.shared = shared
+        self.poll_interval = 0.05
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._next_sweep = 0.0
+        self._sweep: Optional[asyncio.Task] = None
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def begin(self, key: str, fingerprint: str, ttl: float) -> Tuple[_Entry, bool]:
+        """
+        Look up ``key``, creating an entry if there is no live one. Returns
+        the entry and whether the caller owns it and must ``finish`` it.
+        """
+        now = time.monotonic()
+        self._evict(now)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            return entry, False
+        entry = _Entry(fingerprint, now + ttl)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        return entry, True
+
+    def finish(self, key: str, entry: _Entry, response: StoredResponse, keep: bool):
+        """Hand ``response`` to any waiting duplicates; drop the entry unless ``keep``."""
+        entry.response.set_result(response)
+        if not keep and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -- entries shared between workers ------------------------------------
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        # Client keys can hold any characters; the store key must be a safe file name
+        return SHARED_PREFIX + hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+    def _try_claim_shared(self, key: str, fingerprint: str):
+        shared_key = self._shared_key(key)
+        with self.shared.lock(shared_key):
+            now = time.time()
+            current, _ = self.shared.get(shared_key)
+            if current is not None and current["expires_at"] > now:
+                if current["fingerprint"] != fingerprint:
+                    return _MISMATCH
+                if current["response"] is None:
+                    return _PENDING
+                status, headers, body = current["response"]
+                return (status, [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+                        body.encode("latin-1"))
+            self.shared.put(shared_key, {"fingerprint": fingerprint, "expires_at": now + PENDING_TTL,
+                                         "response": None})
+            return None
+
+    async def claim_shared(self, key: str, fingerprint: str):
+        """
+        Claim ``key`` for this worker. Returns None once claimed, the stored
+        response if another worker already answered the request, or
+        ``"mismatch"`` if the key was used for a different request. Waits
+        while another worker's request is still running.
+        """
+        self._maybe_sweep()
+        while True:
+            outcome = await asyncio.to_thread(self._try_claim_shared, key, fingerprint)
+            if outcome != _PENDING:
+                return outcome
+            await asyncio.sleep(self.poll_interval)
+
+    def finish_shared(self, key: str, fingerprint: str, response: StoredResponse, keep: bool, ttl: float):
+        """Publish ``response`` to other workers, or release the key unless ``keep``."""
+        shared_key = self._shared_key(key)
+        with self.shared.lock(shared_key):
+            if keep:
+                status, headers, body = response
+                self.shared.put(shared_key, {
+                    "fingerprint": fingerprint,
+                    "expires_at": time.time() + ttl,
+                    "response": [status, [(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers],
+                                 body.decode("latin-1")],
+                })
+            else:
+                self.shared.delete(shared_key)
+
+    def sweep_shared(self) -> int:
+        """Delete expired shared entries. Returns how many. Blocks on I/O."""
+        removed = 0
+        for shared_key in self.shared.keys(SHARED_PREFIX):
+            value, _ = self.shared.get(shared_key)
+            if value is None or value["expires_at"] > time.time():
+                continue
+            with self.shared.lock(shared_key):
+                # Checked again: the key may have been claimed anew meanwhile
+                value, _ = self.shared.get(shared_key)
+                if value is not None and value["expires_at"] <= time.time():
+                    self.shared.delete(shared_key)
+                    removed += 1
+        return removed
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now < self._next_sweep or self._sweep is not None:
+            return
+        self._next_sweep = now + self.sweep_interval
+        self._sweep = asyncio.get_running_loop().create_task(self._run_sweep())
+
+    async def _run_sweep(self):
+        try:
+            removed = await asyncio.to_thread(self.sweep_shared)
+            if removed:
+                logger.info(f"Removed {removed} expired shared idempotency entries")
+        except Exception as e:
+            logger.error(f"Error sweeping shared idempotency entries: {str(e)}")
+        finally:
+            self._sweep = None
+
+
+class IdempotencyMiddleware:
+    """
+    Makes print endpoints idempotent.
+
+    A client can send an ``Idempotency-Key`` header. Repeats of that key on
+    the same path within IDEMPOTENCY_TTL get the original response back,
+    marked with ``Idempotent-Replayed: true``, and nothing is printed again.
+    Reusing a key for a different request body is rejected with 422.
+    Without a key, an identical request (path, query and body) within
+    IDEMPOTENCY_CONTENT_TTL seconds counts as a retry or double tap.
+
+    Duplicates that arrive while the first request is still running wait
+    for its response. Only successful responses are kept, so a request that
+    failed can be retried. When the state store is shared (STATE_STORE=file)
+    this holds across uvicorn workers too; with the in-memory store each
+    worker only recognises duplicates it received itself.
+    """
+
+    def __init__(self, app, paths: Sequence[str] = PRINT_PATHS, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.paths: List[Pattern] = [re.compile(path) for path in paths]
+        self._store = store
+
+    @property
+    def store(self) -> IdempotencyStore:
+        # Created lazily so its futures bind to the server's event loop
+        if self._store is None:
+            from ..services.container import services
+            state_store = services.get("state_store")
+            self._store = IdempotencyStore(shared=state_store if state_store.shared else None)
+        return self._store
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "POST"
+                or not any(path.match(scope["path"]) for path in self.paths)):
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        fingerprint = hashlib.blake2b(
+            b"\0".join([scope["path"].encode(), scope.get("query_string", b""), body]), digest_size=16
+        ).hexdigest()
+        client_key = Headers(scope=scope).get("idempotency-key")
+        if client_key:
+            key, ttl = f"key:{scope['path']}:{client_key}", self.store.ttl
+        else:
+            key, ttl = f"hash:{fingerprint}", self.store.content_ttl
+
+        entry, owner = self.store.begin(key, fingerprint, ttl)
+        if not owner:
+            if entry.fingerprint != fingerprint:
+                await self._send(send, (422, [(b"content-type", b"application/json")],
+                                        b'{"detail":"Idempotency-Key was already used for a different request"}'))
+                return
+            logger.info(f"Replaying response for duplicate request to {scope['path']}")
+            response = await asyncio.shield(entry.response)
+            status, headers, response_body = response
+            await self._send(send, (status, headers + [(b"idempotent-replayed", b"true")], response_body))
+            return
+
+        shared = self.store.shared is not None
+        if shared:
+            try:
+                outcome = await self.store.claim_shared(key, fingerprint)
+            except BaseException:
+                self.store.finish(key, entry, (500, [(b"content-type", b"application/json")],
+                                               b'{"detail":"Internal Server Error"}'), keep=False)
+                raise
+            if outcome == _MISMATCH:
+                response = (422, [(b"content-type", b"application/json")],
+                            b'{"detail":"Idempotency-Key was already used for a different request"}')
+                self.store.finish(key, entry, response, keep=False)
+                await self._send(send, response)
+                return
+            if outcome is not None:
+                logger.info(f"Replaying another worker's response for duplicate request to {scope['path']}")
+                status, headers, response_body = outcome
+                self.store.finish(key, entry, outcome, keep=True)
+                await self._send(send, (status, headers + [(b"idempotent-replayed", b"true")], response_body))
+                return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+
+        async def capture_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            self.store.finish(key, entry, (500, [(b"content-type", b"application/json")],
+                                           b'{"detail":"Internal Server Error"}'), keep=False)
+            if shared:
+                # Inline rather than in a thread: this may be a cancellation
+                self.store.finish_shared(key, fingerprint, None, keep=False, ttl=ttl)
+            raise
+        response, keep = (status, headers, b"".join(chunks)), 200 <= status < 300
+        self.store.finish(key, entry, response, keep=keep)
+        if shared:
+            await asyncio.to_thread(self.store.finish_shared, key, fingerprint, response, keep, ttl)
+
+    @staticmethod
+    async def _send(send, response: StoredResponse):
+        status, headers, body = response
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,167 @@
+import atexit
+import logging
+import os
+import queue
+import reprlib
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Bounded repr used for payloads in log messages
+_payload_repr = reprlib.Repr()
+_payload_repr.maxlevel = 4
+_payload_repr.maxdict = 20
+_payload_repr.maxlist = 20
+_payload_repr.maxtuple = 20
+_payload_repr.maxset = 20
+_payload_repr.maxstring = 200
+_payload_repr.maxother = 200
+
+_listener: Optional[QueueListener] = None
+
+
+class Payload:
+    """
+    Wraps a request or label payload for logging. It is only turned into text
+    if the record is actually emitted, and then as a bounded repr, so logging
+    a large payload costs the same as logging a small one::
+
+        logger.debug("Printing request for label: %s", Payload(label_data))
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return _payload_repr.repr(self.value)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limits records logged with ``extra={"sample": key}``: at most one
+    record per key every ``interval`` seconds gets through, and it reports
+    how many were suppressed since the last one. Records without a key pass.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        # key -> (last emitted at, suppressed since)
+        self._seen: Dict[str, Tuple[float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._seen.get(key, (0.0, 0))
+            if last and now - last < self.interval:
+                self._seen[key] = (last, suppressed + 1)
+                return False
+            self._seen[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Hands records to the background writer thread instead of writing them on
+    the caller's thread. The message is rendered here, capped at
+    ``max_message`` characters; if the queue is full the record is dropped
+    and counted rather than blocking the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_message: int):
+        super().__init__(log_queue)
+        self.max_message = max_message
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if self.max_message and len(record.msg) > self.max_message:
+            record.msg = (f"{record.msg[:self.max_message]}... "
+                          f"[{len(record.msg) - self.max_message} chars truncated]")
+            record.message = record.msg
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Dropped {dropped} log records while the log queue was full",
+                }))
+            except queue.Full:
+                self.dropped += dropped
+
+
+def setup_logging():
+    """
+    Route all logging through a queue to a background writer thread that
+    writes to stderr and, unless LOG_FILE is empty, to a rotating log file.
+
+    Configured through the environment:
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE,
+    LOG_MAX_MESSAGE (characters kept per message) and LOG_SAMPLE_INTERVAL
+    (seconds between sampled messages with the same key).
+
+    Safe to call more than once; only the first call has an effect.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    log_file = os.environ.get('LOG_FILE', 'kitchen-manager.log')
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backupCount=int(os.environ.get('LOG_BACKUP_COUNT', '5')),
+            encoding='utf-8',
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+    queue_handler = AsyncQueueHandler(log_queue, int(os.environ.get('LOG_MAX_MESSAGE', '4000')))
+    queue_handler.addFilter(SamplingFilter(float(os.environ.get('LOG_SAMPLE_INTERVAL', '10'))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    # uvicorn writes its access log synchronously; send it through the queue too
+    for name in ("uvicorn", "uvicorn.access"):
+        server_logger = logging.getLogger(name)
+        for handler in list(server_logger.handlers):
+            server_logger.removeHandler(handler)
+        server_logger.propagate = True
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
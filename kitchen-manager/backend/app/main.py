@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
 from dotenv import load_dotenv
 import os
@@ -7,11 +8,9 @@ import os
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# Configure logging; records are written by a background thread
+from app.core.logging_config import setup_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -20,6 +19,10 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Replay the first response to retried or double-tapped print requests
+from app.core.idempotency import IdempotencyMiddleware
+app.add_middleware(IdempotencyMiddleware)
+
 # Configure CORS to allow connections from other applications
 app.add_middleware(
     CORSMiddleware,
@@ -43,7 +46,8 @@ async def health():
     return {"status": "healthy"}
 
 # Import and include routers
-from app.api import labels, gastronorm, printer, prep_tracking, recipe_processor, prep_tracker, label_processor, android
+from app.api import labels, gastronorm, printer, prep_tracking, recipe_processor, prep_tracker, label_processor, android, events, prep_history
+from app.services.container import services, WARM_UP_SERVICES
 app.include_router(labels.router, prefix="/api/labels", tags=["labels"])
 app.include_router(gastronorm.router, prefix="/api/gastronorm", tags=["gastronorm"])
 app.include_router(printer.router, prefix="/api/printer", tags=["printer"])
@@ -52,15 +56,27 @@ app.include_router(recipe_processor.router, prefix="/api/recipe", tags=["recipe"
 app.include_router(prep_tracker.router, prefix="/api/prep-tracker", tags=["prep-tracker"])
 app.include_router(label_processor.router, prefix="/api/label-processor", tags=["label-processor"])
 app.include_router(android.router, prefix="/api/android", tags=["android"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
+app.include_router(prep_history.router, prefix="/api/prep-history", tags=["prep-history"])
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Kitchen Manager Label API")
+    # Bring back prep data and the tray selection before serving requests
+    await services.get("state_snapshots").start()
     logger.info("Connected to external services: Prep Tracker, Recipe Upscaler, Kitchen Manager")
-    logger.info("Label processor service initialized")
+    # Heavy services (Vision client, MongoDB) are built lazily on first use.
+    # Warm them in the background so the server accepts requests immediately.
+    if os.getenv("WARM_UP_SERVICES", "true").lower() == "true":
+        app.state.warm_up_task = asyncio.create_task(services.warm_up(WARM_UP_SERVICES))
+    # Resume delivery of print jobs left in the spool by the previous run
+    if os.getenv("ENABLE_LABEL_PRINTING", "false").lower() == "true":
+        await services.get("label_printer").start()
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
-    logger.info("Shutting down Kitchen Manager Label API") 
\ No newline at end of file
+    logger.info("Shutting down Kitchen Manager Label API")
+    await services.close()
+ 
\ No newline at end of file
@@ -0,0 +1,241 @@
+import asyncio
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """
+    Lazily builds shared services on first use.
+
+    Each service is registered with a zero-argument factory that imports its
+    module and constructs it, so importing the API routers never pulls in
+    cv2, Google Cloud or pymongo, and never opens network connections.
+    Routers resolve services through the ``get_*`` FastAPI dependencies at the
+    bottom of this module. A factory runs at most once; if it fails, the error
+    is remembered and raised again on later lookups instead of retrying an
+    expensive initialisation on every request.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._order = []
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Register a factory for a service."""
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str) -> Any:
+        """Return the service, building it if this is the first lookup."""
+        if name in self._instances:
+            return self._instances[name]
+        with self._locks[name]:
+            if name in self._instances:
+                return self._instances[name]
+            if name in self._errors:
+                raise self._errors[name]
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                logger.error(f"Failed to initialise service {name}: {str(e)}")
+                self._errors[name] = e
+                raise
+            self._instances[name] = instance
+            self._order.append(name)
+            logger.info(f"Initialised service {name}")
+            return instance
+
+    async def warm_up(self, names: Iterable[str]):
+        """Build services in worker threads without holding up the event loop."""
+        for name in names:
+            try:
+                await asyncio.to_thread(self.get, name)
+            except Exception:
+                # Already logged; the failure is raised again on first real use
+                pass
+
+    async def close(self):
+        """Close every built service, most recently built first."""
+        closed = set()
+        for name in reversed(self._order):
+            instance = self._instances[name]
+            close = getattr(instance, "close", None)
+            # Some services are aliases of others, close each object once
+            if close is None or id(instance) in closed:
+                continue
+            closed.add(id(instance))
+            try:
+                if inspect.iscoroutinefunction(close):
+                    await close()
+                else:
+                    await asyncio.to_thread(close)
+            except Exception as e:
+                logger.error(f"Error closing service {name}: {str(e)}")
+        self._instances.clear()
+        self._order.clear()
+
+
+def _image_processor():
+    from .image_processor import ImageProcessor
+    return ImageProcessor()
+
+def _db_client():
+    from .db_client import DatabaseClient
+    return DatabaseClient()
+
+def _label_storage():
+    from .label_storage import LabelStorage
+    return LabelStorage(storage_dir=os.environ.get('LABEL_STORAGE_DIR', 'data/labels'))
+
+def _label_store():
+    # Labels go to MongoDB when it is configured and to the local
+    # log-structured store otherwise; LABEL_STORE=mongo|file overrides that
+    backend = os.environ.get('LABEL_STORE', 'mongo' if os.environ.get('MONGO_URI') else 'file').lower()
+    store = services.get("label_storage" if backend == 'file' else "db_client")
+
+    # Saves go through a write-behind buffer when enabled, trading a small
+    # durability window for lower save latency during scan sessions
+    if os.environ.get('LABEL_WRITE_BEHIND', 'false').lower() != 'true':
+        return store
+
+    from .write_behind import WriteBehindLabelStore
+    return WriteBehindLabelStore(
+        store,
+        max_pending=int(os.environ.get('LABEL_WRITE_BEHIND_MAX_PENDING', '1000')),
+        batch_size=int(os.environ.get('LABEL_WRITE_BEHIND_BATCH_SIZE', '50')),
+        flush_interval=float(os.environ.get('LABEL_WRITE_BEHIND_FLUSH_INTERVAL', '1.0')),
+    )
+
+def _state_store():
+    from .state_store import create_state_store
+    return create_state_store()
+
+def _tray_selection():
+    from .state_store import TraySelection
+    return TraySelection(services.get("state_store"))
+
+def _tray_repository():
+    from .tray_repository import TrayRepository
+    return TrayRepository(selection=services.get("tray_selection"))
+
+def _label_generator():
+    from .label_generator import LabelGenerator
+    return LabelGenerator(tray_repository=services.get("tray_repository"))
+
+def _event_bus():
+    from .event_bus import EventBus
+    # With a shared state store, events are relayed between the workers
+    # through its directory so every client hears every worker's events
+    store = services.get("state_store")
+    return EventBus(relay_dir=os.path.join(store.directory, "events") if store.shared else None)
+
+def _label_printer():
+    from .label_printer import LabelPrinterService
+    return LabelPrinterService(event_bus=services.get("event_bus"))
+
+def _pending_label_queue():
+    from .pending_queue import PendingLabelQueue
+    return PendingLabelQueue(event_bus=services.get("event_bus"))
+
+def _prep_state():
+    from .prep_state import PrepState
+    return PrepState(store=services.get("state_store"))
+
+def _prep_history():
+    from .prep_history import PrepHistory
+    return PrepHistory()
+
+def _state_snapshots():
+    from .state_snapshots import StateSnapshots
+    return StateSnapshots(services.get("prep_state"), services.get("tray_selection"))
+
+def _recipe_cache():
+    from ..core.config import settings
+    from .recipe_cache import RecipeCache
+    return RecipeCache(settings.RECIPE_UPSCALER_URL)
+
+def _prep_tracker_service():
+    from .prep_tracker_service import PrepTrackerService
+    return PrepTrackerService(label_printer=services.get("label_printer"))
+
+
+services = ServiceContainer()
+services.register("image_processor", _image_processor)
+services.register("db_client", _db_client)
+services.register("label_storage", _label_storage)
+services.register("label_store", _label_store)
+services.register("state_store", _state_store)
+services.register("tray_selection", _tray_selection)
+services.register("tray_repository", _tray_repository)
+services.register("label_generator", _label_generator)
+services.register("event_bus", _event_bus)
+services.register("label_printer", _label_printer)
+services.register("pending_label_queue", _pending_label_queue)
+services.register("prep_tracker_service", _prep_tracker_service)
+services.register("prep_state", _prep_state)
+services.register("state_snapshots", _state_snapshots)
+services.register("prep_history", _prep_history)
+services.register("recipe_cache", _recipe_cache)
+
+# Services that are slow to build and worth warming once the server is up
+WARM_UP_SERVICES = ["db_client", "label_store", "image_processor"]
+
+
+# FastAPI dependencies. They are plain functions so FastAPI runs them in its
+# threadpool, keeping a first-use build off the event loop.
+
+def get_image_processor():
+    return services.get("image_processor")
+
+def get_optional_image_processor() -> Optional[Any]:
+    """Image processor, or None if its dependencies are unavailable."""
+    try:
+        return services.get("image_processor")
+    except Exception:
+        return None
+
+def get_db_client():
+    return services.get("db_client")
+
+def get_label_store():
+    return services.get("label_store")
+
+def get_tray_selection():
+    return services.get("tray_selection")
+
+def get_tray_repository():
+    return services.get("tray_repository")
+
+def get_label_generator():
+    return services.get("label_generator")
+
+def get_event_bus():
+    return services.get("event_bus")
+
+def get_label_printer():
+    return services.get("label_printer")
+
+def get_pending_label_queue():
+    return services.get("pending_label_queue")
+
+def get_prep_tracker_service():
+    return services.get("prep_tracker_service")
+
+def get_prep_state():
+    return services.get("prep_state")
+
+def get_prep_history():
+    return services.get("prep_history")
+
+def get_recipe_cache():
+    return services.get("recipe_cache")
@@ -1,6 +1,6 @@
 import os
 import logging
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 import certifi
 from typing import Dict, Any, List, Optional
 import httpx
@@ -72,6 +72,13 @@ class DatabaseClient:
             logger.error(f"Error fetching employees from API: {str(e)}")
             return []
     
+    def _stamp_label(self, label_data: Dict[str, Any]):
+        """Add an upload timestamp to the label's parsed data if not present."""
+        if "timestamp" not in label_data.get("parsed_data", {}):
+            if "parsed_data" not in label_data:
+                label_data["parsed_data"] = {}
+            label_data["parsed_data"]["uploadTimestamp"] = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
     def save_label(self, label_data: Dict[str, Any]) -> Dict[str, Any]:
         """Save label to MongoDB."""
         if self.labels_collection is None:
@@ -80,10 +87,7 @@ class DatabaseClient:
             
         try:
             # Add timestamp if not present
-            if "timestamp" not in label_data.get("parsed_data", {}):
-                if "parsed_data" not in label_data:
-                    label_data["parsed_data"] = {}
-                label_data["parsed_data"]["uploadTimestamp"] = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+            self._stamp_label(label_data)
             
             # Check if label exists
             existing = self.labels_collection.find_one({"label_id": label_data["label_id"]})
@@ -110,6 +114,27 @@ class DatabaseClient:
             logger.error(f"Error saving label to MongoDB: {str(e)}")
             return label_data
     
+    def save_labels(self, labels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Upsert several labels into MongoDB with a single bulk write."""
+        if self.labels_collection is None:
+            logger.error("MongoDB client not initialized")
+            return labels
+
+        for label_data in labels:
+            self._stamp_label(label_data)
+
+        operations = [
+            UpdateOne({"label_id": label_data["label_id"]}, {"$set": label_data}, upsert=True)
+            for label_data in labels
+        ]
+        # Unlike save_label, errors propagate so that a write-behind buffer can retry the batch
+        result = self.labels_collection.bulk_write(operations, ordered=False)
+        logger.info(
+            f"Bulk saved {len(labels)} labels "
+            f"({result.upserted_count} inserted, {result.modified_count} updated)"
+        )
+        return labels
+
     def get_labels(self) -> List[Dict[str, Any]]:
         """Get all labels from MongoDB."""
         if self.labels_collection is None:
@@ -0,0 +1,318 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Topics clients can subscribe to
+TOPICS = ("jobs", "printer", "prep")
+
+class _EventLog:
+    """
+    Events of every worker process on the machine, as JSON lines in
+    ``events-N.log`` files under one directory, each holding
+    ``SEGMENT_EVENTS`` consecutive IDs.
+
+    Writers take an exclusive flock, catch up with the log, give the event
+    the next ID and append it, so IDs are the same in every worker. Readers
+    only take complete lines and need no lock. A segment is complete once
+    the next one exists; the writer that starts a segment removes the one
+    two before it, so the log holds the last one to two segments of events.
+    """
+
+    SEGMENT_EVENTS = 10000
+
+    def __init__(self, directory: str):
+        if fcntl is None:
+            raise RuntimeError("Relaying events between workers needs fcntl, which this platform lacks")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, "events.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.last_id = 0
+        segments = self._segments()
+        self._segment = segments[0] if segments else 0
+        self._offset = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"events-{segment}.log")
+
+    def _segments(self) -> List[int]:
+        names = (name[len("events-"):-len(".log")] for name in os.listdir(self.directory)
+                 if name.startswith("events-") and name.endswith(".log"))
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def read_new(self) -> List[Dict[str, Any]]:
+        """Events appended since the last call, oldest first."""
+        if not os.path.exists(self._path(self._segment)):
+            # Too far behind: this segment has been removed, go on from the oldest one left
+            later = [segment for segment in self._segments() if segment > self._segment]
+            if later:
+                self._segment, self._offset = later[0], 0
+
+        events = []
+        while True:
+            # Checked before reading: if the next segment already exists, this read sees all of this one
+            complete = os.path.exists(self._path(self._segment + 1))
+            try:
+                with open(self._path(self._segment), 'rb') as f:
+                    f.seek(self._offset)
+                    chunk = f.read()
+            except FileNotFoundError:
+                chunk = b""
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].splitlines():
+                try:
+                    event = json.loads(line)
+                except ValueError as e:
+                    logger.error(f"Skipping corrupt event record: {str(e)}")
+                    continue
+                events.append(event)
+                self.last_id = event["id"]
+            self._offset += end
+            if not complete:
+                return events
+            self._segment, self._offset = self._segment + 1, 0
+
+    def append(self, topic: str, type: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Append an event with the next ID. Returns the events other workers
+        appended since the last read, followed by the new one.
+        """
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            events = self.read_new()
+            path = self._path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) > self._offset:
+                # Drop a partial record left behind by a writer that crashed mid-append
+                os.truncate(path, self._offset)
+
+            event = {"id": self.last_id + 1, "topic": topic, "type": type, "timestamp": time.time(), "data": data}
+            line = json.dumps(event, separators=(",", ":"), default=str).encode() + b"\n"
+            segment = event["id"] // self.SEGMENT_EVENTS
+            if segment != self._segment:
+                self._segment, self._offset = segment, 0
+                try:
+                    os.unlink(self._path(segment - 2))
+                except FileNotFoundError:
+                    pass
+            fd = os.open(self._path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            self._offset += len(line)
+            self.last_id = event["id"]
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        # Subscribers get the event as it reads back from the log
+        events.append(json.loads(line))
+        return events
+
+    def close(self):
+        os.close(self._lock_fd)
+
+
+class Subscription:
+    """
+    One client's view of the event bus: a bounded queue of events on the
+    topics it subscribed to. A subscriber that falls too far behind is
+    dropped and has to reconnect with its last event ID.
+    """
+
+    def __init__(self, bus: "EventBus", topics: Optional[Iterable[str]], max_queue: int):
+        self._bus = bus
+        self.topics: Optional[Set[str]] = set(topics) if topics else None
+        self._queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(max_queue)
+        self.overflowed = False
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        return self.topics is None or event["topic"] in self.topics
+
+    def subscribe(self, topics: Iterable[str]):
+        if self.topics is not None:
+            self.topics.update(topics)
+
+    def unsubscribe(self, topics: Iterable[str]):
+        if self.topics is None:
+            self.topics = set(TOPICS)
+        self.topics.difference_update(topics)
+
+    def _offer(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Dropping event subscriber that fell behind")
+            self.overflowed = True
+            self.close()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Next event, or None if ``timeout`` passed first. Raises
+        ``EOFError`` once the subscription is closed.
+        """
+        if self._queue.empty() and self._bus is None:
+            raise EOFError
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is None:
+            raise EOFError
+        return event
+
+    def close(self):
+        if self._bus is not None:
+            self._bus._subscribers.discard(self)
+            self._bus = None
+            # Wake the reader so it notices the subscription has ended
+            while True:
+                try:
+                    self._queue.put_nowait(None)
+                    break
+                except asyncio.QueueFull:
+                    self._queue.get_nowait()
+
+
+class EventBus:
+    """
+    Publish/subscribe hub for pushing events to printers, scanners and
+    dashboards.
+
+    Every event gets an increasing integer ID and is kept in a ring buffer,
+    so a client that reconnects with the last ID it saw receives what it
+    missed. If those events have already left the buffer, the client gets a
+    ``stream.reset`` event first and should reload its state.
+
+    Without ``relay_dir`` the bus lives in this process, and with several
+    workers a client only hears what the worker it is connected to
+    publishes. With ``relay_dir`` every worker's events go through a shared
+    log in that directory: IDs are the same in every worker, and while
+    anyone is subscribed the log is polled every ``poll_interval`` seconds
+    for events other workers published.
+
+    All methods must be called from the event loop.
+    """
+
+    def __init__(self, history: int = None, max_queue: int = None, relay_dir: str = None,
+                 poll_interval: float = None):
+        self.history: Deque[Dict[str, Any]] = deque(
+            maxlen=history or int(os.environ.get('EVENT_HISTORY', '1000')))
+        self.max_queue = max_queue or int(os.environ.get('EVENT_SUBSCRIBER_QUEUE', '256'))
+        self.poll_interval = poll_interval or float(os.environ.get('EVENT_RELAY_POLL_INTERVAL', '0.05'))
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._subscribers: Set[Subscription] = set()
+        self._log = _EventLog(relay_dir) if relay_dir else None
+        self._poller: Optional[asyncio.Task] = None
+        if self._log is not None:
+            # Events from before this worker started, for clients resuming here
+            self._catch_up()
+
+    def _deliver(self, event: Dict[str, Any]):
+        self._last_id = event["id"]
+        self.history.append(event)
+        for subscription in list(self._subscribers):
+            if subscription.wants(event):
+                subscription._offer(event)
+
+    def _catch_up(self):
+        try:
+            events = self._log.read_new()
+        except OSError as e:
+            logger.error(f"Error reading relayed events: {str(e)}")
+            return
+        if events and self._last_id and events[0]["id"] > self._last_id + 1:
+            # Fell so far behind that the events in between left the log
+            logger.warning(f"Missed relayed events {self._last_id + 1} to {events[0]['id'] - 1}")
+            reset = self._reset_event(self._last_id)
+            for subscription in list(self._subscribers):
+                subscription._offer(reset)
+        for event in events:
+            self._deliver(event)
+
+    def _reset_event(self, last_event_id: int) -> Dict[str, Any]:
+        return {
+            "id": self._last_id,
+            "topic": "stream",
+            "type": "stream.reset",
+            "timestamp": time.time(),
+            "data": {"last_event_id": last_event_id},
+        }
+
+    async def _poll(self):
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            self._catch_up()
+        self._poller = None
+
+    def publish(self, topic: str, type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        if self._log is not None:
+            try:
+                events = self._log.append(topic, type, data)
+            except OSError as e:
+                logger.error(f"Error relaying {type} event, delivering it to this worker only: {str(e)}")
+            else:
+                for event in events:
+                    self._deliver(event)
+                return events[-1]
+
+        event = {
+            "id": next(self._ids) if self._log is None else self._last_id + 1,
+            "topic": topic,
+            "type": type,
+            "timestamp": time.time(),
+            "data": data,
+        }
+        self._deliver(event)
+        return event
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None,
+                  last_event_id: Optional[int] = None) -> Subscription:
+        """
+        Subscribe to ``topics`` (all topics if None), replaying buffered
+        events newer than ``last_event_id``.
+        """
+        if self._log is not None:
+            self._catch_up()
+        backlog = []
+        if last_event_id is not None:
+            oldest = self.history[0]["id"] if self.history else self._last_id + 1
+            if last_event_id > self._last_id or last_event_id < oldest - 1:
+                # Unknown ID (server restarted) or the missed events have been evicted
+                backlog.append(self._reset_event(last_event_id))
+            else:
+                backlog.extend(event for event in self.history if event["id"] > last_event_id)
+
+        # Leave room for the replayed backlog on top of the live queue
+        subscription = Subscription(self, topics, self.max_queue + len(backlog))
+        for event in backlog:
+            if event["type"] == "stream.reset" or subscription.wants(event):
+                subscription._offer(event)
+        self._subscribers.add(subscription)
+        if self._log is not None and self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def close(self):
+        for subscription in list(self._subscribers):
+            subscription.close()
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
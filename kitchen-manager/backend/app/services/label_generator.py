@@ -1,159 +1,164 @@
+import asyncio
+import logging
+import os
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
-import httpx
-from ..core.config import settings
+from typing import List, Dict, Any, Iterable, Iterator
 from ..api.prep_tracking import get_prep_data_for_tray
+from .tray_repository import TrayRepository
+from .label_templates import render_label
+
+logger = logging.getLogger(__name__)
 
 class LabelGenerator:
-    def __init__(self):
-        self.client = None
+    def __init__(self, tray_repository: TrayRepository = None):
+        self.tray_repository = tray_repository or TrayRepository()
+        # Upper bound on trays processed at once by the batch methods
+        self.batch_concurrency = int(os.environ.get('LABEL_BATCH_CONCURRENCY', '8'))
+
+    def build_label(self, label_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build a single label with a unique ID and timestamp.
+        """
+        # Ensure all required fields are present
+        if not isinstance(label_data, dict):
+            label_data = dict(label_data)
+
+        now = datetime.now()
 
-    async def close(self):
-        if self.client:
-            await self.client.aclose()
+        # Create a new label with required fields
+        label = {
+            "tray_id": label_data.get("tray_id", "unknown"),
+            "dish_name": label_data.get("dish_name", "Unknown"),
+            "prep_date": label_data.get("prep_date", now.strftime("%Y-%m-%d")),
+            "expiry_date": label_data.get("expiry_date", (now + timedelta(days=3)).strftime("%Y-%m-%d")),
+            "ingredients": label_data.get("ingredients", []),
+            "allergens": label_data.get("allergens", []),
+            "notes": label_data.get("notes", ""),
+            "id": str(uuid.uuid4()),
+            "created_at": now.isoformat()
+        }
+
+        # Add any additional fields from the original data
+        for key, value in label_data.items():
+            if key not in label:
+                label[key] = value
+
+        return label
+
+    def iter_labels(self, labels: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily generate labels one at a time, keeping memory bounded for large batches.
+        """
+        for label_data in labels:
+            label = self.build_label(label_data)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Generated label {label['id']} for tray {label['tray_id']}")
+            yield label
 
     def generate_labels(self, labels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Generate labels with unique IDs and timestamps.
         """
         try:
-            print(f"Generating labels for {len(labels)} items")
-            generated_labels = []
-            for i, label_data in enumerate(labels):
-                print(f"Processing label {i+1}: {label_data}")
-                
-                # Ensure all required fields are present
-                if not isinstance(label_data, dict):
-                    print(f"Warning: label_data is not a dict: {type(label_data)}")
-                    label_data = dict(label_data)
-                
-                # Create a new label with required fields
-                label = {
-                    "tray_id": label_data.get("tray_id", "unknown"),
-                    "dish_name": label_data.get("dish_name", "Unknown"),
-                    "prep_date": label_data.get("prep_date", datetime.now().strftime("%Y-%m-%d")),
-                    "expiry_date": label_data.get("expiry_date", (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")),
-                    "ingredients": label_data.get("ingredients", []),
-                    "allergens": label_data.get("allergens", []),
-                    "notes": label_data.get("notes", ""),
-                    "id": str(uuid.uuid4()),
-                    "created_at": datetime.now().isoformat()
-                }
-                
-                # Add any additional fields from the original data
-                for key, value in label_data.items():
-                    if key not in label:
-                        label[key] = value
-                
-                generated_labels.append(label)
-            return generated_labels
-        except Exception as e:
-            import traceback
-            print(f"Error in generate_labels: {str(e)}")
-            print(traceback.format_exc())
+            logger.debug(f"Generating labels for {len(labels)} items")
+            return list(self.iter_labels(labels))
+        except Exception:
+            logger.exception("Error in generate_labels")
             raise
 
     async def generate_enhanced_label(self, tray_id: str) -> Dict[str, Any]:
         """
         Generate an enhanced label with data from other applications.
         """
-        # Get tray data from the local gastronorm API
-        if not self.client:
-            self.client = httpx.AsyncClient()
+        # Get tray data straight from the shared tray repository.
+        # Raises TrayNotFoundError if the tray is unknown or not selected.
+        tray_data = self.tray_repository.get_selected(tray_id)
 
-        try:
-            # Get tray data from local API
-            response = await self.client.get(f"http://localhost:8080/api/gastronorm/{tray_id}")
-            response.raise_for_status()
-            tray_data = response.json()
-            
-            # Get tray contents
-            prep_data = await get_prep_data_for_tray(tray_id)
-            
-            # Format ingredients list
-            ingredients_list = []
-            for ingredient_name, ingredient_data in prep_data.get("ingredients", {}).items():
-                weight = ingredient_data.get("total_weight", 0)
-                unit = ingredient_data.get("unit", "g")
-                ingredients_list.append(f"{ingredient_name}: {weight} {unit}")
-            
-            # Format dishes list
-            dishes_list = []
-            for dish in prep_data.get("dishes", []):
-                dish_name = dish.get("name", "Unknown")
-                quantity = dish.get("quantity", 1)
-                dishes_list.append(f"{dish_name} (x{quantity})")
-            
-            # Create an enhanced label with tray data
-            label = {
-                "tray_id": tray_id,
-                "dish_name": ", ".join(dishes_list) if dishes_list else "Unknown",
-                "prep_date": datetime.now().strftime("%Y-%m-%d"),
-                "expiry_date": (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d"),
-                "ingredients": ingredients_list,
-                "allergens": [],  # This would need to be populated from allergen data
-                "notes": f"Total prep bags: {prep_data.get('total_bags', 0)}",
-                "tray_details": {
-                    "name": tray_data.get("name", "Unknown"),
-                    "size": tray_data.get("size", "Unknown"),
-                    "material": tray_data.get("material", "Unknown"),
-                    "volume": f"{tray_data.get('volumeLiters', 0)} L"
-                }
+        # Get tray contents
+        prep_data = await get_prep_data_for_tray(tray_id)
+
+        # Format ingredients list
+        ingredients_list = []
+        for ingredient_name, ingredient_data in prep_data.get("ingredients", {}).items():
+            weight = ingredient_data.get("total_weight", 0)
+            unit = ingredient_data.get("unit", "g")
+            ingredients_list.append(f"{ingredient_name}: {weight} {unit}")
+
+        # Format dishes list
+        dishes_list = []
+        for dish in prep_data.get("dishes", []):
+            dish_name = dish.get("name", "Unknown")
+            quantity = dish.get("quantity", 1)
+            dishes_list.append(f"{dish_name} (x{quantity})")
+
+        # Create an enhanced label with tray data
+        label = {
+            "tray_id": tray_id,
+            "dish_name": ", ".join(dishes_list) if dishes_list else "Unknown",
+            "prep_date": datetime.now().strftime("%Y-%m-%d"),
+            "expiry_date": (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d"),
+            "ingredients": ingredients_list,
+            "allergens": [],  # This would need to be populated from allergen data
+            "notes": f"Total prep bags: {prep_data.get('total_bags', 0)}",
+            "tray_details": {
+                "name": tray_data.get("name", "Unknown"),
+                "size": tray_data.get("size", "Unknown"),
+                "material": tray_data.get("material", "Unknown"),
+                "volume": f"{tray_data.get('volumeLiters', 0)} L"
             }
+        }
 
-            return label
-        except httpx.HTTPError as e:
-            raise Exception(f"Error fetching tray data: {str(e)}")
+        return label
 
-    async def generate_enhanced_batch_labels(self, tray_ids: List[str]) -> List[Dict[str, Any]]:
+    async def generate_enhanced_batch_labels(self, tray_ids: List[str]) -> Dict[str, Any]:
         """
-        Generate enhanced labels for multiple trays.
+        Generate enhanced labels for multiple trays concurrently.
+
+        Returns:
+            dict: ``results`` holds one entry per requested tray, in the same
+            order as ``tray_ids``, with either a ``label`` or an ``error``;
+            ``elapsed_ms`` is the wall time for the whole batch.
         """
-        labels = []
-        for tray_id in tray_ids:
-            try:
-                label = await self.generate_enhanced_label(tray_id)
-                labels.append(label)
-            except Exception as e:
-                # Log the error but continue with other trays
-                print(f"Error generating label for tray {tray_id}: {str(e)}")
-        return labels
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def generate(tray_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    label = await self.generate_enhanced_label(tray_id)
+                    return {"tray_id": tray_id, "label": label, "error": None}
+                except Exception as e:
+                    # Report the failure in place so results stay aligned with tray_ids
+                    logger.error(f"Error generating label for tray {tray_id}: {str(e)}")
+                    return {"tray_id": tray_id, "label": None, "error": str(e)}
+
+        results = await asyncio.gather(*(generate(tray_id) for tray_id in tray_ids))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        failed = sum(1 for result in results if result["error"])
+        logger.info(f"Generated {len(results) - failed}/{len(results)} enhanced labels in {elapsed_ms:.1f} ms")
+        return {"results": list(results), "elapsed_ms": round(elapsed_ms, 2)}
 
     def format_for_printer(self, label: Dict[str, Any]) -> Dict[str, Any]:
         """
         Format a label for printing.
         """
-        content = [
-            f"Tray: {label.get('tray_details', {}).get('name', 'Unknown')}",
-            f"Size: {label.get('tray_details', {}).get('size', 'Unknown')}",
-            f"Material: {label.get('tray_details', {}).get('material', 'Unknown')}",
-            f"Volume: {label.get('tray_details', {}).get('volume', 'Unknown')}",
-            "",
-            f"Dishes: {label['dish_name']}",
-            f"Prep Date: {label['prep_date']}",
-            f"Expiry Date: {label['expiry_date']}",
-            "",
-            "Ingredients:"
-        ]
-        
-        # Add ingredients
-        for ingredient in label["ingredients"]:
-            content.append(f"- {ingredient}")
-        
-        # Add allergens if any
-        if label.get("allergens"):
-            content.append("")
-            content.append("Allergens:")
-            for allergen in label["allergens"]:
-                content.append(f"- {allergen}")
-        
-        # Add notes
-        if label.get("notes"):
-            content.append("")
-            content.append(f"Notes: {label['notes']}")
-        
+        tray_details = label.get("tray_details", {})
+        rendered = render_label("tray", {
+            "tray_name": tray_details.get("name", "Unknown"),
+            "tray_size": tray_details.get("size", "Unknown"),
+            "tray_material": tray_details.get("material", "Unknown"),
+            "tray_volume": tray_details.get("volume", "Unknown"),
+            "dish_name": label["dish_name"],
+            "prep_date": label["prep_date"],
+            "expiry_date": label["expiry_date"],
+            "ingredients": label["ingredients"],
+            "allergens": label.get("allergens"),
+            "notes": label.get("notes"),
+        })
+
         return {
             "tray_id": label["tray_id"],
-            "content": content
-        } 
\ No newline at end of file
+            "content": list(rendered.lines)
+        }
@@ -1,52 +1,105 @@
 import json
 import logging
 import os
-import requests
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from ..core.logging_config import Payload
+from .label_templates import render_label
+from .label_raster import render_raster
+from .print_dispatcher import PrintDispatcher
+from .print_spool import PrintSpool, SpoolFullError
+from .printer_registry import PrinterRegistry, Printer
 
 logger = logging.getLogger(__name__)
 
 class LabelPrinterService:
-    def __init__(self):
-        self.label_detector_url = os.environ.get('LABEL_DETECTOR_URL', 'http://localhost:8080')
+    def __init__(self, event_bus=None):
         self.enabled = os.environ.get('ENABLE_LABEL_PRINTING', 'false').lower() == 'true'
-        
-        # Default printer settings
-        self.settings = {
-            'linesPerFeed': 3,
-            'fontSize': 1.0,
-            'fontStyle': 'normal',
-            'alignment': 'left',
-            'useQRCode': False,
-            'printLogo': False,
-            'darkMode': False
-        }
+        self.registry = PrinterRegistry(event_bus=event_bus)
+        self.label_detector_url = self.registry.default.url
+        # Every print goes through the durable spool, which delivers it in the background
+        self.spool = PrintSpool(
+            self.registry.dispatcher_for, event_bus=event_bus, failover=self.registry.failover_for
+        )
         
         if self.enabled:
-            logger.info(f"Label printing enabled. Label detector URL: {self.label_detector_url}")
+            logger.info(f"Label printing enabled. Printers: "
+                        f"{', '.join(f'{p.id} ({p.url})' for p in self.registry.all())}")
         else:
             logger.info("Label printing is disabled")
+
+    @property
+    def dispatcher(self) -> PrintDispatcher:
+        """Dispatcher of the default printer."""
+        return self.registry.default.dispatcher
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """Settings of the default printer."""
+        return self.registry.default.settings
     
     async def close(self):
         """
         Clean up resources when the service is shutting down.
-        Currently, there's nothing to clean up, but this method is required by the API.
         """
         logger.info("Closing label printer service")
+        await self.spool.close()
+        await self.registry.close()
         return True
 
-    def update_settings(self, settings: Dict[str, Any]) -> None:
+    async def start(self):
+        """
+        Resume delivery of print jobs recovered from the spool and start
+        checking printer health in the background.
+        """
+        if self.enabled:
+            for printer in self.registry.all():
+                printer.dispatcher.start_probing()
+            self.spool.start()
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Cached printer health. Never contacts the printers, so it answers
+        instantly even when a phone is off. Overall status is ready if any
+        printer is.
+        """
+        if not self.enabled:
+            return {"status": "disabled", "printers": []}
+        printers = [self.printer_status(printer) for printer in self.registry.all()]
+        statuses = {printer["status"] for printer in printers}
+        for status in ("ready", "unknown", "unreachable"):
+            if status in statuses:
+                break
+        return {"status": status, "printers": printers}
+
+    def printer_status(self, printer: Printer) -> Dict[str, Any]:
+        return {
+            **printer.to_dict(),
+            **printer.health.snapshot(),
+            "queue_depth": self.spool.depth(printer.id),
+        }
+
+    def update_settings(self, settings: Dict[str, Any], printer_id: Optional[str] = None) -> None:
         """
         Update the printer settings.
         
         Args:
             settings: Dictionary containing the new settings
+            printer_id: Printer to update; the default printer if omitted
         """
-        self.settings.update(settings)
-        logger.info(f"Updated printer settings: {self.settings}")
+        printer = self.registry.get(printer_id) if printer_id else self.registry.default
+        printer.settings.update(settings)
+        logger.info(f"Updated settings of printer {printer.id}: {printer.settings}")
 
-    def print_label(self, dish_name, prep_date, expiry_date, ingredients=None, allergens=None, notes=None, tray_id=None):
+    def route(self, station: Optional[str] = None, tray_id: Optional[str] = None,
+              printer_id: Optional[str] = None) -> Printer:
+        """The printer a job goes to: the one asked for, or the least loaded that serves it."""
+        if printer_id:
+            return self.registry.get(printer_id)
+        return self.registry.route(station, tray_id, depth=self.spool.depth)
+
+    async def print_label(self, dish_name, prep_date, expiry_date, ingredients=None, allergens=None, notes=None,
+                          tray_id=None, station=None, printer_id=None):
         """
         Print a label with the given content.
         
@@ -58,100 +111,116 @@ class LabelPrinterService:
             allergens: List of allergens
             notes: Additional notes
             tray_id: ID of the tray
+            station: Station the label is for, used to pick the printer
+            printer_id: Print on this printer instead of routing
             
         Returns:
-            bool: True if printing was successful, False otherwise
+            str: ID of the spooled print job, or None if printing is disabled
+            or the label could not be prepared
+
+        Raises:
+            SpoolFullError: if the printer's queue is full
+            PrinterNotFoundError: if printer_id is not a known printer
         """
         if not self.enabled:
             logger.info("Label printing is disabled")
-            return False
+            return None
             
+        printer = self.route(station, tray_id, printer_id)
         try:
             # Format dates as strings
             prep_date_str = prep_date.strftime('%Y-%m-%d')
             expiry_date_str = expiry_date.strftime('%Y-%m-%d')
             
+            # Render with the shared prep-bag layout; repeated labels come from the cache.
+            # The key is built from the caller's values only, so a label without a
+            # tray still hits it; the generated tray ID is added afterwards.
+            rendered = render_label("prep_bag", {
+                "dish_name": dish_name,
+                "prep_date": prep_date_str,
+                "expiry_date": expiry_date_str,
+                "ingredients": ingredients or [],
+                "allergens": allergens or [],
+                "notes": notes or "",
+                "tray_id": tray_id or "",
+            })
+            label_tray_id = tray_id or f"TRAY-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
             # Prepare the label data
             label_data = {
                 "dishName": dish_name,
                 "prepDate": prep_date_str,
                 "expiryDate": expiry_date_str,
-                "ingredients": ", ".join(ingredients) if ingredients else "",
-                "allergens": ", ".join(allergens) if allergens else "",
-                "notes": notes or "",
-                "trayId": tray_id or f"TRAY-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "ingredients": rendered.fields["ingredients"],
+                "allergens": rendered.fields["allergens"],
+                "notes": rendered.fields["notes"],
+                "trayId": label_tray_id,
+                "content": list(rendered.lines),
                 # Include printer settings
-                "settings": self.settings
+                "settings": dict(printer.settings)
             }
+            if printer.settings.get('rasterize'):
+                label_data["raster"] = render_raster(
+                    rendered.lines, printer.settings, qr_data=label_tray_id
+                ).to_payload()
             
-            # Log the print request
-            logger.info(f"Printing request for label: {label_data}")
+            # Log the print request; the raster alone can be tens of kilobytes
+            logger.debug("Printing request for label: %s", Payload(label_data))
             
-            # Send the request to the Android app
-            try:
-                response = requests.post(
-                    f"{self.label_detector_url}/print-label",
-                    json=label_data,
-                    headers={"Content-Type": "application/json"},
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    logger.info("Print request sent successfully")
-                    return True
-                else:
-                    logger.error(f"Error sending print request: {response.status_code}")
-                    return False
-            except Exception as e:
-                logger.error(f"Error sending print request: {str(e)}")
-                # Fall back to assuming success since the Android app might still handle it
-                return True
-                
+            # Queue the request; the spool delivers it to the Android app with retries
+            job = await self.spool.submit(printer.id, "/print-label", label_data)
+            logger.info(f"Queued label print job {job['id']} on printer {printer.id}",
+                        extra={"sample": "label_printer.queued"})
+            return job["id"]
+
+        except SpoolFullError:
+            raise
         except Exception as e:
             logger.error(f"Error preparing label data: {str(e)}")
-            return False
+            return None
 
-    def print_text(self, text_content: str) -> bool:
+    async def print_text(self, text_content: str, station: Optional[str] = None,
+                         printer_id: Optional[str] = None) -> Optional[str]:
         """
         Prints a plain text content as a label.
         
         Args:
             text_content: The text content to print
+            station: Station the label is for, used to pick the printer
+            printer_id: Print on this printer instead of routing
             
         Returns:
-            bool: True if the printing was successful, False otherwise
+            str: ID of the spooled print job, or None if printing is disabled
+            or the text could not be prepared
+
+        Raises:
+            SpoolFullError: if the printer's queue is full
+            PrinterNotFoundError: if printer_id is not a known printer
         """
         if not self.enabled:
             logger.info("Label printing is disabled")
-            return False
+            return None
             
+        printer = self.route(station, None, printer_id)
         try:
-            logger.info(f"Printing text content: {text_content}")
+            logger.debug("Printing text content: %s", Payload(text_content))
             
             # Prepare the print request with settings
             print_data = {
                 "text": text_content,
-                "settings": self.settings
+                "settings": dict(printer.settings)
             }
+            if printer.settings.get('rasterize'):
+                print_data["raster"] = render_raster(text_content.splitlines(), printer.settings).to_payload()
             
-            # Send request to Android app
-            try:
-                response = requests.post(
-                    f"{self.label_detector_url}/print-text",
-                    json=print_data,
-                    headers={"Content-Type": "application/json"},
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    logger.info("Print request sent successfully")
-                    return True
-                else:
-                    logger.error(f"Error sending print request: {response.status_code}")
-                    return False
-            except Exception as e:
-                logger.error(f"Error sending print request: {str(e)}")
-                # Fall back to assuming success since the Android app might still handle it
-                return True
-                
+            # Queue the request; the spool delivers it to the Android app with retries
+            job = await self.spool.submit(printer.id, "/print-text", print_data)
+            logger.info(f"Queued text print job {job['id']} on printer {printer.id}",
+                        extra={"sample": "label_printer.queued"})
+            return job["id"]
+
+        except SpoolFullError:
+            raise
         except Exception as e:
             logger.error(f"Error preparing text for printing: {str(e)}")
-            return False 
\ No newline at end of file
+            return None 
\ No newline at end of file
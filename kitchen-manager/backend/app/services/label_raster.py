@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import json
+import logging
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# QR codes are optional; labels are rendered without one if qrcode is missing
+try:
+    import qrcode
+    QR_AVAILABLE = True
+except ImportError:
+    QR_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Default dot width of a 58mm thermal printer head
+DEFAULT_DOT_WIDTH = 384
+
+# Printable ASCII; anything else is drawn as '?'
+_FIRST_CHAR = 32
+_LAST_CHAR = 126
+_UNKNOWN = ord("?") - _FIRST_CHAR
+
+
+class RasterLabel(NamedTuple):
+    width: int
+    height: int
+    # Rows of packed 1-bit pixels, most significant bit first, 1 = black dot
+    data: bytes
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "format": "1bpp-msb",
+            "data": base64.b64encode(self.data).decode("ascii"),
+        }
+
+
+class _GlyphAtlas(NamedTuple):
+    glyphs: np.ndarray  # (chars, cell_height, cell_width) bool
+    cell_height: int
+    cell_width: int
+
+
+class LabelRasterizer:
+    """
+    Renders label text straight to the printer's dot width as a packed 1-bit
+    bitmap, so handsets can print it without doing any layout themselves.
+
+    Each glyph is drawn once per font size into an atlas; a label is then
+    composed with a single NumPy gather over the atlas rather than drawing
+    characters one at a time. Finished bitmaps are cached by content and
+    settings, so mass reprints cost a dictionary lookup.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._atlases: Dict[Tuple[float, bool], _GlyphAtlas] = {}
+        self._cache: "OrderedDict[str, RasterLabel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _atlas(self, font_size: float, bold: bool) -> _GlyphAtlas:
+        key = (round(font_size, 2), bold)
+        atlas = self._atlases.get(key)
+        if atlas is not None:
+            return atlas
+
+        import cv2
+
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        scale = 0.6 * font_size
+        thickness = 2 if bold else 1
+        (char_width, char_height), baseline = cv2.getTextSize("W", font, scale, thickness)
+        cell_width = char_width + 1
+        cell_height = char_height + baseline + max(2, char_height // 3)
+
+        count = _LAST_CHAR - _FIRST_CHAR + 1
+        glyphs = np.zeros((count, cell_height, cell_width), dtype=np.uint8)
+        for index in range(count):
+            cv2.putText(glyphs[index], chr(_FIRST_CHAR + index), (0, char_height),
+                        font, scale, 255, thickness, cv2.LINE_8)
+        atlas = _GlyphAtlas(glyphs > 127, cell_height, cell_width)
+        self._atlases[key] = atlas
+        return atlas
+
+    @staticmethod
+    def _cache_key(lines: Sequence[str], settings: Dict[str, Any], qr_data: Optional[str]) -> str:
+        payload = json.dumps([list(lines), settings, qr_data], sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def render(self, lines: Sequence[str], settings: Dict[str, Any], qr_data: Optional[str] = None) -> RasterLabel:
+        """Render text lines, plus a QR code when ``useQRCode`` is set, to a packed bitmap."""
+        if not settings.get("useQRCode"):
+            qr_data = None
+        key = self._cache_key(lines, settings, qr_data)
+        with self._lock:
+            raster = self._cache.get(key)
+            if raster is not None:
+                self._cache.move_to_end(key)
+                return raster
+
+        raster = self._render(lines, settings, qr_data)
+        with self._lock:
+            self._cache[key] = raster
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return raster
+
+    def _render(self, lines: Sequence[str], settings: Dict[str, Any], qr_data: Optional[str]) -> RasterLabel:
+        width = int(settings.get("dotWidth") or DEFAULT_DOT_WIDTH)
+        atlas = self._atlas(float(settings.get("fontSize", 1.0)), settings.get("fontStyle") == "bold")
+        columns = max(1, width // atlas.cell_width)
+
+        # Wrap to the head width and align each row by padding with spaces
+        rows = []
+        for line in lines:
+            rows.extend(textwrap.wrap(line, columns) or [""])
+        alignment = settings.get("alignment", "left")
+        if alignment == "center":
+            rows = [row.center(columns) for row in rows]
+        elif alignment == "right":
+            rows = [row.rjust(columns) for row in rows]
+        else:
+            rows = [row.ljust(columns) for row in rows]
+
+        # One gather over the atlas lays out every character at once
+        codes = np.frombuffer("".join(rows).encode("ascii", "replace"), dtype=np.uint8).astype(np.intp)
+        codes -= _FIRST_CHAR
+        codes[(codes < 0) | (codes > _LAST_CHAR - _FIRST_CHAR)] = _UNKNOWN
+        cells = atlas.glyphs[codes.reshape(len(rows), columns)]
+        text = cells.transpose(0, 2, 1, 3).reshape(len(rows) * atlas.cell_height, columns * atlas.cell_width)
+
+        blocks = [self._fit_width(text, width, alignment)]
+        if qr_data:
+            qr = self._qr_block(qr_data, width)
+            if qr is not None:
+                blocks.append(qr)
+        feed = int(settings.get("linesPerFeed", 0)) * atlas.cell_height
+        if feed:
+            blocks.append(np.zeros((feed, width), dtype=bool))
+
+        bitmap = np.vstack(blocks)
+        if settings.get("darkMode"):
+            bitmap = ~bitmap
+        packed = np.packbits(bitmap, axis=1)
+        return RasterLabel(width, bitmap.shape[0], packed.tobytes())
+
+    @staticmethod
+    def _fit_width(block: np.ndarray, width: int, alignment: str = "center") -> np.ndarray:
+        """Pad a block with white dots to exactly ``width`` columns."""
+        spare = width - block.shape[1]
+        if spare <= 0:
+            return block[:, :width]
+        left = spare // 2 if alignment == "center" else (spare if alignment == "right" else 0)
+        return np.pad(block, ((0, 0), (left, spare - left)))
+
+    def _qr_block(self, data: str, width: int) -> Optional[np.ndarray]:
+        if not QR_AVAILABLE:
+            logger.warning("useQRCode is set but the qrcode package is not installed")
+            return None
+        code = qrcode.QRCode(border=2)
+        code.add_data(data)
+        code.make(fit=True)
+        matrix = np.array(code.get_matrix(), dtype=bool)
+        scale = max(1, (width // 2) // matrix.shape[0])
+        return self._fit_width(np.kron(matrix, np.ones((scale, scale), dtype=bool)), width)
+
+
+label_rasterizer = LabelRasterizer()
+
+def render_raster(lines: Sequence[str], settings: Dict[str, Any], qr_data: Optional[str] = None) -> RasterLabel:
+    """Render label lines to a cached, ready-to-print 1-bit raster."""
+    return label_rasterizer.render(lines, settings, qr_data)
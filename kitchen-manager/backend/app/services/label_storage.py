@@ -1,80 +1,286 @@
+import copy
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
 import os
+import threading
+import uuid
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# Every snapshot starts with a header record naming its generation
+_HEADER_PREFIX = b'{"op":"snapshot"'
+
 class LabelStorage:
-    def __init__(self):
-        self.storage_dir = "data/labels"
+    """
+    Log-structured label store.
+
+    Every save or delete appends a single JSON record to ``labels.log`` and an
+    in-memory dict keyed by ``label_id`` serves all reads, so saves and lookups
+    are O(1) regardless of how many labels are stored. A background thread
+    periodically compacts the log by atomically replacing it with a snapshot of
+    the live labels. An advisory file lock lets several uvicorn workers share
+    the same store; each worker replays whatever the others appended before
+    it reads or writes. Each snapshot starts with a header naming a fresh
+    generation, so a worker notices a compaction by another one even if the
+    new log happens to get the old one's inode.
+
+    Labels are copied on the way in and out; callers never hold a reference
+    into the index.
+    """
+
+    def __init__(self, storage_dir: str = "data/labels", compact_interval: float = 60.0,
+                 compact_min_records: int = 1000):
+        self.storage_dir = storage_dir
         self.storage_file = os.path.join(self.storage_dir, "labels.json")
+        self.log_file = os.path.join(self.storage_dir, "labels.log")
+        self.lock_file = os.path.join(self.storage_dir, "labels.lock")
+        self.compact_interval = compact_interval
+        self.compact_min_records = compact_min_records
         os.makedirs(self.storage_dir, exist_ok=True)
+
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._offset = 0          # Bytes of the log already applied to the index
+        self._records = 0         # Records in the log, live or superseded
+        self._log_identity = None  # (st_dev, st_ino, generation) of the log we have replayed
+        self._mutex = threading.RLock()
+        self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+
         self._ensure_storage_file()
 
+        self._stop = threading.Event()
+        self._compactor = None
+        if self.compact_interval > 0:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, name="label-storage-compactor", daemon=True
+            )
+            self._compactor.start()
+
     def _ensure_storage_file(self):
-        """Ensure the storage file exists and is valid JSON."""
-        if not os.path.exists(self.storage_file):
-            with open(self.storage_file, 'w') as f:
-                json.dump([], f)
+        """Ensure the log exists, migrating the legacy labels.json if present."""
+        with self._file_lock(exclusive=True):
+            if not os.path.exists(self.log_file):
+                legacy = []
+                if os.path.exists(self.storage_file):
+                    try:
+                        with open(self.storage_file, 'r') as f:
+                            legacy = json.load(f)
+                    except Exception as e:
+                        logger.error(f"Error loading legacy labels: {str(e)}")
+                self._index = {label["label_id"]: label for label in legacy if "label_id" in label}
+                self._write_snapshot()
+                if legacy:
+                    os.replace(self.storage_file, self.storage_file + ".migrated")
+                    logger.info(f"Migrated {len(self._index)} labels to {self.log_file}")
+            self._refresh()
+
+    # -- locking ---------------------------------------------------------
+
+    class _FileLock:
+        def __init__(self, storage: "LabelStorage", exclusive: bool):
+            self.storage = storage
+            self.exclusive = exclusive
+
+        def __enter__(self):
+            self.storage._mutex.acquire()
+            if fcntl is not None:
+                fcntl.flock(self.storage._lock_fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            if fcntl is not None:
+                fcntl.flock(self.storage._lock_fd, fcntl.LOCK_UN)
+            self.storage._mutex.release()
+
+    def _file_lock(self, exclusive: bool) -> "_FileLock":
+        return self._FileLock(self, exclusive)
+
+    # -- log replay ------------------------------------------------------
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "put":
+            label = record["label"]
+            self._index[label["label_id"]] = label
+        elif op == "del":
+            self._index.pop(record["label_id"], None)
+        elif op == "snapshot":
+            return
+        self._records += 1
+
+    @staticmethod
+    def _read_generation(f) -> Optional[str]:
+        """The generation named in the log's header, or None for a log written before headers."""
+        head = f.read(128)
+        if not head.startswith(_HEADER_PREFIX):
+            return None
+        try:
+            return json.loads(head[:head.index(b"\n")])["generation"]
+        except (ValueError, KeyError):
+            return None
+
+    def _refresh(self):
+        """Apply records appended to the log since we last looked at it."""
+        try:
+            f = open(self.log_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_dev, stat.st_ino, self._read_generation(f))
+            if identity != self._log_identity:
+                # The log was replaced by a compaction, replay it from the start
+                self._index = {}
+                self._offset = 0
+                self._records = 0
+                self._log_identity = identity
+            if stat.st_size <= self._offset:
+                return
+            f.seek(self._offset)
+            chunk = f.read(stat.st_size - self._offset)
+
+        # Only consume complete lines; a torn tail from a crashed writer is
+        # left in place and truncated by the next writer.
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except Exception as e:
+                logger.error(f"Skipping corrupt label log record: {str(e)}")
+        self._offset += end
+
+    def _append(self, records: List[Dict[str, Any]]):
+        """Durably append records to the log. Caller must hold the exclusive lock."""
+        self._refresh()
+        size = os.path.getsize(self.log_file)
+        if size > self._offset:
+            # Drop a partial record left behind by a writer that crashed mid-append
+            logger.warning(f"Truncating {size - self._offset} bytes of torn label log tail")
+            os.truncate(self.log_file, self._offset)
+
+        payload = b"".join(
+            json.dumps(record, separators=(",", ":")).encode() + b"\n" for record in records
+        )
+        fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        for record in records:
+            self._apply(record)
+        self._offset += len(payload)
+
+    def _write_snapshot(self):
+        """Atomically replace the log with one put record per live label."""
+        tmp_file = f"{self.log_file}.{os.getpid()}.tmp"
+        generation = uuid.uuid4().hex
+        with open(tmp_file, 'wb') as f:
+            f.write(json.dumps({"op": "snapshot", "generation": generation}, separators=(",", ":")).encode() + b"\n")
+            for label in self._index.values():
+                f.write(json.dumps({"op": "put", "label": label}, separators=(",", ":")).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.log_file)
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(self.storage_dir, os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        stat = os.stat(self.log_file)
+        self._log_identity = (stat.st_dev, stat.st_ino, generation)
+        self._offset = stat.st_size
+        self._records = len(self._index)
+
+    # -- compaction ------------------------------------------------------
+
+    def _needs_compaction(self) -> bool:
+        return self._records >= self.compact_min_records and self._records >= 2 * len(self._index)
+
+    def compact(self, force: bool = False) -> bool:
+        """Rewrite the log so it only holds live labels."""
+        with self._file_lock(exclusive=True):
+            self._refresh()
+            if not force and not self._needs_compaction():
+                return False
+            before = self._records
+            self._write_snapshot()
+            logger.info(f"Compacted label log from {before} to {self._records} records")
+            return True
+
+    def _compaction_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Error compacting label log: {str(e)}")
+
+    def close(self):
+        """Stop the background compactor and release the lock file."""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=5)
+        with self._mutex:
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    # -- public API ------------------------------------------------------
 
     def _load_labels(self) -> List[Dict[str, Any]]:
         """Load all labels from storage."""
-        try:
-            with open(self.storage_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading labels: {str(e)}")
-            return []
+        with self._file_lock(exclusive=False):
+            self._refresh()
+            return copy.deepcopy(list(self._index.values()))
+
+    def save_label(self, label_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Save a new label or update an existing one."""
+        return self.save_labels([label_data])[0]
+
+    def save_labels(self, labels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Save several labels with a single append to the log."""
+        for label_data in labels:
+            # Add timestamp if not present
+            if "timestamp" not in label_data:
+                label_data["timestamp"] = datetime.now().isoformat()
 
-    def _save_labels(self, labels: List[Dict[str, Any]]):
-        """Save labels to storage."""
         try:
-            with open(self.storage_file, 'w') as f:
-                json.dump(labels, f, indent=2)
+            with self._file_lock(exclusive=True):
+                self._append([{"op": "put", "label": copy.deepcopy(label_data)} for label_data in labels])
         except Exception as e:
             logger.error(f"Error saving labels: {str(e)}")
             raise
-
-    def save_label(self, label_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Save a new label or update an existing one."""
-        labels = self._load_labels()
-        
-        # Add timestamp if not present
-        if "timestamp" not in label_data:
-            label_data["timestamp"] = datetime.now().isoformat()
-        
-        # Check if label exists
-        existing_index = next(
-            (i for i, label in enumerate(labels) if label["label_id"] == label_data["label_id"]),
-            -1
-        )
-        
-        if existing_index >= 0:
-            # Update existing label
-            labels[existing_index] = label_data
-        else:
-            # Add new label
-            labels.append(label_data)
-        
-        self._save_labels(labels)
-        return label_data
+        return labels
 
     def get_labels(self) -> List[Dict[str, Any]]:
         """Get all saved labels."""
         return self._load_labels()
 
-    def get_label(self, label_id: str) -> Dict[str, Any]:
+    def get_label(self, label_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific label by ID."""
-        labels = self._load_labels()
-        return next(
-            (label for label in labels if label["label_id"] == label_id),
-            None
-        )
+        with self._file_lock(exclusive=False):
+            self._refresh()
+            return copy.deepcopy(self._index.get(label_id))
+
+    def get_label_by_id(self, label_id: str) -> Optional[Dict[str, Any]]:
+        """Alias of get_label matching the DatabaseClient interface."""
+        return self.get_label(label_id)
 
-    def delete_label(self, label_id: str):
-        """Delete a label by ID."""
-        labels = self._load_labels()
-        labels = [label for label in labels if label["label_id"] != label_id]
-        self._save_labels(labels) 
\ No newline at end of file
+    def delete_label(self, label_id: str) -> bool:
+        """Delete a label by ID. Returns False if no such label exists."""
+        with self._file_lock(exclusive=True):
+            self._refresh()
+            if label_id not in self._index:
+                return False
+            self._append([{"op": "del", "label_id": label_id}])
+            return True
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import string
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_formatter = string.Formatter()
+
+def _text(value: Any) -> str:
+    """Render a field value for a single line; lists are comma-joined."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    return str(value)
+
+
+class RenderedLabel(NamedTuple):
+    name: str
+    lines: Tuple[str, ...]
+    # Text value of every field referenced by a Line, e.g. joined ingredient lists
+    fields: Mapping[str, str]
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+# -- layout elements -----------------------------------------------------
+#
+# Each element compiles to a function that appends its output lines to a list.
+# Compilation parses format strings once, so rendering is just lookups and
+# str.format calls.
+
+class Line:
+    """A single line with ``{field}`` placeholders."""
+
+    def __init__(self, fmt: str, optional: bool = False):
+        self.fmt = fmt
+        self.optional = optional
+        self.field_names = [name for _, name, _, _ in _formatter.parse(fmt) if name]
+
+    def compile(self) -> Callable[[Mapping[str, Any], List[str], Dict[str, str]], None]:
+        fmt, names, optional = self.fmt, self.field_names, self.optional
+
+        def render(values, out, fields):
+            texts = {name: _text(values.get(name)) for name in names}
+            fields.update(texts)
+            if optional and not any(texts.values()):
+                return
+            out.append(fmt.format(**texts))
+        return render
+
+
+class Blank:
+    """An empty separator line."""
+
+    def compile(self):
+        def render(values, out, fields):
+            out.append("")
+        return render
+
+
+class Items:
+    """One line per item of a list field."""
+
+    def __init__(self, field: str, item_fmt: str = "- {}"):
+        self.field = field
+        self.item_fmt = item_fmt
+
+    def compile(self):
+        field, item_fmt = self.field, self.item_fmt
+
+        def render(values, out, fields):
+            out.extend(item_fmt.format(item) for item in values.get(field) or ())
+        return render
+
+
+class Section:
+    """Elements that are only rendered when ``field`` is non-empty."""
+
+    def __init__(self, field: str, elements: Sequence[Any]):
+        self.field = field
+        self.elements = elements
+
+    def compile(self):
+        field = self.field
+        steps = [element.compile() for element in self.elements]
+
+        def render(values, out, fields):
+            if not values.get(field):
+                return
+            for step in steps:
+                step(values, out, fields)
+        return render
+
+
+class LabelTemplate:
+    """A label layout compiled once into a list of render steps."""
+
+    def __init__(self, name: str, elements: Sequence[Any]):
+        self.name = name
+        self._steps = [element.compile() for element in elements]
+
+    def render(self, values: Mapping[str, Any]) -> RenderedLabel:
+        out: List[str] = []
+        fields: Dict[str, str] = {}
+        for step in self._steps:
+            step(values, out, fields)
+        return RenderedLabel(self.name, tuple(out), MappingProxyType(fields))
+
+
+# -- layouts shared by every print path ----------------------------------
+
+TRAY_LABEL = LabelTemplate("tray", [
+    Line("Tray: {tray_name}"),
+    Line("Size: {tray_size}"),
+    Line("Material: {tray_material}"),
+    Line("Volume: {tray_volume}"),
+    Blank(),
+    Line("Dishes: {dish_name}"),
+    Line("Prep Date: {prep_date}"),
+    Line("Expiry Date: {expiry_date}"),
+    Blank(),
+    Line("Ingredients:"),
+    Items("ingredients"),
+    Section("allergens", [Blank(), Line("Allergens:"), Items("allergens")]),
+    Section("notes", [Blank(), Line("Notes: {notes}")]),
+])
+
+SAVED_LABEL = LabelTemplate("saved_label", [
+    Line("Product: {product_name}"),
+    Line("Employee: {employee_name}"),
+    Section("dates", [Line("Dates:"), Items("dates")]),
+])
+
+PREP_BAG_LABEL = LabelTemplate("prep_bag", [
+    Line("{dish_name}"),
+    Line("Prep: {prep_date}"),
+    Line("Expiry: {expiry_date}"),
+    Line("Ingredients: {ingredients}", optional=True),
+    Line("Allergens: {allergens}", optional=True),
+    Line("Notes: {notes}", optional=True),
+    Line("Tray: {tray_id}", optional=True),
+])
+
+
+class LabelRenderer:
+    """
+    Renders labels through an LRU cache keyed by a hash of the template name
+    and field values, so a label reprinted many times in a shift is only
+    formatted once. Registering a template under a name already in use
+    replaces it and drops the labels cached from the old layout.
+    """
+
+    def __init__(self, templates: Sequence[LabelTemplate], max_entries: int = 1024):
+        self.templates: Dict[str, LabelTemplate] = {}
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, RenderedLabel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for template in templates:
+            self.register(template)
+
+    def register(self, template: LabelTemplate):
+        """Add a layout, or replace the one with the same name."""
+        with self._lock:
+            self.templates[template.name] = template
+            stale = [key for key, rendered in self._cache.items() if rendered.name == template.name]
+            for key in stale:
+                del self._cache[key]
+
+    @staticmethod
+    def content_key(name: str, values: Mapping[str, Any]) -> str:
+        payload = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(f"{name}\0{payload}".encode(), digest_size=16).hexdigest()
+
+    def render(self, name: str, values: Mapping[str, Any]) -> RenderedLabel:
+        key = self.content_key(name, values)
+        with self._lock:
+            rendered = self._cache.get(key)
+            if rendered is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return rendered
+
+        template = self.templates[name]
+        rendered = template.render(values)
+        with self._lock:
+            self.misses += 1
+            if self.templates.get(name) is not template:
+                # Replaced while rendering; don't cache the old layout's output
+                return rendered
+            self._cache[key] = rendered
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return rendered
+
+
+label_renderer = LabelRenderer([TRAY_LABEL, SAVED_LABEL, PREP_BAG_LABEL])
+
+def render_label(name: str, values: Mapping[str, Any]) -> RenderedLabel:
+    """Render a label with one of the shared layouts: tray, saved_label or prep_bag."""
+    return label_renderer.render(name, values)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PendingLabelQueue:
+    """
+    Labels waiting to be fetched by a printer driver.
+
+    Pending labels are kept in insertion order and indexed by ID, so adding,
+    looking up and acknowledging a label are all O(1). Printed labels move to
+    a bounded history, so the queue does not grow for as long as the server
+    runs. Drivers can long-poll with ``wait_for_pending`` instead of polling
+    in a tight loop, or follow the ``jobs`` topic on the event bus.
+
+    All methods must be called from the event loop.
+    """
+
+    def __init__(self, max_history: int = None, event_bus=None):
+        self.max_history = max_history or int(os.environ.get('PENDING_LABEL_HISTORY', '500'))
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._printed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._added = asyncio.Event()
+        self.event_bus = event_bus
+
+    def add(self, label: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a label. It must have a unique ``id``."""
+        label["printed"] = False
+        self._pending[label["id"]] = label
+        # Wake every waiting driver, then re-arm for the next label
+        self._added.set()
+        self._added = asyncio.Event()
+        if self.event_bus is not None:
+            self.event_bus.publish("jobs", "job.created", {"source": "pending", **label})
+        return label
+
+    def get(self, label_id: str) -> Optional[Dict[str, Any]]:
+        return self._pending.get(label_id) or self._printed.get(label_id)
+
+    def mark_printed(self, label_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Acknowledge a label and move it to the printed history.
+        Acknowledging an already printed label is a no-op.
+
+        Returns:
+            The label, or None if it is unknown or already evicted
+        """
+        label = self._pending.pop(label_id, None)
+        if label is None:
+            return self._printed.get(label_id)
+
+        label["printed"] = True
+        self._printed[label_id] = label
+        while len(self._printed) > self.max_history:
+            self._printed.popitem(last=False)
+        if self.event_bus is not None:
+            self.event_bus.publish("jobs", "job.state", {"source": "pending", "id": label_id, "state": "printed"})
+        return label
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return list(self._pending.values())
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Retained printed labels followed by pending ones."""
+        return list(self._printed.values()) + list(self._pending.values())
+
+    async def wait_for_pending(self, timeout: float) -> List[Dict[str, Any]]:
+        """
+        Return pending labels, waiting up to ``timeout`` seconds for one to
+        arrive if there are none yet.
+        """
+        if not self._pending and timeout > 0:
+            try:
+                await asyncio.wait_for(self._added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.pending()
+
+    def __len__(self) -> int:
+        return len(self._pending)
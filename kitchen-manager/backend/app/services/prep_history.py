@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+from .units import normalize
+
+logger = logging.getLogger(__name__)
+
+# Format 2 totals ingredients in base units (g, ml, pcs); format 3 adds the
+# days recent bags were completed on. Older checkpoints are rebuilt from the log
+CHECKPOINT_FORMAT = 3
+
+
+class _DayRollup:
+    """Completed bags on one day, by dish, tray and ingredient."""
+
+    __slots__ = ("bags", "dishes", "trays", "ingredients")
+
+    def __init__(self):
+        self.bags = 0
+        self.dishes: Dict[str, int] = {}
+        self.trays: Dict[str, int] = {}
+        # (ingredient, base unit) -> [total in that unit, bags]
+        self.ingredients: Dict[Tuple[str, str], List[float]] = {}
+
+    def add(self, event: Dict[str, Any], sign: int):
+        self.bags += sign
+        _bump(self.dishes, event.get("dish") or "Unknown", sign)
+        if event.get("tray_id"):
+            _bump(self.trays, event["tray_id"], sign)
+        for ingredient in event.get("ingredients", []) + event.get("addedIngredients", []):
+            amount, base = normalize(ingredient)
+            key = (ingredient.get("name", "Unknown"), base)
+            totals = self.ingredients.setdefault(key, [0.0, 0])
+            totals[0] += sign * amount
+            totals[1] += sign
+            if totals[1] <= 0:
+                del self.ingredients[key]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bags": self.bags,
+            "dishes": self.dishes,
+            "trays": self.trays,
+            "ingredients": [[name, unit, weight, bags] for (name, unit), (weight, bags) in self.ingredients.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_DayRollup":
+        rollup = cls()
+        rollup.bags = data["bags"]
+        rollup.dishes = data["dishes"]
+        rollup.trays = data["trays"]
+        rollup.ingredients = {(name, unit): [weight, bags] for name, unit, weight, bags in data["ingredients"]}
+        return rollup
+
+
+def _bump(counts: Dict[str, int], key: str, sign: int):
+    count = counts.get(key, 0) + sign
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+
+class PrepHistory:
+    """
+    Append-only history of prep bag completions, with per-day rollups for
+    reporting.
+
+    Each ``bag.completed`` event (and ``bag.reopened``, when a completed bag
+    is taken back) is appended as one JSON line to ``events.log`` and folded
+    into per-day totals by dish, tray and ingredient as it is written.
+    Report queries read only those rollups, so their cost depends on the
+    number of days asked for, never on the number of events.
+
+    A reopened bag is taken off the day it was completed, which may be an
+    earlier one than the reopen: the completion day is recorded on the
+    reopen event as ``completed_day``. Completion days are remembered for
+    ``reopen_days`` days; a bag reopened after that, or one completed before
+    the history began, is logged but left in the totals.
+
+    Like LabelStorage, several uvicorn workers can share the directory: an
+    advisory lock serialises appends, and each worker folds in whatever the
+    others appended before it answers a query. The rollups are checkpointed
+    to ``rollups.json`` every ``checkpoint_every`` events and on close, so a
+    restart only replays the events written after the last checkpoint.
+    """
+
+    def __init__(self, history_dir: str = None, checkpoint_every: int = None, recent: int = None,
+                 reopen_days: int = None):
+        self.history_dir = history_dir or os.environ.get('PREP_HISTORY_DIR', 'data/prep_history')
+        self.checkpoint_every = checkpoint_every or int(os.environ.get('PREP_HISTORY_CHECKPOINT_EVERY', '1000'))
+        self.reopen_days = reopen_days or int(os.environ.get('PREP_HISTORY_REOPEN_DAYS', '7'))
+        self.log_file = os.path.join(self.history_dir, "events.log")
+        self.checkpoint_file = os.path.join(self.history_dir, "rollups.json")
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        self._days: Dict[str, _DayRollup] = {}
+        # (dish ID, bag ID) -> day the bag was last completed, while it stays completed
+        self._completed: Dict[Tuple[str, str], str] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent or int(os.environ.get('PREP_HISTORY_RECENT', '500')))
+        self._offset = 0          # Bytes of the log already folded into the rollups
+        self._since_checkpoint = 0
+        self._mutex = threading.RLock()
+        self._lock_fd = os.open(os.path.join(self.history_dir, "events.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+        self._load_checkpoint()
+        with self._mutex:
+            self._refresh()
+        logger.info(f"Prep history loaded: {len(self._days)} days of rollups from {self.history_dir}")
+
+    # -- locking ---------------------------------------------------------
+
+    class _FileLock:
+        def __init__(self, history: "PrepHistory"):
+            self.history = history
+
+        def __enter__(self):
+            self.history._mutex.acquire()
+            if fcntl is not None:
+                fcntl.flock(self.history._lock_fd, fcntl.LOCK_EX)
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            if fcntl is not None:
+                fcntl.flock(self.history._lock_fd, fcntl.LOCK_UN)
+            self.history._mutex.release()
+
+    # -- log replay ------------------------------------------------------
+
+    def _apply(self, event: Dict[str, Any]):
+        key = (event.get("dish_id"), event.get("bag_id"))
+        if event["type"] == "bag.reopened":
+            self._completed.pop(key, None)
+            # Events logged before completed_day existed were taken off their own day
+            day = event.get("completed_day", event["day"])
+            if day is not None:
+                self._days.setdefault(day, _DayRollup()).add(event, -1)
+        else:
+            self._completed[key] = event["day"]
+            self._days.setdefault(event["day"], _DayRollup()).add(event, 1)
+        self._recent.append(event)
+
+    def _refresh(self):
+        """Fold in events appended since we last looked. Caller must hold ``_mutex``."""
+        try:
+            size = os.path.getsize(self.log_file)
+        except FileNotFoundError:
+            return
+        if size <= self._offset:
+            return
+
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+
+        # Only consume complete lines; a torn tail from a crashed writer is
+        # left in place and truncated by the next writer.
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except Exception as e:
+                logger.error(f"Skipping corrupt prep history record: {str(e)}")
+        self._offset += end
+
+    def record(self, events: Iterable[Dict[str, Any]]):
+        """
+        Durably append events from PrepState, stamping them with the time
+        and the kitchen's local day, and reopens with the day the bag was
+        completed. Blocks on disk I/O; call it from a worker thread.
+        """
+        now = datetime.now()
+        stamped = [{**event, "at": now.isoformat(), "day": now.date().isoformat()} for event in events]
+        if not stamped:
+            return
+
+        with self._FileLock(self):
+            self._refresh()
+            # Completions other workers logged are folded in by now
+            completed = dict(self._completed)
+            for event in stamped:
+                key = (event.get("dish_id"), event.get("bag_id"))
+                if event["type"] == "bag.reopened":
+                    event["completed_day"] = completed.pop(key, None)
+                else:
+                    completed[key] = event["day"]
+            payload = b"".join(json.dumps(event, separators=(",", ":")).encode() + b"\n" for event in stamped)
+            size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+            if size > self._offset:
+                # Drop a partial record left behind by a writer that crashed mid-append
+                logger.warning(f"Truncating {size - self._offset} bytes of torn prep history tail")
+                os.truncate(self.log_file, self._offset)
+            fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, payload)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            for event in stamped:
+                self._apply(event)
+            self._offset += len(payload)
+
+            self._since_checkpoint += len(stamped)
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._write_checkpoint()
+
+    # -- checkpoints -----------------------------------------------------
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_file, 'rb') as f:
+                checkpoint = json.loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable prep history checkpoint: {str(e)}")
+            return
+        try:
+            log_size = os.path.getsize(self.log_file)
+        except FileNotFoundError:
+            log_size = 0
+        if checkpoint.get("format") != CHECKPOINT_FORMAT or checkpoint["offset"] > log_size:
+            logger.warning("Prep history checkpoint does not match the event log, replaying the log")
+            return
+        self._days = {day: _DayRollup.from_dict(data) for day, data in checkpoint["days"].items()}
+        self._completed = {(dish_id, bag_id): day for dish_id, bag_id, day in checkpoint["completed"]}
+        self._offset = checkpoint["offset"]
+
+    def _write_checkpoint(self):
+        """Atomically save the rollups and the log offset they cover. Caller must hold the lock."""
+        # Forget completion days too old to reopen, so they don't pile up
+        oldest = (date.today() - timedelta(days=self.reopen_days)).isoformat()
+        self._completed = {key: day for key, day in self._completed.items() if day >= oldest}
+        checkpoint = {
+            "format": CHECKPOINT_FORMAT,
+            "offset": self._offset,
+            "days": {day: rollup.to_dict() for day, rollup in self._days.items()},
+            "completed": [[dish_id, bag_id, day] for (dish_id, bag_id), day in self._completed.items()],
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=".rollups.", dir=self.history_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(checkpoint, separators=(",", ":")).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._since_checkpoint = 0
+
+    def close(self):
+        with self._FileLock(self):
+            self._refresh()
+            if self._since_checkpoint:
+                self._write_checkpoint()
+        os.close(self._lock_fd)
+
+    # -- queries ---------------------------------------------------------
+
+    def _range(self, start: Optional[date], end: Optional[date]) -> List[Tuple[str, _DayRollup]]:
+        """Rollups of the days in [start, end], oldest first. Caller must hold ``_mutex``."""
+        self._refresh()
+        first = start.isoformat() if start else ""
+        last = end.isoformat() if end else "9999-12-31"
+        return sorted((day, rollup) for day, rollup in self._days.items() if first <= day <= last and rollup.bags > 0)
+
+    def daily(self, start: date = None, end: date = None) -> List[Dict[str, Any]]:
+        """Bags completed per day, with the dishes and trays they went into."""
+        with self._mutex:
+            return [
+                {"day": day, "bags": rollup.bags, "dishes": dict(rollup.dishes), "trays": dict(rollup.trays)}
+                for day, rollup in self._range(start, end)
+            ]
+
+    def dishes(self, start: date = None, end: date = None) -> List[Dict[str, Any]]:
+        """
+        Per dish: bags completed, days it was prepped, and average and peak
+        bags on those days, a basis for par levels. Most prepped first.
+        """
+        with self._mutex:
+            per_dish: Dict[str, List[int]] = {}
+            for _, rollup in self._range(start, end):
+                for dish, bags in rollup.dishes.items():
+                    per_dish.setdefault(dish, []).append(bags)
+        return sorted((
+            {
+                "dish": dish,
+                "bags": sum(counts),
+                "days": len(counts),
+                "avg_bags_per_day": round(sum(counts) / len(counts), 2),
+                "max_bags_per_day": max(counts),
+            }
+            for dish, counts in per_dish.items()
+        ), key=lambda row: -row["bags"])
+
+    def ingredients(self, start: date = None, end: date = None) -> List[Dict[str, Any]]:
+        """
+        Per ingredient: weight prepped in its base unit (g, ml or pcs), bags,
+        days used and average weight on those days.
+        """
+        with self._mutex:
+            per_ingredient: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+            for _, rollup in self._range(start, end):
+                for key, (weight, bags) in rollup.ingredients.items():
+                    per_ingredient.setdefault(key, []).append((weight, bags))
+        rows = []
+        for (name, unit), days in per_ingredient.items():
+            weight = sum(w for w, _ in days)
+            rows.append({
+                "ingredient": name,
+                "unit": unit,
+                "weight": round(weight, 3),
+                "bags": sum(b for _, b in days),
+                "days": len(days),
+                "avg_weight_per_day": round(weight / len(days), 3),
+            })
+        return sorted(rows, key=lambda row: (row["ingredient"], row["unit"]))
+
+    def trays(self, start: date = None, end: date = None) -> List[Dict[str, Any]]:
+        """Bags completed per tray."""
+        with self._mutex:
+            per_tray: Dict[str, int] = {}
+            for _, rollup in self._range(start, end):
+                for tray_id, bags in rollup.trays.items():
+                    per_tray[tray_id] = per_tray.get(tray_id, 0) + bags
+        return [{"tray_id": tray_id, "bags": bags} for tray_id, bags in sorted(per_tray.items())]
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """The latest events, newest first, from a bounded in-memory window."""
+        with self._mutex:
+            self._refresh()
+            return list(self._recent)[-limit:][::-1]
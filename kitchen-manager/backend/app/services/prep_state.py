@@ -0,0 +1,412 @@
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from .state_store import StateStore
+from .units import bag_volume, display_factor, display_names, measure_bags, normalize, unit_of
+
+logger = logging.getLogger(__name__)
+
+class PrepVersionConflict(Exception):
+    """Raised when a delta was built against a different state than the server holds."""
+
+    def __init__(self, base_seq: int, seq: int):
+        super().__init__(f"Delta is based on seq {base_seq} but the server is at seq {seq}; send a full snapshot")
+        self.base_seq = base_seq
+        self.seq = seq
+
+
+class _TrayAggregate:
+    """Completed-bag count and ingredient totals for one tray, kept up to date incrementally."""
+
+    __slots__ = ("dishes", "total_bags", "ingredients", "_totals")
+
+    def __init__(self):
+        # Ordered set of dish IDs on this tray
+        self.dishes: Dict[str, None] = {}
+        self.total_bags = 0
+        # (name, base unit) -> [total in the base unit, contributing bags,
+        # unit to report it in, base units per that unit]; the bag count
+        # lets empty totals be dropped
+        self.ingredients: Dict[Tuple[str, str], List[Any]] = {}
+        # ingredient_totals() as of the last change
+        self._totals: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def add_bag(self, bag: Dict[str, Any], sign: int):
+        self.total_bags += sign
+        self._totals = None
+        for ingredient in bag.get("ingredients", []):
+            amount, base = normalize(ingredient)
+            key = (ingredient.get("name", "Unknown"), base)
+            totals = self.ingredients.get(key)
+            if totals is None:
+                unit = unit_of(ingredient)
+                totals = self.ingredients[key] = [0.0, 0, unit, display_factor(unit)]
+            totals[0] += sign * amount
+            totals[1] += sign
+            if totals[1] <= 0:
+                del self.ingredients[key]
+
+    def set_ingredients(self, ingredients: Dict[Tuple[str, str], List[Any]]):
+        self.ingredients = ingredients
+        self._totals = None
+
+    def ingredient_totals(self) -> Dict[str, Dict[str, Any]]:
+        """Totals in the unit each ingredient was first seen in, e.g. 500 g + 1 kg as 1500 g."""
+        if self._totals is None:
+            names = display_names(self.ingredients)
+            self._totals = {
+                names[key]: {"total_weight": total / factor, "unit": unit}
+                for key, (total, _, unit, factor) in self.ingredients.items()
+            }
+        return {name: dict(totals) for name, totals in self._totals.items()}
+
+
+def _weight(ingredient: Dict[str, Any]) -> Dict[str, Any]:
+    return {"name": ingredient.get("name", "Unknown"), "weight": ingredient.get("weight", 0),
+            "unit": ingredient.get("unit", "g")}
+
+
+class PrepState:
+    """
+    Prep-tracker dishes and the per-tray contents derived from them.
+
+    The prep-tracker app can send a full snapshot (``replace``) or a delta of
+    dish and bag upserts and removals (``apply_delta``). A delta only touches
+    the bags it names: each tray's bag count and ingredient totals are
+    adjusted by the difference, so ingest cost scales with the change, not
+    with the size of the prep list.
+
+    Every applied snapshot or delta advances ``seq``. A delta may carry the
+    ``base_seq`` it was built on; if the server has moved on it is refused
+    with ``PrepVersionConflict`` and the client should send a snapshot.
+    Individual operations may carry a per-entity ``version``; an operation
+    no newer than what is held for that dish or bag is ignored, so retried
+    or reordered deltas are harmless.
+
+    With a shared ``store`` several worker processes can serve the same
+    prep data: every change is written to the store as a whole snapshot
+    under the store's lock, and a worker whose copy is behind the store
+    rebuilds it before reading or changing anything. Rebuilding and
+    writing the snapshot cost O(dishes), which is the price of running more
+    than one worker; with a single worker no store is needed.
+
+    All methods must be called from the event loop.
+    """
+
+    KEY = "prep_state"
+
+    def __init__(self, store: Optional[StateStore] = None):
+        self._seq = 0
+        self._dishes: Dict[str, Dict[str, Any]] = {}
+        self._bags: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Estimated litres of each completed bag, by dish and bag ID
+        self._volumes: Dict[str, Dict[str, float]] = {}
+        self._trays: Dict[str, _TrayAggregate] = {}
+        # Latest version seen per dish / bag, including removed ones
+        self._versions: Dict[Tuple[str, ...], int] = {}
+        # An unshared store adds nothing over this object's own fields
+        self._store = store if store is not None and store.shared else None
+        self._store_version: Optional[Hashable] = None
+        # Bag completions since the last take_events(), for the prep history
+        self._events: List[Dict[str, Any]] = []
+
+    # -- shared store ------------------------------------------------------------
+
+    def _sync(self):
+        """Catch up with changes other workers wrote to the store."""
+        if self._store is None or self._store.version(self.KEY) == self._store_version:
+            return
+        snapshot, version = self._store.get(self.KEY)
+        self._load(snapshot or {"seq": 0, "dishes": [], "versions": []})
+        self._store_version = version
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Apply a change on top of the latest shared state and publish it."""
+        if self._store is None:
+            yield
+            return
+        with self._store.lock(self.KEY):
+            self._sync()
+            seq = self._seq
+            yield
+            if self._seq != seq:
+                self._store_version = self._store.put(self.KEY, self.snapshot())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything needed to rebuild this state with ``_load``, as plain JSON types."""
+        return {
+            "seq": self._seq,
+            "dishes": self.dishes(),
+            "versions": [[list(key), version] for key, version in self._versions.items()],
+        }
+
+    def _load(self, snapshot: Dict[str, Any]):
+        self._dishes.clear()
+        self._bags.clear()
+        self._volumes.clear()
+        self._trays.clear()
+        for dish in snapshot["dishes"]:
+            self._upsert_dish(dish, set(), measure=False)
+        self._measure_all()
+        self._versions = {tuple(key): version for key, version in snapshot["versions"]}
+        self._seq = snapshot["seq"]
+
+    # -- reads ---------------------------------------------------------------
+
+    def dishes(self) -> List[Dict[str, Any]]:
+        """Dishes as last sent by the prep-tracker, with their bags."""
+        self._sync()
+        return [{**dish, "prepBags": list(self._bags[dish_id].values())} for dish_id, dish in self._dishes.items()]
+
+    @property
+    def seq(self) -> int:
+        """Advanced by every applied snapshot or delta."""
+        self._sync()
+        return self._seq
+
+    def tray(self, tray_id: str) -> Dict[str, Any]:
+        self._sync()
+        aggregate = self._trays.get(tray_id)
+        if aggregate is None:
+            return {"dishes": [], "total_bags": 0, "ingredients": {}}
+        return {
+            "dishes": [
+                {
+                    "id": dish_id,
+                    "name": self._dishes[dish_id].get("name"),
+                    "quantity": self._dishes[dish_id].get("quantity", 1),
+                    "prep_bags": [bag for bag in self._bags[dish_id].values() if bag.get("isComplete")],
+                }
+                for dish_id in aggregate.dishes
+            ],
+            "total_bags": aggregate.total_bags,
+            "ingredients": aggregate.ingredient_totals(),
+        }
+
+    def completed_bags(self) -> List[Dict[str, Any]]:
+        """Completed bags with their dish and estimated volume in litres, in prep-list order."""
+        self._sync()
+        return [
+            {"id": bag_id, "dish_id": dish_id, "dish_name": self._dishes[dish_id].get("name"),
+             "volume": self._volumes[dish_id][bag_id]}
+            for dish_id, bags in self._bags.items()
+            for bag_id, bag in bags.items()
+            if bag.get("isComplete")
+        ]
+
+    def tray_contents(self) -> Dict[str, Dict[str, Any]]:
+        self._sync()
+        return {tray_id: self.tray(tray_id) for tray_id in self._trays}
+
+    # -- snapshot ----------------------------------------------------------------
+
+    def replace(self, dishes: List[Dict[str, Any]]) -> int:
+        """Replace all state with a full snapshot. Returns the new seq."""
+        with self._writing():
+            before = dict(self._bags)
+            self._load({"seq": self._seq + 1, "dishes": dishes, "versions": []})
+            for dish_id in self._bags:
+                self._note_dish(dish_id, before.get(dish_id, {}))
+        return self._seq
+
+    def restore(self, snapshot: Dict[str, Any]) -> bool:
+        """
+        Load a ``snapshot()`` saved by an earlier run, keeping its seq so
+        clients can carry on sending deltas. Does nothing if prep data has
+        already arrived (or another worker restored first). Returns whether
+        the snapshot was loaded.
+        """
+        with self._writing():
+            if self._seq or self._dishes:
+                return False
+            self._load(snapshot)
+        return True
+
+    # -- delta -------------------------------------------------------------------
+
+    def apply_delta(self, ops: List[Dict[str, Any]], base_seq: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Apply ``upsert_dish``, ``remove_dish``, ``upsert_bag`` and ``remove_bag``
+        operations in order.
+
+        Returns:
+            The new seq, how many operations were applied or ignored as stale,
+            rejected operations with the reason, and the trays that changed
+        """
+        with self._writing():
+            if base_seq is not None and base_seq != self._seq:
+                raise PrepVersionConflict(base_seq, self._seq)
+
+            applied = ignored = 0
+            rejected = []
+            changed: Set[str] = set()
+            for index, op in enumerate(ops):
+                try:
+                    if self._apply(op, changed):
+                        applied += 1
+                    else:
+                        ignored += 1
+                except KeyError as e:
+                    rejected.append({"index": index, "error": f"Missing field {e.args[0]!r}"})
+                except (ValueError, TypeError) as e:
+                    rejected.append({"index": index, "error": str(e)})
+
+            if applied:
+                self._seq += 1
+        return {"seq": self._seq, "applied": applied, "ignored": ignored, "rejected": rejected,
+                "changed_trays": sorted(changed)}
+
+    def _apply(self, op: Dict[str, Any], changed: Set[str]) -> bool:
+        kind = op.get("op")
+        if kind in ("upsert_dish", "remove_dish"):
+            dish_id = op["dish"]["id"] if kind == "upsert_dish" else op["dish_id"]
+            key: Tuple[str, ...] = ("dish", dish_id)
+        elif kind in ("upsert_bag", "remove_bag"):
+            dish_id = op["dish_id"]
+            if dish_id not in self._dishes:
+                raise ValueError(f"Unknown dish {dish_id}")
+            bag_id = op["bag"]["id"] if kind == "upsert_bag" else op["bag_id"]
+            key = ("bag", dish_id, bag_id)
+        else:
+            raise ValueError(f"Unknown op {kind!r}")
+
+        version = op.get("version")
+        if version is not None and version <= self._versions.get(key, -1):
+            return False
+
+        if kind == "upsert_dish":
+            before = self._bags.get(dish_id, {})
+            self._upsert_dish(op["dish"], changed)
+            self._note_dish(dish_id, before)
+        elif kind == "remove_dish":
+            self._remove_dish(dish_id, changed)
+        elif kind == "upsert_bag":
+            old = self._bags[dish_id].get(bag_id)
+            self._upsert_bag(dish_id, op["bag"], changed)
+            self._note_bag(dish_id, old, op["bag"])
+        else:
+            self._remove_bag(dish_id, bag_id, changed)
+        if version is not None:
+            self._versions[key] = version
+        return True
+
+    # -- history events ------------------------------------------------------------
+
+    def take_events(self) -> List[Dict[str, Any]]:
+        """
+        ``bag.completed`` and ``bag.reopened`` events for the bags that
+        ``replace`` and ``apply_delta`` completed or took back since the last
+        call. Bags that disappear with a new prep list are not reported.
+        """
+        events, self._events = self._events, []
+        return events
+
+    def _note_dish(self, dish_id: str, before: Dict[str, Dict[str, Any]]):
+        for bag_id, bag in self._bags[dish_id].items():
+            self._note_bag(dish_id, before.get(bag_id), bag)
+
+    def _note_bag(self, dish_id: str, old: Optional[Dict[str, Any]], new: Dict[str, Any]):
+        was_done = bool(old and old.get("isComplete"))
+        is_done = bool(new.get("isComplete"))
+        if was_done and (not is_done or new != old):
+            self._event("bag.reopened", dish_id, old)
+        if is_done and (not was_done or new != old):
+            self._event("bag.completed", dish_id, new)
+
+    def _event(self, kind: str, dish_id: str, bag: Dict[str, Any]):
+        dish = self._dishes[dish_id]
+        self._events.append({
+            "type": kind,
+            "dish_id": dish_id,
+            "dish": dish.get("name"),
+            "tray_id": dish.get("trayId"),
+            "bag_id": bag["id"],
+            "ingredients": [_weight(i) for i in bag.get("ingredients", [])],
+            "addedIngredients": [_weight(i) for i in bag.get("addedIngredients", [])],
+        })
+
+    def _tray_of(self, dish_id: str) -> Optional[_TrayAggregate]:
+        tray_id = self._dishes[dish_id].get("trayId")
+        return self._trays.get(tray_id) if tray_id else None
+
+    def _measure_all(self):
+        """Volumes of the completed bags and totals of every tray, in one batch after a full load."""
+        bags = [bag for dish_bags in self._bags.values() for bag in dish_bags.values() if bag.get("isComplete")]
+        dish_ids = [dish_id for dish_id, dish_bags in self._bags.items()
+                    for bag in dish_bags.values() if bag.get("isComplete")]
+        trays = [self._dishes[dish_id].get("trayId") for dish_id in dish_ids]
+        volumes, totals = measure_bags(bags, trays)
+
+        for dish_id, bag, volume in zip(dish_ids, bags, volumes.tolist()):
+            self._volumes[dish_id][bag["id"]] = volume
+        for tray_id in trays:
+            if tray_id:
+                self._trays[tray_id].total_bags += 1
+        for tray_id, ingredients in totals.items():
+            self._trays[tray_id].set_ingredients(ingredients)
+
+    def _upsert_dish(self, dish: Dict[str, Any], changed: Set[str], measure: bool = True):
+        dish_id = dish["id"]
+        if dish_id in self._dishes:
+            self._remove_dish(dish_id, changed)
+
+        self._dishes[dish_id] = {k: v for k, v in dish.items() if k != "prepBags"}
+        self._bags[dish_id] = {bag["id"]: bag for bag in dish.get("prepBags", [])}
+        # Without ``measure`` the caller fills in volumes and totals with _measure_all
+        self._volumes[dish_id] = (
+            {bag_id: bag_volume(bag) for bag_id, bag in self._bags[dish_id].items() if bag.get("isComplete")}
+            if measure else {}
+        )
+        tray_id = dish.get("trayId")
+        if tray_id:
+            aggregate = self._trays.setdefault(tray_id, _TrayAggregate())
+            aggregate.dishes[dish_id] = None
+            if measure:
+                for bag in self._bags[dish_id].values():
+                    if bag.get("isComplete"):
+                        aggregate.add_bag(bag, 1)
+            changed.add(tray_id)
+
+    def _remove_dish(self, dish_id: str, changed: Set[str]):
+        if dish_id not in self._dishes:
+            return
+        aggregate = self._tray_of(dish_id)
+        if aggregate is not None:
+            for bag in self._bags[dish_id].values():
+                if bag.get("isComplete"):
+                    aggregate.add_bag(bag, -1)
+            del aggregate.dishes[dish_id]
+            tray_id = self._dishes[dish_id]["trayId"]
+            if not aggregate.dishes:
+                del self._trays[tray_id]
+            changed.add(tray_id)
+        del self._dishes[dish_id]
+        del self._bags[dish_id]
+        del self._volumes[dish_id]
+
+    def _upsert_bag(self, dish_id: str, bag: Dict[str, Any], changed: Set[str]):
+        bags = self._bags[dish_id]
+        aggregate = self._tray_of(dish_id)
+        old = bags.get(bag["id"])
+        if aggregate is not None:
+            if old is not None and old.get("isComplete"):
+                aggregate.add_bag(old, -1)
+            if bag.get("isComplete"):
+                aggregate.add_bag(bag, 1)
+            changed.add(self._dishes[dish_id]["trayId"])
+        bags[bag["id"]] = bag
+        if bag.get("isComplete"):
+            self._volumes[dish_id][bag["id"]] = bag_volume(bag)
+        else:
+            self._volumes[dish_id].pop(bag["id"], None)
+
+    def _remove_bag(self, dish_id: str, bag_id: str, changed: Set[str]):
+        old = self._bags[dish_id].pop(bag_id, None)
+        self._volumes[dish_id].pop(bag_id, None)
+        aggregate = self._tray_of(dish_id)
+        if old is not None and aggregate is not None:
+            if old.get("isComplete"):
+                aggregate.add_bag(old, -1)
+            changed.add(self._dishes[dish_id]["trayId"])
@@ -1,15 +1,16 @@
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .label_printer import LabelPrinterService
+from .print_spool import SpoolFullError
 
 logger = logging.getLogger(__name__)
 
 class PrepTrackerService:
-    def __init__(self):
-        self.label_printer = LabelPrinterService()
+    def __init__(self, label_printer: LabelPrinterService = None):
+        self.label_printer = label_printer or LabelPrinterService()
         
-    async def handle_prep_data(self, data: Dict[str, Any]) -> bool:
+    async def handle_prep_data(self, data: Dict[str, Any]) -> Optional[str]:
         """
         Handle incoming prep tracker data and trigger label printing if needed.
         
@@ -17,7 +18,10 @@ class PrepTrackerService:
             data: Dictionary containing prep tracker data
             
         Returns:
-            bool: True if label was printed successfully, False otherwise
+            str: ID of the queued print job, or None if the label was not queued
+
+        Raises:
+            SpoolFullError: if the printer's queue is full
         """
         try:
             # Extract relevant data
@@ -27,28 +31,32 @@ class PrepTrackerService:
             allergens = data.get('allergens', [])
             notes = data.get('notes', '')
             tray_id = data.get('tray_id')
+            station = data.get('station')
             
             # Calculate expiry date (default to 7 days from prep date)
             expiry_date = prep_date + timedelta(days=7)
             
-            # Print the label
-            success = self.label_printer.print_label(
+            # Queue the label for printing
+            job_id = await self.label_printer.print_label(
                 dish_name=dish_name,
                 prep_date=prep_date,
                 expiry_date=expiry_date,
                 ingredients=ingredients,
                 allergens=allergens,
                 notes=notes,
-                tray_id=tray_id
+                tray_id=tray_id,
+                station=station
             )
             
-            if success:
-                logger.info(f"Successfully printed label for {dish_name} (Tray: {tray_id})")
+            if job_id:
+                logger.info(f"Queued label for {dish_name} (Tray: {tray_id}) as job {job_id}")
             else:
-                logger.error(f"Failed to print label for {dish_name} (Tray: {tray_id})")
+                logger.error(f"Failed to queue label for {dish_name} (Tray: {tray_id})")
                 
-            return success
+            return job_id
             
+        except SpoolFullError:
+            raise
         except Exception as e:
             logger.error(f"Error handling prep tracker data: {str(e)}")
-            return False 
\ No newline at end of file
+            return None 
\ No newline at end of file
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .printer_health import PrinterHealth
+
+logger = logging.getLogger(__name__)
+
+class PrintDispatcher:
+    """
+    Sends print requests to the Android printer app without blocking the
+    event loop.
+
+    A single ``httpx.AsyncClient`` keeps a small pool of keep-alive
+    connections to the phone, so consecutive labels reuse an open connection
+    instead of paying for a new TCP handshake each time. Connect and read
+    timeouts are separate: an unreachable phone fails within the connect
+    timeout, while a reachable phone that is busy printing gets the longer
+    read timeout.
+
+    Every request feeds ``health``; once its circuit opens, requests raise
+    ``PrinterUnavailableError`` immediately instead of waiting on a phone
+    that is asleep or off Wi-Fi. ``start_probing`` keeps the cached health
+    fresh in the background and closes the circuit as soon as the phone
+    answers again.
+    """
+
+    def __init__(self, base_url: str, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_connections: int = 4,
+                 health: Optional[PrinterHealth] = None):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(
+            os.environ.get('PRINTER_CONNECT_TIMEOUT', '2.0'))
+        self.read_timeout = read_timeout if read_timeout is not None else float(
+            os.environ.get('PRINTER_READ_TIMEOUT', '10.0'))
+        self.max_connections = max_connections
+        self.health = health or PrinterHealth(self.base_url)
+        self.probe_path = os.environ.get('PRINTER_HEALTH_PATH', '/health')
+        self.probe_interval = float(os.environ.get('PRINTER_HEALTH_INTERVAL', '15'))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._prober: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=30.0,
+                ),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.TransportError as e:
+            # Connection refused, timeouts and the like; HTTP error statuses still mean reachable
+            self.health.record_failure(e)
+            raise
+        self.health.record_success((time.perf_counter() - started) * 1000)
+        return response
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POST a JSON payload to the printer app. Raises httpx errors on failure
+        and ``PrinterUnavailableError`` while the circuit is open.
+        """
+        self.health.before_request()
+        return await self._request("POST", path, json=payload)
+
+    async def get(self, path: str, timeout: Optional[float] = None) -> httpx.Response:
+        """
+        GET from the printer app. Raises httpx errors on failure and
+        ``PrinterUnavailableError`` while the circuit is open.
+        """
+        self.health.before_request()
+        if timeout is None:
+            return await self._request("GET", path)
+        return await self._request("GET", path, timeout=timeout)
+
+    async def probe(self) -> Dict[str, Any]:
+        """Check reachability now, bypassing the circuit, and return the cached health."""
+        try:
+            await self._request("GET", self.probe_path, timeout=self.connect_timeout)
+        except httpx.TransportError:
+            pass
+        return self.health.snapshot()
+
+    def start_probing(self):
+        if self._prober is None or self._prober.done():
+            self._prober = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.error(f"Error probing printer at {self.base_url}: {str(e)}")
+            await asyncio.sleep(self.probe_interval)
+
+    async def close(self):
+        if self._prober is not None:
+            self._prober.cancel()
+            await asyncio.gather(self._prober, return_exceptions=True)
+            self._prober = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
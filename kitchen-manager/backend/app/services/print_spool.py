@@ -0,0 +1,509 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from itertools import chain
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+from .printer_health import PrinterUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Paths whose jobs can be coalesced into one batched request, and where to send the batch
+BATCH_PATHS = {"/print-label": "/print-labels"}
+
+# Most spool slots one directory can have, i.e. workers sharing it
+MAX_SPOOL_SLOTS = 32
+
+class SpoolFullError(Exception):
+    """Raised when a printer's queue is full and new jobs must back off."""
+
+    def __init__(self, printer_id: str, depth: int, retry_after: float):
+        super().__init__(f"Print queue for printer {printer_id} is full ({depth} jobs)")
+        self.printer_id = printer_id
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class _SpoolJournal:
+    """
+    Append-only journal of spool operations, replayed on startup so that
+    queued jobs survive restarts. Rewritten atomically once finished jobs
+    dominate it.
+
+    A journal belongs to one process. Each process claims a slot by taking
+    an exclusive flock on the slot's ``spool.lock``: the first slot is
+    ``spool_dir`` itself and further ones are ``spool_dir/worker-N``, so
+    several uvicorn workers each replay and print only their own jobs. A
+    restarted worker claims a free slot again and carries on with the jobs
+    left in it. Jobs left in a slot that nobody claims any more, e.g. after
+    the worker count went down, are adopted by the next process to start.
+    """
+
+    def __init__(self, spool_dir: str):
+        self._lock_fd = None
+        self.base_dir = spool_dir
+        self.spool_dir = self._claim_slot(spool_dir)
+        self.path = os.path.join(self.spool_dir, "spool.log")
+        self._lock = threading.Lock()
+        self._records = 0
+
+    @staticmethod
+    def _slot_dir(spool_dir: str, slot: int) -> str:
+        return spool_dir if slot == 0 else os.path.join(spool_dir, f"worker-{slot}")
+
+    @staticmethod
+    def _try_lock(slot_dir: str) -> Optional[int]:
+        """Take the slot's lock without waiting; None if another process holds it."""
+        fd = os.open(os.path.join(slot_dir, "spool.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _claim_slot(self, spool_dir: str) -> str:
+        for slot in range(MAX_SPOOL_SLOTS):
+            slot_dir = self._slot_dir(spool_dir, slot)
+            os.makedirs(slot_dir, exist_ok=True)
+            if fcntl is None:
+                return slot_dir
+            fd = self._try_lock(slot_dir)
+            if fd is None:
+                # Another worker owns this slot
+                continue
+            self._lock_fd = fd
+            if slot:
+                logger.info(f"Print spool using slot {slot_dir}")
+            return slot_dir
+        raise RuntimeError(f"All {MAX_SPOOL_SLOTS} print spool slots in {spool_dir} are in use")
+
+    def close(self):
+        """Release the slot for another process."""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def replay(self) -> "OrderedDict[str, Dict[str, Any]]":
+        """Return unfinished jobs in submission order."""
+        jobs, records = self._read(self.path)
+        self._records += records
+        return jobs
+
+    def adopt_orphans(self) -> "OrderedDict[str, Dict[str, Any]]":
+        """
+        Move the jobs of every unclaimed slot into this journal and return
+        them. Each slot is locked while it is read, so a worker starting at
+        the same time cannot claim it halfway through. The jobs are
+        journaled here before the slot's journal is removed; a crash in
+        between adopts them again under the same IDs.
+        """
+        adopted: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        if fcntl is None:
+            return adopted
+        for slot in range(MAX_SPOOL_SLOTS):
+            slot_dir = self._slot_dir(self.base_dir, slot)
+            path = os.path.join(slot_dir, "spool.log")
+            if slot_dir == self.spool_dir or not os.path.exists(path):
+                continue
+            fd = self._try_lock(slot_dir)
+            if fd is None:
+                continue
+            try:
+                jobs, _ = self._read(path)
+                if jobs:
+                    self.append([{"op": "put", "job": job} for job in jobs.values()])
+                    logger.info(f"Adopted {len(jobs)} print jobs from unclaimed spool slot {slot_dir}")
+                os.unlink(path)
+            finally:
+                os.close(fd)
+            adopted.update(jobs)
+        return adopted
+
+    @staticmethod
+    def _read(path: str) -> Tuple["OrderedDict[str, Dict[str, Any]]", int]:
+        """Unfinished jobs in a journal file, and how many records it holds."""
+        jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        records = 0
+        if not os.path.exists(path):
+            return jobs, records
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn tail from a crash mid-append
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records += 1
+                if record["op"] == "put":
+                    jobs[record["job"]["id"]] = record["job"]
+                elif record["op"] == "update" and record["id"] in jobs:
+                    jobs[record["id"]].update(record["fields"])
+                elif record["op"] == "done":
+                    jobs.pop(record["id"], None)
+        return jobs, records
+
+    def append(self, records: List[Dict[str, Any]]):
+        payload = b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in records)
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._records += len(records)
+
+    def rewrite(self, jobs: List[Dict[str, Any]]):
+        """Atomically replace the journal with the given live jobs."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                for job in jobs:
+                    f.write(json.dumps({"op": "put", "job": job}, separators=(",", ":")).encode() + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._records = len(jobs)
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+
+class PrintSpool:
+    """
+    Durable print queue in front of the Android printer app.
+
+    Jobs are journaled to disk before they are acknowledged and are only
+    removed once the printer has accepted them, so nothing is lost across
+    restarts or while the phone is unreachable. Each printer has its own FIFO
+    worker: consecutive label jobs are coalesced into one batched request,
+    failures are retried with exponential backoff and jitter, and once a
+    printer's queue reaches ``max_depth`` new jobs are refused with
+    ``SpoolFullError`` so callers can back off. Jobs that use up their
+    attempts leave the queue; the last ``max_failed`` of them are kept,
+    journaled, for inspection.
+
+    With an event bus, job state changes are published on the ``jobs`` topic.
+    While a printer's circuit is open its jobs move to the printer named by
+    ``failover``, if it names one, or else wait without using up their
+    attempts.
+    """
+
+    def __init__(self, dispatcher_for: Callable[[str], Any], spool_dir: str = None,
+                 max_depth: int = None, max_batch: int = None, max_attempts: int = None,
+                 base_delay: float = 0.5, max_delay: float = 30.0, event_bus=None,
+                 failover: Callable[[str], Optional[str]] = None, max_failed: int = None):
+        self.dispatcher_for = dispatcher_for
+        self.failover = failover
+        self.event_bus = event_bus
+        self.max_depth = max_depth or int(os.environ.get('PRINT_SPOOL_MAX_DEPTH', '200'))
+        self.max_batch = max_batch or int(os.environ.get('PRINT_SPOOL_MAX_BATCH', '10'))
+        self.max_attempts = max_attempts or int(os.environ.get('PRINT_SPOOL_MAX_ATTEMPTS', '8'))
+        self.max_failed = max_failed or int(os.environ.get('PRINT_SPOOL_MAX_FAILED', '100'))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._journal = _SpoolJournal(spool_dir or os.environ.get('PRINT_SPOOL_DIR', 'data/spool'))
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = self._journal.replay()
+        for job_id, job in self._journal.adopt_orphans().items():
+            self._jobs.setdefault(job_id, job)
+        self._queues: Dict[str, Deque[str]] = {}
+        # Jobs that gave up, most recent last
+        self._failed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for job in list(self._jobs.values()):
+            if job["state"] == "failed":
+                self._remember_failed(self._jobs.pop(job["id"]))
+            else:
+                job["state"] = "queued"
+                self._queues.setdefault(job["printer"], deque()).append(job["id"])
+        if self._jobs:
+            logger.info(f"Recovered {len(self._jobs)} print jobs from the spool")
+        # Serialises journal writes, so a compaction's snapshot and rewrite see no append in between
+        self._journal_lock = asyncio.Lock()
+
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        # Printers that answered 404 to a batched request get one job per request
+        self._no_batch: set = set()
+        self.completed = 0
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        """Start workers for every printer with recovered jobs."""
+        for printer_id in self._queues:
+            self._ensure_worker(printer_id)
+
+    async def stop(self):
+        """Stop the workers. Jobs still queued stay in the journal."""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def close(self):
+        """Stop the workers and release the spool slot."""
+        await self.stop()
+        self._journal.close()
+
+    def _ensure_worker(self, printer_id: str):
+        task = self._workers.get(printer_id)
+        if task is None or task.done():
+            self._wakeups.setdefault(printer_id, asyncio.Event())
+            self._workers[printer_id] = asyncio.create_task(self._run(printer_id))
+
+    # -- submission ----------------------------------------------------------
+
+    async def submit(self, printer_id: str, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Durably queue a print request and return the job record."""
+        queue = self._queues.setdefault(printer_id, deque())
+        if len(queue) >= self.max_depth:
+            raise SpoolFullError(printer_id, len(queue), retry_after=self._retry_after(printer_id))
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "printer": printer_id,
+            "path": path,
+            "payload": payload,
+            "state": "queued",
+            "attempts": 0,
+            "created_at": time.time(),
+            "next_attempt_at": 0.0,
+            "last_error": None,
+        }
+        # Track the job before journaling so a concurrent compaction keeps it
+        self._jobs[job["id"]] = job
+        try:
+            await self._append([{"op": "put", "job": job}])
+        except Exception:
+            self._jobs.pop(job["id"], None)
+            raise
+        queue.append(job["id"])
+
+        self._ensure_worker(printer_id)
+        self._wakeups[printer_id].set()
+        self._publish_job("job.created", job)
+        return job
+
+    def _publish_job(self, type: str, job: Dict[str, Any]):
+        if self.event_bus is not None:
+            self.event_bus.publish("jobs", type, {
+                "source": "spool",
+                **{k: job[k] for k in ("id", "printer", "path", "state", "attempts", "last_error")},
+            })
+
+    def _retry_after(self, printer_id: str) -> float:
+        head = self._head(printer_id)
+        if head is None:
+            return 1.0
+        return max(1.0, head["next_attempt_at"] - time.time())
+
+    # -- worker ----------------------------------------------------------------
+
+    def _head(self, printer_id: str) -> Optional[Dict[str, Any]]:
+        queue = self._queues.get(printer_id)
+        return self._jobs[queue[0]] if queue else None
+
+    def _take_batch(self, printer_id: str) -> List[Dict[str, Any]]:
+        """The head job plus any directly following jobs that can share its request."""
+        queue = self._queues[printer_id]
+        head = self._jobs[queue[0]]
+        batch = [head]
+        if head["path"] in BATCH_PATHS and printer_id not in self._no_batch:
+            for job_id in list(queue)[1:self.max_batch]:
+                job = self._jobs[job_id]
+                if job["path"] != head["path"]:
+                    break
+                batch.append(job)
+        return batch
+
+    async def _run(self, printer_id: str):
+        wakeup = self._wakeups[printer_id]
+        while True:
+            head = self._head(printer_id)
+            if head is None:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            delay = head["next_attempt_at"] - time.time()
+            if delay > 0:
+                # Backing off after a failure; new submissions do not cut the wait short
+                await asyncio.sleep(delay)
+                continue
+
+            batch = self._take_batch(printer_id)
+            for job in batch:
+                job["state"] = "printing"
+            try:
+                await self._send(printer_id, batch)
+            except asyncio.CancelledError:
+                for job in batch:
+                    job["state"] = "queued"
+                raise
+            except PrinterUnavailableError as e:
+                # Circuit is open: hold the queue until the printer is back or may be
+                for job in batch:
+                    job["state"] = "queued"
+                target = self.failover(printer_id) if self.failover else None
+                if target:
+                    await self._move_queue(printer_id, target)
+                else:
+                    await self._wait_for_printer(printer_id, e.retry_after)
+            except Exception as e:
+                await self._fail(printer_id, batch, e)
+            else:
+                await self._complete(printer_id, batch)
+
+    async def _move_queue(self, printer_id: str, target: str):
+        """Hand every queued job for ``printer_id`` to ``target``, keeping their order."""
+        # Take and clear the queue without yielding: jobs submitted during the
+        # journal write below stay queued here and are moved on the next pass
+        queue = self._queues[printer_id]
+        moved = [self._jobs[job_id] for job_id in queue]
+        queue.clear()
+        target_queue = self._queues.setdefault(target, deque())
+        for job in moved:
+            job["printer"] = target
+            job["next_attempt_at"] = 0.0
+            target_queue.append(job["id"])
+        await self._append([
+            {"op": "update", "id": job["id"], "fields": {"printer": target, "next_attempt_at": 0.0}}
+            for job in moved
+        ])
+        logger.warning(f"Printer {printer_id} is unavailable, moved {len(moved)} job(s) to {target}")
+        self._ensure_worker(target)
+        self._wakeups[target].set()
+
+    async def _wait_for_printer(self, printer_id: str, timeout: float):
+        health = getattr(self.dispatcher_for(printer_id), "health", None)
+        if health is None:
+            await asyncio.sleep(timeout)
+        else:
+            await health.wait_until_closed(timeout)
+
+    async def _send(self, printer_id: str, batch: List[Dict[str, Any]]):
+        dispatcher = self.dispatcher_for(printer_id)
+        if len(batch) > 1:
+            response = await dispatcher.post(
+                BATCH_PATHS[batch[0]["path"]], {"labels": [job["payload"] for job in batch]}
+            )
+            if response.status_code in (404, 405, 501):
+                # The printer app has no batch endpoint; send this head job alone
+                logger.info(f"Printer {printer_id} does not accept batched labels, sending one at a time")
+                self._no_batch.add(printer_id)
+                for job in batch[1:]:
+                    job["state"] = "queued"
+                del batch[1:]
+            else:
+                self._check(response)
+                return
+        self._check(await dispatcher.post(batch[0]["path"], batch[0]["payload"]))
+
+    @staticmethod
+    def _check(response: httpx.Response):
+        if response.status_code != 200:
+            raise RuntimeError(f"Printer responded with HTTP {response.status_code}")
+
+    async def _complete(self, printer_id: str, batch: List[Dict[str, Any]]):
+        await self._append([{"op": "done", "id": job["id"]} for job in batch])
+        queue = self._queues[printer_id]
+        for job in batch:
+            queue.popleft()
+            job["state"] = "done"
+            self._jobs.pop(job["id"], None)
+            self._publish_job("job.state", job)
+        self.completed += len(batch)
+        logger.info(f"Printed {len(batch)} spooled job(s) on printer {printer_id}")
+        await self._maybe_compact()
+
+    async def _fail(self, printer_id: str, batch: List[Dict[str, Any]], error: Exception):
+        # Only the head job is charged with the attempt; the rest keep their place
+        head = batch[0]
+        for job in batch[1:]:
+            job["state"] = "queued"
+        head["attempts"] += 1
+        head["last_error"] = str(error) or type(error).__name__
+        if head["attempts"] >= self.max_attempts:
+            head["state"] = "failed"
+            self._queues[printer_id].popleft()
+            self._remember_failed(self._jobs.pop(head["id"]))
+            logger.error(f"Giving up on print job {head['id']} after {head['attempts']} attempts: {error}")
+        else:
+            backoff = min(self.max_delay, self.base_delay * (2 ** (head["attempts"] - 1)))
+            head["state"] = "queued"
+            head["next_attempt_at"] = time.time() + backoff * random.uniform(0.5, 1.5)
+            logger.warning(
+                f"Print job {head['id']} failed (attempt {head['attempts']}), "
+                f"retrying in {head['next_attempt_at'] - time.time():.1f}s: {error}"
+            )
+        self._publish_job("job.state", head)
+        await self._append([{
+            "op": "update",
+            "id": head["id"],
+            "fields": {k: head[k] for k in ("state", "attempts", "next_attempt_at", "last_error")},
+        }])
+        if head["state"] == "failed":
+            await self._maybe_compact()
+
+    def _remember_failed(self, job: Dict[str, Any]):
+        self._failed[job["id"]] = job
+        while len(self._failed) > self.max_failed:
+            self._failed.popitem(last=False)
+
+    async def _append(self, records: List[Dict[str, Any]]):
+        async with self._journal_lock:
+            await asyncio.to_thread(self._journal.append, records)
+
+    async def _maybe_compact(self):
+        retained = len(self._jobs) + len(self._failed)
+        if self._journal.records > 1000 and self._journal.records > 4 * retained:
+            async with self._journal_lock:
+                # Snapshot under the lock: appends issued meanwhile land after the rewrite
+                jobs = [dict(job) for job in chain(self._failed.values(), self._jobs.values())]
+                await asyncio.to_thread(self._journal.rewrite, jobs)
+
+    # -- introspection ---------------------------------------------------------
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return job if job is not None else self._failed.get(job_id)
+
+    def depth(self, printer_id: str) -> int:
+        return len(self._queues.get(printer_id, ()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, oldest job age and failure counts per printer."""
+        now = time.time()
+        printers = {}
+        for printer_id, queue in self._queues.items():
+            head = self._head(printer_id)
+            printers[printer_id] = {
+                "depth": len(queue),
+                "oldest_age_seconds": round(now - head["created_at"], 3) if head else 0.0,
+                "head_attempts": head["attempts"] if head else 0,
+                "next_attempt_in_seconds": round(max(0.0, head["next_attempt_at"] - now), 3) if head else 0.0,
+                "last_error": head["last_error"] if head else None,
+                "accepting": len(queue) < self.max_depth,
+            }
+        return {
+            "max_depth": self.max_depth,
+            "completed": self.completed,
+            "failed": len(self._failed),
+            "printers": printers,
+        }
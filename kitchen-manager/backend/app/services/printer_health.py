@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class PrinterUnavailableError(Exception):
+    """Raised instead of sending a request while a printer's circuit is open."""
+
+    def __init__(self, printer_id: str, retry_after: float):
+        super().__init__(f"Printer {printer_id} is unreachable, retry in {retry_after:.0f}s")
+        self.printer_id = printer_id
+        self.retry_after = retry_after
+
+
+class PrinterHealth:
+    """
+    Cached reachability and latency of one printer, plus a circuit breaker.
+
+    After ``failure_threshold`` consecutive connection failures the circuit
+    opens and requests fail immediately with ``PrinterUnavailableError``
+    rather than each waiting out the connect timeout. After
+    ``reset_timeout`` seconds a single trial request is let through
+    (half-open); its outcome closes or re-opens the circuit. A successful
+    background probe closes the circuit straight away.
+    """
+
+    def __init__(self, printer_id: str, failure_threshold: int = None,
+                 reset_timeout: float = None, event_bus=None):
+        self.printer_id = printer_id
+        self.failure_threshold = failure_threshold or int(os.environ.get('PRINTER_FAILURE_THRESHOLD', '3'))
+        self.reset_timeout = reset_timeout or float(os.environ.get('PRINTER_CIRCUIT_RESET', '30'))
+        self.event_bus = event_bus
+
+        self.status = "unknown"
+        self.circuit = "closed"
+        self.latency_ms: Optional[float] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._closed = asyncio.Event()
+        self._closed.set()
+
+    def before_request(self):
+        """Let a request through, or raise ``PrinterUnavailableError`` if the circuit is open."""
+        if self.circuit == "closed":
+            return
+        remaining = self._opened_at + self.reset_timeout - time.time()
+        if remaining > 0:
+            raise PrinterUnavailableError(self.printer_id, max(1.0, remaining))
+        # Let this request through as the trial; others keep failing fast until it
+        # reports back, or for another reset_timeout if it never does
+        self.circuit = "half_open"
+        self._opened_at = time.time()
+
+    def record_success(self, latency_ms: float):
+        self.latency_ms = round(latency_ms, 1)
+        self.last_checked = time.time()
+        self.last_error = None
+        self.consecutive_failures = 0
+        if self.circuit != "closed":
+            logger.info(f"Printer {self.printer_id} is reachable again, closing circuit")
+            self.circuit = "closed"
+            self._closed.set()
+        self._set_status("ready")
+
+    def record_failure(self, error: Exception):
+        self.last_checked = time.time()
+        self.last_error = str(error) or type(error).__name__
+        self.consecutive_failures += 1
+        if self.circuit == "half_open" or (
+                self.circuit == "closed" and self.consecutive_failures >= self.failure_threshold):
+            logger.warning(
+                f"Printer {self.printer_id} unreachable after {self.consecutive_failures} failures, "
+                f"opening circuit for {self.reset_timeout:.0f}s: {self.last_error}"
+            )
+            self.circuit = "open"
+            self._opened_at = time.time()
+            self._closed.clear()
+        self._set_status("unreachable")
+
+    async def wait_until_closed(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the circuit to close. Returns whether it did."""
+        try:
+            await asyncio.wait_for(self._closed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _set_status(self, status: str):
+        if status == self.status:
+            return
+        self.status = status
+        if self.event_bus is not None:
+            self.event_bus.publish("printer", "printer.status", self.snapshot())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "printer": self.printer_id,
+            "status": self.status,
+            "circuit": self.circuit,
+            "latency_ms": self.latency_ms,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+        }
@@ -0,0 +1,172 @@
+import itertools
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from .label_raster import DEFAULT_DOT_WIDTH
+from .print_dispatcher import PrintDispatcher
+from .printer_health import PrinterHealth
+
+logger = logging.getLogger(__name__)
+
+# Printer ID used when no registry file is configured: the single printer at LABEL_DETECTOR_URL
+DEFAULT_PRINTER_ID = "default"
+
+DEFAULT_SETTINGS = {
+    'linesPerFeed': 3,
+    'fontSize': 1.0,
+    'fontStyle': 'normal',
+    'alignment': 'left',
+    'useQRCode': False,
+    'printLogo': False,
+    'darkMode': False,
+    # Send a ready-to-print 1-bit raster rendered at the head's dot width
+    'rasterize': False,
+    'dotWidth': DEFAULT_DOT_WIDTH
+}
+
+class PrinterNotFoundError(LookupError):
+    """Raised when a printer ID is not in the registry."""
+
+
+class Printer:
+    """One label printer: where it is, what it serves and how it prints."""
+
+    def __init__(self, printer_id: str, url: str, stations: List[str] = None,
+                 trays: List[str] = None, settings: Dict[str, Any] = None, event_bus=None):
+        self.id = printer_id
+        self.url = url
+        self.stations = list(stations or [])
+        self.trays = list(trays or [])
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.dispatcher = PrintDispatcher(url, health=PrinterHealth(printer_id, event_bus=event_bus))
+
+    @property
+    def health(self) -> PrinterHealth:
+        return self.dispatcher.health
+
+    @property
+    def pool(self):
+        """Printers with the same stations and trays are interchangeable."""
+        return (frozenset(self.stations), frozenset(self.trays))
+
+    @property
+    def general(self) -> bool:
+        """A printer not tied to any station or tray takes everything else."""
+        return not self.stations and not self.trays
+
+    def serves(self, station: Optional[str], tray_id: Optional[str]) -> bool:
+        if station:
+            return station in self.stations
+        return bool(tray_id) and tray_id in self.trays
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "stations": self.stations,
+            "trays": self.trays,
+            "settings": self.settings,
+        }
+
+
+class PrinterRegistry:
+    """
+    The kitchen's label printers, loaded from the JSON file at
+    PRINTERS_CONFIG::
+
+        [{"id": "prep-1", "url": "http://10.0.0.21:8080", "stations": ["prep"],
+          "trays": [], "settings": {"dotWidth": 576}}, ...]
+
+    Without that file there is one printer, ``default``, at
+    LABEL_DETECTOR_URL, as before.
+
+    Jobs are routed by station, then by tray, then to the general printers.
+    Among the matching printers, those whose circuit is closed are
+    preferred, and of those the one with the shortest queue wins, so load
+    spreads across interchangeable printers and fails over when one goes
+    down.
+    """
+
+    def __init__(self, config_path: str = None, event_bus=None):
+        self.config_path = config_path or os.environ.get('PRINTERS_CONFIG')
+        self.printers: Dict[str, Printer] = {}
+        self._round_robin = itertools.count()
+
+        if self.config_path and os.path.exists(self.config_path):
+            with open(self.config_path, 'r') as f:
+                entries = json.load(f)
+            for entry in entries:
+                printer = Printer(
+                    entry["id"], entry["url"],
+                    stations=entry.get("stations"),
+                    trays=entry.get("trays"),
+                    settings=entry.get("settings"),
+                    event_bus=event_bus,
+                )
+                self.printers[printer.id] = printer
+            logger.info(f"Loaded {len(self.printers)} printers from {self.config_path}")
+        else:
+            if self.config_path:
+                logger.warning(f"Printer registry {self.config_path} not found, using LABEL_DETECTOR_URL")
+            url = os.environ.get('LABEL_DETECTOR_URL', 'http://localhost:8080')
+            self.printers[DEFAULT_PRINTER_ID] = Printer(DEFAULT_PRINTER_ID, url, event_bus=event_bus)
+
+        if not self.printers:
+            raise ValueError(f"No printers configured in {self.config_path}")
+        self.default = self.printers.get(DEFAULT_PRINTER_ID) or next(iter(self.printers.values()))
+
+    def get(self, printer_id: str) -> Printer:
+        try:
+            return self.printers[printer_id]
+        except KeyError:
+            raise PrinterNotFoundError(f"Printer {printer_id} not found")
+
+    def all(self) -> List[Printer]:
+        return list(self.printers.values())
+
+    def dispatcher_for(self, printer_id: str) -> PrintDispatcher:
+        # Jobs spooled for a printer that has since been removed go to the default one
+        printer = self.printers.get(printer_id) or self.default
+        return printer.dispatcher
+
+    def candidates(self, station: Optional[str] = None, tray_id: Optional[str] = None) -> List[Printer]:
+        """Printers that may print a job for this station or tray."""
+        printers = self.all()
+        matching = [p for p in printers if p.serves(station, tray_id)]
+        if not matching and station and tray_id:
+            matching = [p for p in printers if p.serves(None, tray_id)]
+        return matching or [p for p in printers if p.general] or printers
+
+    def route(self, station: Optional[str] = None, tray_id: Optional[str] = None,
+              depth: Callable[[str], int] = None) -> Printer:
+        """
+        Pick the printer for a job: the least loaded healthy printer serving
+        the station or tray. If none of them is healthy the job still goes to
+        one of them and waits in its queue.
+        """
+        candidates = self.candidates(station, tray_id)
+        healthy = [p for p in candidates if p.health.circuit == "closed"] or candidates
+        if len(healthy) == 1 or depth is None:
+            return healthy[0]
+        # Break ties between equally loaded printers in turn
+        offset = next(self._round_robin)
+        return min(
+            (healthy[(offset + i) % len(healthy)] for i in range(len(healthy))),
+            key=lambda p: depth(p.id)
+        )
+
+    def failover_for(self, printer_id: str) -> Optional[str]:
+        """A healthy printer interchangeable with ``printer_id``, if there is one."""
+        printer = self.printers.get(printer_id)
+        if printer is None:
+            return None
+        for other in self.printers.values():
+            if other.id != printer_id and other.pool == printer.pool and other.health.circuit == "closed":
+                return other.id
+        return None
+
+    async def close(self):
+        for printer in self.printers.values():
+            await printer.dispatcher.close()
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class RecipeUpstreamError(Exception):
+    """The recipe-upscaler could not be reached and no cached copy is available."""
+
+
+class CachedRecipes:
+    __slots__ = ("body", "etag", "upstream_etag", "fetched_at")
+
+    def __init__(self, body: bytes, upstream_etag: Optional[str]):
+        self.body = body
+        self.upstream_etag = upstream_etag
+        # Our own validator for clients; the upstream one only revalidates with upstream
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class RecipeCache:
+    """
+    Keeps the recipe-upscaler's recipe list in memory for the prep tablets.
+
+    A cached list is served as-is for ``ttl`` seconds. After that the next
+    request revalidates it with ``If-None-Match``, so an unchanged list costs
+    upstream a 304 instead of a full response. Requests arriving while a
+    fetch is in flight wait on that fetch instead of starting their own,
+    which keeps upstream at one request per TTL window however many tablets
+    load recipes at once.
+
+    If upstream fails or answers with an error, the last good list is served
+    and retried after ``error_ttl`` seconds; only with nothing cached does
+    the failure reach the caller, as ``RecipeUpstreamError``. Creating or
+    deleting a recipe through ``create`` and ``delete`` expires the cached
+    list, and a fetch that was already in flight when that happened is not
+    trusted as fresh.
+    """
+
+    def __init__(self, base_url: str, ttl: Optional[float] = None, error_ttl: Optional[float] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl if ttl is not None else float(os.environ.get('RECIPE_CACHE_TTL', '30'))
+        self.error_ttl = error_ttl if error_ttl is not None else float(
+            os.environ.get('RECIPE_CACHE_ERROR_TTL', '5'))
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(
+            os.environ.get('RECIPE_UPSTREAM_CONNECT_TIMEOUT', '2.0'))
+        self.read_timeout = read_timeout if read_timeout is not None else float(
+            os.environ.get('RECIPE_UPSTREAM_READ_TIMEOUT', '10.0'))
+        self._cached: Optional[CachedRecipes] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._refresh: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=30.0),
+            )
+        return self._client
+
+    async def recipes(self) -> Tuple[CachedRecipes, str]:
+        """
+        The recipe list, and how it was served: ``hit`` from the cache,
+        ``miss`` freshly fetched, ``revalidated`` confirmed unchanged by
+        upstream, or ``stale`` because upstream failed.
+        """
+        if self._cached is not None and time.monotonic() < self._expires_at:
+            return self._cached, "hit"
+        if self._refresh is None:
+            task = asyncio.create_task(self._fetch())
+            task.add_done_callback(self._refresh_done)
+            self._refresh = task
+        # Shielded so a tablet disconnecting does not cancel the fetch others are waiting on
+        return await asyncio.shield(self._refresh)
+
+    def _refresh_done(self, task: asyncio.Task):
+        if self._refresh is task:
+            self._refresh = None
+        if not task.cancelled():
+            # Retrieved here in case every waiter went away
+            task.exception()
+
+    async def _fetch(self) -> Tuple[CachedRecipes, str]:
+        generation = self._generation
+        cached = self._cached
+        headers = {"If-None-Match": cached.upstream_etag} if cached is not None and cached.upstream_etag else {}
+        try:
+            response = await self.client.get("/api/recipes", headers=headers)
+        except httpx.HTTPError as e:
+            return self._fall_back(f"Error fetching recipes: {str(e)}", generation)
+
+        if response.status_code == 304 and cached is not None:
+            cached.fetched_at = time.monotonic()
+            status = "revalidated"
+        elif response.status_code == 200:
+            try:
+                json.loads(response.content)
+            except ValueError:
+                return self._fall_back("Recipe-upscaler returned a recipe list that is not JSON", generation)
+            cached = CachedRecipes(response.content, response.headers.get("etag"))
+            status = "miss"
+        else:
+            return self._fall_back(f"Failed to fetch recipes from recipe-upscaler: {response.status_code}", generation)
+
+        if generation == self._generation:
+            self._cached = cached
+            self._expires_at = time.monotonic() + self.ttl
+        else:
+            # Recipes changed while this was in flight; answer the waiters but fetch again next time
+            logger.info("Recipes changed during fetch, not caching the result")
+        return cached, status
+
+    def _fall_back(self, message: str, generation: int) -> Tuple[CachedRecipes, str]:
+        if self._cached is None:
+            logger.error(message)
+            raise RecipeUpstreamError(message)
+        logger.warning(f"{message}; serving recipes cached {self._cached.age:.0f}s ago")
+        if generation == self._generation:
+            # Back off instead of sending every request to a failing upstream
+            self._expires_at = time.monotonic() + self.error_ttl
+        return self._cached, "stale"
+
+    def invalidate(self):
+        """
+        Make the next request fetch the list again. The old list is kept to
+        fall back on if upstream fails.
+        """
+        self._generation += 1
+        self._expires_at = 0.0
+        # A fetch already in flight may predate the change; later requests start their own
+        self._refresh = None
+
+    async def create(self, recipe: Dict[str, Any]) -> httpx.Response:
+        """Create a recipe upstream. Raises httpx errors on failure."""
+        response = await self.client.post("/api/recipes", json=recipe)
+        if response.is_success:
+            self.invalidate()
+        return response
+
+    async def delete(self, recipe_id: str) -> httpx.Response:
+        """Delete a recipe upstream. Raises httpx errors on failure."""
+        response = await self.client.delete(f"/api/recipes/{recipe_id}")
+        if response.is_success:
+            self.invalidate()
+        return response
+
+    async def close(self):
+        if self._refresh is not None:
+            self._refresh.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,156 @@
+import asyncio
+import gc
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from .prep_state import PrepState
+from .state_store import TraySelection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+class StateSnapshots:
+    """
+    Saves the prep state and tray selection to disk so a restart picks up
+    where the last run left off, instead of showing "Unknown" dishes until
+    the prep-tracker app next posts.
+
+    The snapshot is one compact JSON file at PREP_SNAPSHOT_PATH, replaced
+    atomically (temporary file, fsync, rename) so a crash never leaves a
+    torn file. While running, the state is checked every
+    PREP_SNAPSHOT_INTERVAL seconds and written only if it changed, so a
+    burst of updates costs one write. A final snapshot is written on close.
+
+    ``start`` restores the snapshot before the server accepts requests.
+    State that already exists (sent by the app, or restored by another
+    worker sharing the state store) is never overwritten.
+    """
+
+    def __init__(self, prep_state: PrepState, selection: TraySelection,
+                 path: str = None, interval: float = None):
+        self.prep_state = prep_state
+        self.selection = selection
+        self.path = path if path is not None else os.environ.get('PREP_SNAPSHOT_PATH', 'data/prep_snapshot.json')
+        self.interval = interval or float(os.environ.get('PREP_SNAPSHOT_INTERVAL', '2'))
+        # (prep seq, selection version) of the state last written or restored
+        self._saved: Optional[Tuple[int, Optional[Hashable]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def start(self):
+        """Restore the last snapshot and start saving changes."""
+        if not self.enabled:
+            return
+        self.restore()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"Error saving prep state snapshot: {str(e)}")
+
+    # -- restore -----------------------------------------------------------
+
+    def restore(self) -> bool:
+        """Load the snapshot file into empty state. Returns whether anything was restored."""
+        started = time.perf_counter()
+        # A snapshot is hundreds of thousands of small objects; collecting
+        # garbage while they are allocated roughly doubles the restore time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            try:
+                with open(self.path, 'rb') as f:
+                    snapshot = json.loads(f.read())
+            except FileNotFoundError:
+                return False
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring unreadable prep state snapshot {self.path}: {str(e)}")
+                return False
+            if snapshot.get("format") != SNAPSHOT_FORMAT:
+                logger.warning(f"Ignoring prep state snapshot {self.path} in unknown format {snapshot.get('format')}")
+                return False
+            restored_prep = self.prep_state.restore(snapshot["prep"])
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        restored_selection = False
+        if self.selection.version is None and snapshot["selected_trays"]:
+            self.selection.replace(snapshot["selected_trays"])
+            restored_selection = True
+        self._saved = self._state_version()
+        if restored_prep or restored_selection:
+            logger.info(
+                f"Restored prep state from {self.path} (saved {snapshot['saved_at']}): "
+                f"{len(snapshot['prep']['dishes'])} dishes at seq {snapshot['prep']['seq']}, "
+                f"{len(snapshot['selected_trays'])} selected trays in "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+        return restored_prep or restored_selection
+
+    # -- save --------------------------------------------------------------
+
+    def _state_version(self) -> Tuple[int, Optional[Hashable]]:
+        return (self.prep_state.seq, self.selection.version)
+
+    async def save(self) -> bool:
+        """Write a snapshot if the state changed since the last one. Returns whether one was written."""
+        version = self._state_version()
+        if version == self._saved:
+            return False
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "saved_at": datetime.now().isoformat(),
+            "prep": self.prep_state.snapshot(),
+            "selected_trays": self.selection.ids(),
+        }
+        # Dish and bag dicts are replaced, never mutated, so the snapshot can
+        # be serialised off the event loop
+        await asyncio.to_thread(self._write, snapshot)
+        self._saved = version
+        return True
+
+    def _write(self, snapshot: Dict[str, Any]):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".prep_snapshot.", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(snapshot, separators=(",", ":")).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
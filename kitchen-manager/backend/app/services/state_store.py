@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, FrozenSet, Hashable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Every value file starts with a header line naming its generation
+_HEADER_PREFIX = b'{"generation":'
+
+def default_state_dir() -> str:
+    # /dev/shm is memory-backed, so the shared store never touches the disk
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "kitchen-manager")
+
+
+class StateStore(ABC):
+    """
+    Small named values shared by the API's routers, such as the tray
+    selection and the prep snapshot.
+
+    Values are replaced whole: ``put`` swaps in a new value atomically and
+    readers see either the old or the new one, never a mix. Every value has
+    a version that changes on each ``put``, so callers can cache what they
+    derive from a value and only rebuild it when the version moves.
+    Read-modify-write sequences go inside ``lock(key)``.
+
+    Values must be treated as immutable once stored or read.
+    """
+
+    # Whether other worker processes see the same values
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> Tuple[Any, Optional[Hashable]]:
+        """The value and its version, or ``(None, None)`` if never set."""
+
+    @abstractmethod
+    def version(self, key: str) -> Optional[Hashable]:
+        """The current version of ``key`` without reading its value."""
+
+    @abstractmethod
+    def put(self, key: str, value: Any) -> Hashable:
+        """Replace the value; returns its new version."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove the value, if any. Call it inside ``lock(key)``."""
+
+    @abstractmethod
+    def keys(self, prefix: str) -> List[str]:
+        """Keys that currently have a value and start with ``prefix``."""
+
+    @abstractmethod
+    def lock(self, key: str):
+        """Context manager serialising writers of ``key``."""
+
+
+class MemoryStateStore(StateStore):
+    """State held in this process. Only correct with a single worker."""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, int]] = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[Any, Optional[Hashable]]:
+        return self._values.get(key, (None, None))
+
+    def version(self, key: str) -> Optional[Hashable]:
+        return self._values.get(key, (None, None))[1]
+
+    def put(self, key: str, value: Any) -> Hashable:
+        with self._lock:
+            self._counter += 1
+            self._values[key] = (value, self._counter)
+            return self._counter
+
+    def delete(self, key: str):
+        self._values.pop(key, None)
+
+    def keys(self, prefix: str) -> List[str]:
+        return [key for key in list(self._values) if key.startswith(prefix)]
+
+    def lock(self, key: str):
+        return nullcontext()
+
+
+class FileStateStore(StateStore):
+    """
+    State shared by every worker process on the machine, one JSON file per
+    key under STATE_STORE_DIR (memory-backed ``/dev/shm`` by default).
+
+    A ``put`` writes a temporary file and renames it over the old one, which
+    is atomic. Each file starts with a header line naming a generation that
+    is new on every ``put``, and that generation is the value's version:
+    checking whether a value changed reads only the header, and unchanged
+    values are served from this process's cache. A file's inode, mtime and
+    size can all repeat after a rewrite, so they are only used for files
+    written before headers. Writers are serialised across
+    processes with ``flock`` on a ``.lock`` file per key, which is removed
+    again when the key is released without a value, so stores with many
+    short-lived keys do not pile up lock files.
+    """
+
+    shared = True
+
+    def __init__(self, directory: str = None):
+        if fcntl is None:
+            raise RuntimeError("The file state store needs fcntl, which this platform lacks")
+        self.directory = directory or os.environ.get('STATE_STORE_DIR') or default_state_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self._cache: Dict[str, Tuple[Any, Hashable]] = {}
+        # key -> [lock, threads using it]; dropped when the last one is done
+        self._thread_locks: Dict[str, List[Any]] = {}
+        self._thread_locks_guard = threading.Lock()
+        logger.info(f"Sharing state between workers through {self.directory}")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    @staticmethod
+    def _read_version(f) -> Hashable:
+        """The generation named in the file's header; leaves ``f`` at the value."""
+        head = f.read(64)
+        if head.startswith(_HEADER_PREFIX) and b"\n" in head:
+            end = head.index(b"\n")
+            try:
+                generation = json.loads(head[:end])["generation"]
+            except (ValueError, KeyError):
+                generation = None
+            if generation is not None:
+                f.seek(end + 1)
+                return generation
+        # A file written before headers
+        f.seek(0)
+        st = os.fstat(f.fileno())
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def version(self, key: str) -> Optional[Hashable]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return self._read_version(f)
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str) -> Tuple[Any, Optional[Hashable]]:
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] == self.version(key):
+            return cached
+        try:
+            with open(self._path(key), 'rb') as f:
+                # Version of the file actually read, even if it is replaced meanwhile
+                version = self._read_version(f)
+                value = json.loads(f.read())
+        except FileNotFoundError:
+            self._cache.pop(key, None)
+            return None, None
+        self._cache[key] = (value, version)
+        return value, version
+
+    def put(self, key: str, value: Any) -> Hashable:
+        version = uuid.uuid4().hex
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{key}.", dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps({"generation": version}, separators=(",", ":")).encode() + b"\n")
+                f.write(json.dumps(value, separators=(",", ":")).encode())
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._cache[key] = (value, version)
+        return version
+
+    def delete(self, key: str):
+        self._cache.pop(key, None)
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str) -> List[str]:
+        """Keys under ``prefix``; cached values of keys that are gone are forgotten."""
+        keys = [name[:-len(".json")] for name in os.listdir(self.directory)
+                if name.startswith(prefix) and name.endswith(".json")]
+        present = set(keys)
+        for key in [key for key in self._cache if key.startswith(prefix) and key not in present]:
+            self._cache.pop(key, None)
+        return keys
+
+    @contextmanager
+    def _thread_lock(self, key: str) -> Iterator[None]:
+        with self._thread_locks_guard:
+            entry = self._thread_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._thread_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._thread_locks[key]
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        lock_path = os.path.join(self.directory, f"{key}.lock")
+        with self._thread_lock(key):
+            while True:
+                f = open(lock_path, 'a')
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    # The holder before us may have removed the lock file; then
+                    # our lock is on an orphaned inode and we start again
+                    if os.fstat(f.fileno()).st_ino == os.stat(lock_path).st_ino:
+                        break
+                except FileNotFoundError:
+                    pass
+                f.close()
+            try:
+                yield
+            finally:
+                if not os.path.exists(self._path(key)):
+                    os.unlink(lock_path)
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                f.close()
+
+
+def create_state_store() -> StateStore:
+    """The store selected by STATE_STORE: ``memory`` (default) or ``file``."""
+    kind = os.environ.get('STATE_STORE', 'memory').lower()
+    if kind == 'file':
+        return FileStateStore()
+    if kind != 'memory':
+        raise ValueError(f"Unknown STATE_STORE {kind!r}; expected 'memory' or 'file'")
+    return MemoryStateStore()
+
+
+class TraySelection:
+    """
+    The gastronorm trays selected for the current prep session, in the order
+    they were selected. Membership checks use a set that is rebuilt only
+    when the selection changes, and a new selection replaces the old one
+    atomically.
+    """
+
+    KEY = "selected_trays"
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        # (version, IDs in order, IDs as a set), swapped as one reference so
+        # readers never see the list and the set out of step
+        self._snapshot: Tuple[Optional[Hashable], Tuple[str, ...], FrozenSet[str]] = (None, (), frozenset())
+
+    def _current(self) -> Tuple[Optional[Hashable], Tuple[str, ...], FrozenSet[str]]:
+        snapshot = self._snapshot
+        if self.store.version(self.KEY) != snapshot[0]:
+            value, version = self.store.get(self.KEY)
+            ids = tuple(value or ())
+            snapshot = self._snapshot = (version, ids, frozenset(ids))
+        return snapshot
+
+    @property
+    def version(self) -> Optional[Hashable]:
+        """Changes whenever the selection is replaced; None if never set."""
+        return self._current()[0]
+
+    def ids(self) -> List[str]:
+        return list(self._current()[1])
+
+    def id_set(self) -> FrozenSet[str]:
+        """The selected IDs as a set, for checking many trays against one read of the store."""
+        return self._current()[2]
+
+    def __contains__(self, tray_id: str) -> bool:
+        return tray_id in self._current()[2]
+
+    def __len__(self) -> int:
+        return len(self._current()[1])
+
+    def replace(self, tray_ids: List[str]) -> List[str]:
+        """Select exactly these trays, dropping duplicates. Returns the selection."""
+        ids = list(dict.fromkeys(tray_ids))
+        version = self.store.put(self.KEY, ids)
+        self._snapshot = (version, tuple(ids), frozenset(ids))
+        return ids
@@ -0,0 +1,196 @@
+import bisect
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Volumes are estimates; ignore rounding noise when comparing against capacity
+EPSILON = 1e-9
+
+
+class _Pan:
+    __slots__ = ("tray", "capacity", "load", "bags", "dishes")
+
+    def __init__(self, tray: Dict[str, Any]):
+        self.tray = tray
+        self.capacity = float(tray["volumeLiters"])
+        self.load = 0.0
+        self.bags: List[Dict[str, Any]] = []
+        self.dishes: Dict[str, None] = {}
+
+    @property
+    def free(self) -> float:
+        return self.capacity - self.load
+
+    def add(self, bag: Dict[str, Any]):
+        self.load += bag["volume"]
+        self.bags.append(bag)
+        self.dishes[bag["dish"]] = None
+
+
+class _TrayPool:
+    """Unused trays, kept sorted by capacity for smallest-that-fits lookups."""
+
+    def __init__(self, trays: List[Dict[str, Any]]):
+        self._trays = sorted(trays, key=lambda t: float(t["volumeLiters"]))
+        self._capacities = [float(t["volumeLiters"]) for t in self._trays]
+
+    def __bool__(self) -> bool:
+        return bool(self._trays)
+
+    @property
+    def largest(self) -> float:
+        return self._capacities[-1] if self._capacities else 0.0
+
+    def take_smallest(self, volume: float) -> Optional[Dict[str, Any]]:
+        """Remove and return the smallest tray holding at least ``volume``."""
+        index = bisect.bisect_left(self._capacities, volume - EPSILON)
+        if index == len(self._trays):
+            return None
+        del self._capacities[index]
+        return self._trays.pop(index)
+
+    def take_largest(self) -> Optional[Dict[str, Any]]:
+        if not self._trays:
+            return None
+        self._capacities.pop()
+        return self._trays.pop()
+
+    def put(self, tray: Dict[str, Any]):
+        capacity = float(tray["volumeLiters"])
+        index = bisect.bisect_right(self._capacities, capacity)
+        self._capacities.insert(index, capacity)
+        self._trays.insert(index, tray)
+
+
+def capacity_lower_bound(volumes: List[float], trays: List[Dict[str, Any]]) -> int:
+    """
+    No packing can use fewer pans than it takes to reach the total volume
+    using the largest pans first.
+    """
+    remaining = sum(volumes)
+    count = 0
+    for capacity in sorted((float(t["volumeLiters"]) for t in trays), reverse=True):
+        if remaining <= EPSILON:
+            break
+        remaining -= capacity
+        count += 1
+    return count
+
+
+def pack_bags(bags: List[Dict[str, Any]], trays: List[Dict[str, Any]], mix_dishes: bool = False) -> Dict[str, Any]:
+    """
+    Assign prep bags to gastronorm pans using as few pans as possible.
+
+    Args:
+        bags: ``{"id", "dish", "volume"}`` per bag, volume in litres
+        trays: Catalogue entries of the pans available, each with ``volumeLiters``
+        mix_dishes: Allow bags of different dishes in one pan. By default a
+            pan holds a single dish, and a dish only spans several pans when
+            no single pan can hold it.
+
+    Dishes are packed largest first. Without mixing, each dish goes into the
+    smallest free pan that holds all of it; if none does, the largest free
+    pan is filled first-fit decreasing and the rest of the dish continues in
+    the same way. With mixing, bags go best-fit decreasing into open pans,
+    preferring pans that already hold the same dish, and a new pan is the
+    largest free one. Finally every pan is swapped for the smallest unused
+    pan that still holds its load.
+
+    Returns:
+        The pans used with their bags and fill, bags that could not be
+        placed, and a lower bound on the number of pans for comparison
+    """
+    pool = _TrayPool(trays)
+    pans: List[_Pan] = []
+    unplaced: List[Dict[str, Any]] = []
+
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for bag in bags:
+        groups.setdefault(bag["dish"], []).append(bag)
+    ordered = sorted(groups.items(), key=lambda item: -sum(b["volume"] for b in item[1]))
+    for _, group in ordered:
+        group.sort(key=lambda b: -b["volume"])
+
+    def oversized(bag: Dict[str, Any]) -> bool:
+        largest_open = max((pan.free for pan in pans), default=0.0) if mix_dishes else 0.0
+        if bag["volume"] > max(pool.largest, largest_open) + EPSILON:
+            unplaced.append({**bag, "reason": "No free pan is large enough"})
+            return True
+        return False
+
+    if mix_dishes:
+        for dish, group in ordered:
+            for bag in group:
+                if oversized(bag):
+                    continue
+                fitting = [pan for pan in pans if pan.free >= bag["volume"] - EPSILON]
+                if fitting:
+                    same_dish = [pan for pan in fitting if dish in pan.dishes]
+                    pan = min(same_dish or fitting, key=lambda p: p.free)
+                else:
+                    # Open the biggest pan; the final pass shrinks it to fit
+                    pan = _Pan(pool.take_largest())
+                    pans.append(pan)
+                pan.add(bag)
+    else:
+        for _, group in ordered:
+            remaining = [bag for bag in group if not oversized(bag)]
+            while remaining:
+                tray = pool.take_smallest(sum(b["volume"] for b in remaining))
+                if tray is not None:
+                    pan = _Pan(tray)
+                    for bag in remaining:
+                        pan.add(bag)
+                    pans.append(pan)
+                    break
+                tray = pool.take_largest()
+                if tray is None:
+                    unplaced.extend({**bag, "reason": "Not enough free pans"} for bag in remaining)
+                    break
+                pan = _Pan(tray)
+                rest = []
+                for bag in remaining:
+                    if pan.free >= bag["volume"] - EPSILON:
+                        pan.add(bag)
+                    else:
+                        rest.append(bag)
+                if not pan.bags:
+                    # The big pans went to earlier dishes
+                    pool.put(tray)
+                    unplaced.extend({**bag, "reason": "No free pan is large enough"} for bag in rest)
+                    break
+                pans.append(pan)
+                remaining = rest
+
+    # Keep the big pans free: move each load into the smallest pan that holds it
+    for pan in sorted(pans, key=lambda p: p.load):
+        smaller = pool.take_smallest(pan.load)
+        if smaller is None:
+            continue
+        if float(smaller["volumeLiters"]) < pan.capacity:
+            pool.put(pan.tray)
+            pan.tray = smaller
+            pan.capacity = float(smaller["volumeLiters"])
+        else:
+            pool.put(smaller)
+
+    placed_volumes = [bag["volume"] for pan in pans for bag in pan.bags]
+    return {
+        "pans_used": len(pans),
+        "lower_bound": capacity_lower_bound(placed_volumes, trays),
+        "total_volume_liters": round(sum(placed_volumes), 3),
+        "assignments": [
+            {
+                "tray_id": pan.tray["id"],
+                "tray_name": pan.tray.get("name"),
+                "capacity_liters": pan.capacity,
+                "volume_liters": round(pan.load, 3),
+                "fill": round(pan.load / pan.capacity, 3) if pan.capacity else None,
+                "dishes": list(pan.dishes),
+                "bags": [bag["id"] for bag in pan.bags],
+            }
+            for pan in sorted(pans, key=lambda p: -p.load)
+        ],
+        "unplaced": unplaced,
+    }
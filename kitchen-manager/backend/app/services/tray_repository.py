@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from .state_store import MemoryStateStore, TraySelection
+
+logger = logging.getLogger(__name__)
+
+# Path to the GN.json file in the prep tracking app
+GN_JSON_PATH = os.environ.get(
+    "GN_JSON_PATH",
+    "/home/mckrotsky/projects/prep-tracker/prep-tracking-app/assets/documents/GN.json",
+)
+
+class TrayNotFoundError(LookupError):
+    """Raised when a tray does not exist or is not currently selected."""
+
+
+class TrayRepository:
+    """
+    In-process access to the gastronorm tray catalogue.
+
+    ``GN.json`` is parsed once and indexed by tray ID; it is only re-read when
+    its modification time changes. The gastronorm router and the label
+    generator both query this repository directly, so generating a label
+    never has to call back into our own HTTP API.
+    """
+
+    def __init__(self, path: str = GN_JSON_PATH, selection: TraySelection = None):
+        self.path = path
+        self.selection = selection if selection is not None else TraySelection(MemoryStateStore())
+        self._trays: List[Dict[str, Any]] = []
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._mtime: Optional[float] = None
+        self._missing = False
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if not self._missing:
+                logger.warning(f"Gastronorm trays data not found at {self.path}")
+                self._missing = True
+            # Keep serving the last good copy, or an empty catalogue
+            return
+        self._missing = False
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    trays = json.load(f)
+            except Exception as e:
+                logger.error(f"Error reading gastronorm trays: {str(e)}")
+                return
+            self._trays = trays
+            self._by_id = {tray["id"]: tray for tray in trays}
+            self._mtime = mtime
+            logger.info(f"Loaded {len(trays)} gastronorm trays from {self.path}")
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All trays in the catalogue."""
+        self._reload_if_changed()
+        return self._trays
+
+    def get(self, tray_id: str) -> Optional[Dict[str, Any]]:
+        """A tray by ID, whether or not it is selected."""
+        self._reload_if_changed()
+        return self._by_id.get(tray_id)
+
+    def selected(self) -> List[Dict[str, Any]]:
+        """The currently selected trays that exist in the catalogue."""
+        self._reload_if_changed()
+        selected = self.selection.id_set()
+        return [tray for tray in self._trays if tray["id"] in selected]
+
+    def get_selected(self, tray_id: str) -> Dict[str, Any]:
+        """
+        A selected tray by ID, in the same shape as ``GET /api/gastronorm/{tray_id}``.
+
+        Raises:
+            TrayNotFoundError: if the tray is not selected or does not exist
+        """
+        if tray_id not in self.selection:
+            raise TrayNotFoundError(f"Tray with ID {tray_id} is not currently selected")
+        tray = self.get(tray_id)
+        if not tray:
+            raise TrayNotFoundError(f"Tray with ID {tray_id} not found")
+        return tray
@@ -0,0 +1,181 @@
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Ingredient amounts arrive in whatever unit the recipe used. Anything that
+# adds them up converts them first to a base unit per dimension (grams,
+# millilitres or pieces), so 500 g and 1 kg make 1500 g rather than 501.
+# Single bags (deltas) go through the plain-Python helpers; a full snapshot
+# goes through measure_bags, which evaluates every bag at once with NumPy.
+#
+# unit -> (base unit, amount of base unit in one unit)
+UNITS: Dict[str, Tuple[str, float]] = {
+    "mg": ("g", 0.001),
+    "g": ("g", 1.0),
+    "gram": ("g", 1.0),
+    "grams": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "oz": ("g", 28.349523125),
+    "lb": ("g", 453.59237),
+    "ml": ("ml", 1.0),
+    "cl": ("ml", 10.0),
+    "dl": ("ml", 100.0),
+    "l": ("ml", 1000.0),
+    "litre": ("ml", 1000.0),
+    "liter": ("ml", 1000.0),
+    "tsp": ("ml", 5.0),
+    "tbsp": ("ml", 15.0),
+    "pc": ("pcs", 1.0),
+    "pcs": ("pcs", 1.0),
+    "each": ("pcs", 1.0),
+}
+
+# Litres of pan space per base unit. Solids are taken to be as dense as
+# water (1 kg ~ 1 l); pieces and unknown units have no known volume.
+LITRES_PER_BASE = {"g": 0.001, "ml": 0.001}
+
+# Headroom for mixing and handling on top of the ingredients' volume
+VOLUME_BUFFER = 1.2
+
+DEFAULT_UNIT = "g"
+
+def unit_of(ingredient: Dict[str, Any]) -> str:
+    return (ingredient.get("unit") or DEFAULT_UNIT).strip().lower()
+
+
+def to_base(unit: str) -> Tuple[str, float]:
+    """The base unit for ``unit`` and the factor converting to it. Unknown units are kept as they are."""
+    return UNITS.get(unit, (unit, 1.0))
+
+
+def normalize(ingredient: Dict[str, Any]) -> Tuple[float, str]:
+    """An ingredient's amount in its base unit, and that unit."""
+    base, factor = to_base(unit_of(ingredient))
+    return float(ingredient.get("weight", 0)) * factor, base
+
+
+def bag_volume(bag: Dict[str, Any]) -> float:
+    """Approximate litres a prep bag takes up: its ingredients and added ingredients plus the buffer."""
+    litres = 0.0
+    for ingredient in bag.get("ingredients", []) + bag.get("addedIngredients", []):
+        amount, base = normalize(ingredient)
+        litres += amount * LITRES_PER_BASE.get(base, 0.0)
+    return litres * VOLUME_BUFFER
+
+
+def _field(ingredients: List[Dict[str, Any]], key: str, default: Any) -> List[Any]:
+    # The app sends every field, so try the C-level getter before falling back to .get
+    try:
+        return list(map(itemgetter(key), ingredients))
+    except KeyError:
+        return [ingredient.get(key, default) for ingredient in ingredients]
+
+
+def _codes(values: List[Any]) -> Tuple[np.ndarray, List[Any]]:
+    """An integer code per value, numbered in order of first appearance, and the distinct values."""
+    distinct = list(dict.fromkeys(values))
+    code_of = {value: code for code, value in enumerate(distinct)}
+    return np.fromiter(map(code_of.__getitem__, values), dtype=np.intp, count=len(values)), distinct
+
+
+def measure_bags(
+    bags: Sequence[Dict[str, Any]],
+    trays: Optional[Sequence[Optional[str]]] = None,
+) -> Tuple[np.ndarray, Dict[str, Dict[Tuple[str, str], List[Any]]]]:
+    """
+    Volumes and tray totals for a batch of bags in one pass.
+
+    The bags' ingredients are flattened into arrays of weights, name codes
+    and unit codes. Each distinct unit spelling is looked up once, and
+    conversion, per-bag volumes and per-tray sums are array operations.
+
+    Args:
+        bags: Prep bags with ``ingredients`` and ``addedIngredients``
+        trays: The tray each bag counts towards (None for none); omit to
+            only compute volumes
+
+    Returns:
+        The volume of each bag in litres, as ``bag_volume`` would give it,
+        and per tray ``{(name, base unit): [total, bags, first unit seen,
+        base units per that unit]}`` over the bags' main ingredients
+    """
+    totals: Dict[str, Dict[Tuple[str, str], List[Any]]] = {}
+    mains = [bag.get("ingredients", []) for bag in bags]
+    addeds = [bag.get("addedIngredients", []) for bag in bags]
+    main_sizes = np.fromiter(map(len, mains), dtype=np.intp, count=len(bags))
+    added_sizes = np.fromiter(map(len, addeds), dtype=np.intp, count=len(bags))
+    # One row per ingredient: every bag's main ingredients in bag order, then the added ones
+    main_rows = list(chain.from_iterable(mains))
+    rows = main_rows + list(chain.from_iterable(addeds))
+    if not rows:
+        return np.zeros(len(bags)), totals
+
+    unit_codes, spellings = _codes(_field(rows, "unit", None))
+    # Looked up once per distinct unit spelling
+    units = [(spelling or DEFAULT_UNIT).strip().lower() for spelling in spellings]
+    conversions = [to_base(unit) for unit in units]
+    factors = np.array([factor for _, factor in conversions])
+    litres = np.array([LITRES_PER_BASE.get(base, 0.0) for base, _ in conversions])
+
+    try:
+        weights = np.fromiter(map(itemgetter("weight"), rows), dtype=float, count=len(rows))
+    except KeyError:
+        weights = np.array([ingredient.get("weight", 0) for ingredient in rows], dtype=float)
+    amounts = weights * factors[unit_codes]
+    bag_index = np.arange(len(bags))
+    owners = np.concatenate([np.repeat(bag_index, main_sizes), np.repeat(bag_index, added_sizes)])
+    volumes = np.bincount(owners, weights=amounts * litres[unit_codes], minlength=len(bags)) * VOLUME_BUFFER
+
+    tray_ids = list(dict.fromkeys(tray_id for tray_id in trays or () if tray_id))
+    if not tray_ids or not main_rows:
+        return volumes, totals
+
+    # Main ingredients of bags on a tray, keyed by (tray, name, base unit).
+    # Names and units are coded separately: building a tuple per
+    # ingredient would cost more than everything else here.
+    tray_code = {tray_id: code for code, tray_id in enumerate(tray_ids)}
+    bag_trays = np.array([tray_code.get(tray_id, -1) for tray_id in trays], dtype=np.intp)
+    row_trays = np.repeat(bag_trays, main_sizes)
+    on_tray = np.flatnonzero(row_trays >= 0)
+    name_codes, name_list = _codes(_field(main_rows, "name", "Unknown"))
+    base_list = list(dict.fromkeys(base for base, _ in conversions))
+    base_of = np.array([base_list.index(base) for base, _ in conversions], dtype=np.intp)
+    tray_units = unit_codes[on_tray]
+    keys = (row_trays[on_tray] * len(name_list) + name_codes[on_tray]) * len(base_list) + base_of[tray_units]
+
+    unique_keys, first_rows, slots = np.unique(keys, return_index=True, return_inverse=True)
+    sums = np.bincount(slots, weights=amounts[on_tray], minlength=len(unique_keys))
+    counts = np.bincount(slots, minlength=len(unique_keys))
+    # In order of first appearance, as adding the bags one by one would list them
+    seen = np.argsort(first_rows, kind="stable")
+    unique_keys, first_rows, sums, counts = unique_keys[seen], first_rows[seen], sums[seen], counts[seen]
+    tray_of, rest = np.divmod(unique_keys, len(name_list) * len(base_list))
+    name_of, base_of_key = np.divmod(rest, len(base_list))
+    for tray, name, base, total, count, unit in zip(tray_of.tolist(), name_of.tolist(), base_of_key.tolist(),
+                                                     sums.tolist(), counts.tolist(), tray_units[first_rows].tolist()):
+        ingredients = totals.get(tray_ids[tray])
+        if ingredients is None:
+            ingredients = totals[tray_ids[tray]] = {}
+        ingredients[(name_list[name], base_list[base])] = [total, count, units[unit], conversions[unit][1]]
+    return volumes, totals
+
+
+def display_factor(unit: str) -> float:
+    """What to divide a total in base units by to express it in ``unit``."""
+    return to_base(unit)[1]
+
+
+def display_names(keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """
+    Names for ingredient totals keyed by (name, base unit): just the name,
+    unless the same ingredient was measured both by weight and by volume.
+    """
+    keys = list(keys)
+    if len({name for name, _ in keys}) == len(keys):
+        return {key: key[0] for key in keys}
+    bases: Dict[str, int] = {}
+    for name, _ in keys:
+        bases[name] = bases.get(name, 0) + 1
+    return {(name, base): name if bases[name] == 1 else f"{name} ({base})" for name, base in keys}
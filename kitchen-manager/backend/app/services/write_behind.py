@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class LabelBufferFullError(Exception):
+    """Raised when the write-behind buffer is full and flushing it to the backing store failed."""
+
+    def __init__(self, pending: int, retry_after: float):
+        super().__init__(f"Label buffer is full ({pending} unsaved labels) and the label store is not accepting writes")
+        self.pending = pending
+        self.retry_after = retry_after
+
+
+class WriteBehindLabelStore:
+    """
+    Write-behind wrapper around a label store (DatabaseClient or LabelStorage).
+
+    Saves are acknowledged as soon as they land in a bounded in-process buffer.
+    A background thread flushes the buffer to the backing store in batches when
+    it reaches ``batch_size`` labels or ``flush_interval`` seconds have passed,
+    whichever comes first. Reads consult the buffer before the backing store so
+    callers always see their own unflushed writes.
+
+    Labels sitting in the buffer are lost if the process dies before a flush,
+    so this mode trades a small durability window for much lower save latency.
+    Call ``close()`` on shutdown to drain the buffer.
+
+    At most ``max_pending`` labels are buffered. A new label arriving at a
+    full buffer is flushed inline first; if the backing store still does not
+    take the labels, the save is refused with ``LabelBufferFullError``
+    rather than acknowledged without a way to make it durable.
+    """
+
+    def __init__(self, store, max_pending: int = 1000, batch_size: int = 50, flush_interval: float = 1.0):
+        self.store = store
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # label_id -> label; repeated saves of the same label coalesce into one write
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._last_flush = time.monotonic()
+
+        self._worker = threading.Thread(target=self._flush_loop, name="label-write-behind", daemon=True)
+        self._worker.start()
+        logger.info(
+            f"Write-behind label saves enabled (max_pending={max_pending}, "
+            f"batch_size={batch_size}, flush_interval={flush_interval}s)"
+        )
+
+    @property
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def save_label(self, label_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Buffer a label for saving and return it immediately.
+
+        Raises:
+            LabelBufferFullError: if the buffer is full and cannot be flushed
+        """
+        if self._closed:
+            return self.store.save_label(label_data)
+
+        label_id = label_data["label_id"]
+        if not self._buffer(label_id, label_data):
+            # The buffer is at capacity: the caller pays for a flush, and is
+            # refused if the backing store is not taking writes
+            logger.warning("Write-behind buffer full, flushing inline")
+            self.flush()
+            if not self._buffer(label_id, label_data):
+                raise LabelBufferFullError(self.pending_count, self.flush_interval)
+        return label_data
+
+    def _buffer(self, label_id: str, label_data: Dict[str, Any]) -> bool:
+        """Add or replace a buffered label. Returns False if there is no room for a new one."""
+        with self._cond:
+            if label_id not in self._pending and len(self._pending) >= self.max_pending:
+                return False
+            self._pending.pop(label_id, None)
+            self._pending[label_id] = label_data
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def get_label_by_id(self, label_id: str) -> Optional[Dict[str, Any]]:
+        """Get a label, preferring an unflushed copy from the buffer."""
+        with self._cond:
+            label = self._pending.get(label_id)
+        if label is not None:
+            return label
+        return self.store.get_label_by_id(label_id)
+
+    def get_labels(self) -> List[Dict[str, Any]]:
+        """Get all labels, overlaying unflushed saves on the stored ones."""
+        with self._cond:
+            overlay = dict(self._pending)
+        labels = []
+        for label in self.store.get_labels():
+            labels.append(overlay.pop(label.get("label_id"), label))
+        labels.extend(overlay.values())
+        return labels
+
+    def delete_label(self, label_id: str) -> bool:
+        """Delete a label from both the buffer and the backing store."""
+        with self._cond:
+            buffered = self._pending.pop(label_id, None) is not None
+        # Wait for any in-flight batch so it cannot resurrect the label
+        with self._flush_lock:
+            stored = self.store.delete_label(label_id)
+        return buffered or bool(stored)
+
+    def flush(self) -> int:
+        """Write every buffered label to the backing store. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = list(self._pending.items())[:self.batch_size]
+                if not batch:
+                    break
+                try:
+                    self._write_batch([label for _, label in batch])
+                except Exception as e:
+                    logger.error(f"Error flushing {len(batch)} buffered labels: {str(e)}")
+                    break
+                with self._cond:
+                    for label_id, label in batch:
+                        # Keep entries that were saved again while the batch was in flight
+                        if self._pending.get(label_id) is label:
+                            del self._pending[label_id]
+                written += len(batch)
+            self._last_flush = time.monotonic()
+        if written:
+            logger.info(f"Flushed {written} buffered labels")
+        return written
+
+    def _write_batch(self, labels: List[Dict[str, Any]]):
+        save_labels = getattr(self.store, "save_labels", None)
+        if save_labels is not None:
+            save_labels(labels)
+        else:
+            for label in labels:
+                self.store.save_label(label)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(timeout=self.flush_interval)
+                due = time.monotonic() - self._last_flush >= self.flush_interval
+                ready = len(self._pending) >= self.batch_size or (due and self._pending)
+            if ready:
+                self.flush()
+
+    def close(self):
+        """Stop the background flusher and drain the buffer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=5)
+        remaining = self.flush()
+        logger.info(f"Write-behind buffer drained ({remaining} labels flushed on close)")
@@ -0,0 +1,77 @@
+"""
+Benchmark bulk label generation: /api/labels/generate versus the streaming
+/api/labels/generate-bulk endpoint.
+
+Runs the app in-process, so no server is needed:
+
+    cd backend
+    python -m benchmarks.bench_bulk_labels --count 10000
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("WARM_UP_SERVICES", "false")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+def make_label(i: int) -> dict:
+    today = datetime.now()
+    return {
+        "tray_id": f"TRAY-{i:05d}",
+        "dish_name": f"Dish {i % 40}",
+        "prep_date": today.strftime("%Y-%m-%d"),
+        "expiry_date": (today + timedelta(days=3)).strftime("%Y-%m-%d"),
+        "ingredients": ["Chicken thigh: 1200 g", "Onion: 400 g", "Garlic: 30 g", "Cumin: 12 g"],
+        "allergens": ["Mustard"],
+        "notes": "Bench label",
+    }
+
+def measure(name: str, run) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14} {count:>7} labels  {elapsed * 1000:9.1f} ms  "
+          f"{count / elapsed:9.0f} labels/s  peak {peak / 1024 / 1024:7.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10_000, help="labels per batch")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    labels = [make_label(i) for i in range(args.count)]
+    batch_body = json.dumps({"labels": labels})
+    ndjson_body = "\n".join(json.dumps(label) for label in labels).encode()
+
+    with TestClient(app) as client:
+        def run_list():
+            response = client.post("/api/labels/generate", content=batch_body,
+                                   headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+            return len(response.json())
+
+        def run_stream():
+            count = 0
+            with client.stream("POST", "/api/labels/generate-bulk", content=ndjson_body,
+                               headers={"Content-Type": "application/x-ndjson"}) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        count += 1
+            return count
+
+        for _ in range(args.rounds):
+            measure("generate", run_list)
+            measure("generate-bulk", run_stream)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark measuring a prep-tracker snapshot: bag volumes for the completed
+bags and ingredient totals per tray, as a full /receive-prep-data post
+needs them.
+
+Compares the previous path (an if/elif unit chain per ingredient for the
+volumes, then raw weights summed per tray bag by bag with no unit
+conversion) with the unit table applied bag by bag and evaluated in one
+NumPy batch, and times a whole ``PrepState.replace``.
+
+    cd backend
+    python -m benchmarks.bench_prep_aggregation --dishes 200 --bags 6 --repeat 100
+"""
+import argparse
+import json
+from typing import Any, Dict, List
+
+from app.services.prep_state import PrepState, _TrayAggregate
+from app.services.units import bag_volume, measure_bags
+from benchmarks.bench_prep_parsing import measure, payload
+
+def previous_volume(prep_bag: Dict[str, Any]) -> float:
+    total_volume = 0.0
+    for ingredient in prep_bag.get("ingredients", []) + prep_bag.get("addedIngredients", []):
+        weight = float(ingredient.get("weight", 0))
+        unit = ingredient.get("unit", "").lower()
+        if unit == "kg":
+            total_volume += weight
+        elif unit == "g":
+            total_volume += weight / 1000
+        elif unit == "l":
+            total_volume += weight
+        elif unit == "ml":
+            total_volume += weight / 1000
+    return total_volume * 1.2
+
+class PreviousTrayAggregate:
+    """Ingredient totals per tray as PrepState kept them before the unit table: raw weights, first unit seen."""
+
+    def __init__(self):
+        self.total_bags = 0
+        self.ingredients: Dict[str, Dict[str, Any]] = {}
+        self.refs: Dict[str, int] = {}
+
+    def add_bag(self, bag: Dict[str, Any], sign: int):
+        self.total_bags += sign
+        for ingredient in bag.get("ingredients", []):
+            name = ingredient.get("name", "Unknown")
+            weight = float(ingredient.get("weight", 0))
+            totals = self.ingredients.get(name)
+            if totals is None:
+                totals = self.ingredients[name] = {"total_weight": 0, "unit": ingredient.get("unit", "g")}
+                self.refs[name] = 0
+            totals["total_weight"] += sign * weight
+            self.refs[name] += sign
+            if self.refs[name] <= 0:
+                del self.ingredients[name]
+                del self.refs[name]
+
+def previous_path(dishes: List[Dict[str, Any]]):
+    trays: Dict[str, PreviousTrayAggregate] = {}
+    for dish in dishes:
+        aggregate = trays.setdefault(dish["trayId"], PreviousTrayAggregate())
+        for bag in dish["prepBags"]:
+            if bag.get("isComplete"):
+                aggregate.add_bag(bag, 1)
+    volumes = [previous_volume(bag) for dish in dishes for bag in dish["prepBags"] if bag.get("isComplete")]
+    return volumes, trays
+
+def per_bag_path(dishes: List[Dict[str, Any]]):
+    """The unit table applied bag by bag, as a delta does."""
+    trays: Dict[str, _TrayAggregate] = {}
+    volumes = []
+    for dish in dishes:
+        aggregate = trays.setdefault(dish["trayId"], _TrayAggregate())
+        for bag in dish["prepBags"]:
+            if bag.get("isComplete"):
+                aggregate.add_bag(bag, 1)
+                volumes.append(bag_volume(bag))
+    return volumes, trays
+
+def batch_path(dishes: List[Dict[str, Any]]):
+    bags = [bag for dish in dishes for bag in dish["prepBags"] if bag.get("isComplete")]
+    trays = [dish["trayId"] for dish in dishes for bag in dish["prepBags"] if bag.get("isComplete")]
+    return measure_bags(bags, trays)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dishes", type=int, default=200)
+    parser.add_argument("--bags", type=int, default=6, help="prep bags per dish")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    dishes = json.loads(payload(args.dishes, args.bags))["dishes"]
+    ingredients = sum(len(bag["ingredients"]) + len(bag["addedIngredients"]) for dish in dishes for bag in dish["prepBags"])
+    print(f"{args.dishes} dishes x {args.bags} bags, {ingredients} ingredients")
+    cases = {
+        "previous": lambda: previous_path(dishes),
+        "per bag": lambda: per_bag_path(dishes),
+        "batch": lambda: batch_path(dishes),
+        "state replace": lambda: PrepState().replace(dishes),
+    }
+    for name, fn in cases.items():
+        timings = measure(fn, args.repeat)
+        print(f"{name:<14} p50 {timings[len(timings) // 2] * 1000:7.2f} ms  "
+              f"p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark parsing a prep-tracker snapshot as /receive-prep-data does.
+
+Compares the previous path (decode the body to a string for the log,
+parse it again with ``request.json()``, pretty-print it for the log) with
+the current one (validate the raw bytes straight into typed dicts, lax
+and strict), on a payload shaped like the prep-tracker app's export.
+
+    cd backend
+    python -m benchmarks.bench_prep_parsing --dishes 200 --bags 6 --repeat 200
+"""
+import argparse
+import json
+import random
+import time
+from typing import Callable, List
+
+from app.api.prep_tracking import prep_tracking_data
+
+INGREDIENTS = ["Chicken thigh", "Onion", "Garlic", "Cream", "Rice", "Basmati", "Coriander", "Lime juice",
+               "Coconut milk", "Chilli", "Tomato", "Paneer", "Spinach", "Butter", "Ginger"]
+UNITS = ["g", "kg", "ml", "l"]
+
+def ingredients(rng: random.Random, count: int) -> List[dict]:
+    return [
+        {"name": name, "weight": round(rng.uniform(5, 2000), 1), "unit": rng.choice(UNITS)}
+        for name in rng.sample(INGREDIENTS, count)
+    ]
+
+def payload(dishes: int, bags: int, seed: int = 0) -> bytes:
+    """A snapshot in the shape exportData.ts sends."""
+    rng = random.Random(seed)
+    exported = []
+    for d in range(dishes):
+        name = f"Dish {d}"
+        dish_ingredients = ingredients(rng, rng.randint(3, 8))
+        prep_bags = [
+            {
+                "id": f"bag_{d}_{b}",
+                "dishName": name,
+                "ingredients": dish_ingredients,
+                "addedIngredients": ingredients(rng, rng.randint(0, 3)),
+                "isComplete": rng.random() < 0.5,
+            }
+            for b in range(bags)
+        ]
+        exported.append({
+            "id": f"dish_{d}",
+            "name": name,
+            "ingredients": dish_ingredients,
+            "quantity": bags,
+            "trayId": f"tray-{d % 40}",
+            "prepBags": prep_bags,
+            "completedPrepBags": [bag for bag in prep_bags if bag["isComplete"]],
+        })
+    return json.dumps({"dishes": exported, "selectedTrays": [f"tray-{t}" for t in range(40)]}).encode()
+
+def previous_path(body: bytes):
+    logged = f"Received raw request body: {body.decode()}"
+    data = json.loads(body)
+    logged = f"Parsed JSON data: {json.dumps(data, indent=2)}"
+    return data["dishes"]
+
+def typed_path(body: bytes, strict: bool = False):
+    return prep_tracking_data.validate_json(body, strict=strict)["dishes"]
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dishes", type=int, default=200)
+    parser.add_argument("--bags", type=int, default=6, help="prep bags per dish")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    body = payload(args.dishes, args.bags)
+    print(f"{args.dishes} dishes x {args.bags} bags, {len(body) / 1024:.0f} KiB")
+    cases = {
+        "previous": lambda: previous_path(body),
+        "typed": lambda: typed_path(body),
+        "typed strict": lambda: typed_path(body, strict=True),
+    }
+    for name, fn in cases.items():
+        timings = measure(fn, args.repeat)
+        print(f"{name:<14} p50 {timings[len(timings) // 2] * 1000:7.2f} ms  "
+              f"p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Benchmark label printing end to end against local stand-in printers.
+
+Starts one or more fake printer servers, runs the API under uvicorn
+pointed at them, and drives a print endpoint at a fixed concurrency. End-
+to-end latency runs from sending the API request until the fake printer
+has printed the label (or, for add-label, until a simulated driver has
+printed it and marked it printed).
+
+    cd backend
+    python -m benchmarks.bench_printing --scenario print --requests 500 --concurrency 16
+    python -m benchmarks.bench_printing --printers 3 --latency 0.05 --jitter 0.02 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.fake_printer import FakePrinter
+
+SCENARIOS = ("print", "enhanced-batch", "add-label")
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def report(name: str, latencies: List[float], expected: int, elapsed: float, printers: List[FakePrinter]):
+    print(f"{name:<15} {len(latencies):>6}/{expected:<6} labels  {len(latencies) / elapsed:8.1f} labels/s  "
+          f"p50 {percentile(latencies, 50) * 1000:8.1f} ms  p99 {percentile(latencies, 99) * 1000:8.1f} ms  "
+          f"printer requests {sum(p.requests for p in printers):>5}  failures {sum(p.failures for p in printers):>4}")
+
+def write_fixtures(workdir: str, tray_count: int, printers: List[FakePrinter]) -> Dict[str, str]:
+    trays = [
+        {"id": f"bench-{i:05d}", "name": f"Bench tray {i}", "size": "1/1", "material": "steel", "volumeLiters": 9.0}
+        for i in range(tray_count)
+    ]
+    trays_path = os.path.join(workdir, "GN.json")
+    with open(trays_path, "w") as f:
+        json.dump(trays, f)
+
+    printers_path = os.path.join(workdir, "printers.json")
+    with open(printers_path, "w") as f:
+        json.dump([{"id": f"bench-{i}", "url": p.url} for i, p in enumerate(printers)], f)
+    return {"GN_JSON_PATH": trays_path, "PRINTERS_CONFIG": printers_path}
+
+def start_api(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API did not start")
+
+def label(tray_id: str) -> dict:
+    today = datetime.now()
+    return {
+        "tray_id": tray_id,
+        "dish_name": "Bench dish",
+        "prep_date": today.strftime("%Y-%m-%d"),
+        "expiry_date": (today + timedelta(days=3)).strftime("%Y-%m-%d"),
+        "ingredients": ["Chicken thigh: 1200 g", "Onion: 400 g"],
+        "allergens": ["Mustard"],
+    }
+
+async def drive(client: httpx.AsyncClient, concurrency: int, requests: List, send) -> Dict[str, float]:
+    """Send every request with at most ``concurrency`` in flight; returns tray ID -> send time."""
+    sent: Dict[str, float] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        while not queue.empty():
+            tray_ids = queue.get_nowait()
+            started = time.time()
+            for tray_id in tray_ids:
+                sent[tray_id] = started
+            # A unique key per request so identical bodies are not deduplicated
+            response = await send(tray_ids, {"Idempotency-Key": str(uuid.uuid4())})
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sent
+
+async def wait_for_prints(printers: List[FakePrinter], sent: Dict[str, float], timeout: float) -> Dict[str, float]:
+    """Wait until every sent tray's label has printed; returns tray ID -> print time."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        printed = {}
+        for printer in printers:
+            with printer.lock:
+                printed.update(printer.printed)
+        if all(tray_id in printed for tray_id in sent):
+            break
+        await asyncio.sleep(0.05)
+    return {tray_id: printed[tray_id] for tray_id in sent if tray_id in printed}
+
+async def run_spooled(name: str, client, printers, batches, concurrency, timeout):
+    if name == "print":
+        async def send(tray_ids, headers):
+            return await client.post("/api/labels/print", json={"labels": [label(t) for t in tray_ids]},
+                                     headers=headers)
+    else:
+        async def send(tray_ids, headers):
+            return await client.post("/api/labels/print-enhanced-batch", json=tray_ids, headers=headers)
+
+    for printer in printers:
+        printer.reset()
+    started = time.time()
+    sent = await drive(client, concurrency, batches, send)
+    printed = await wait_for_prints(printers, sent, timeout)
+    latencies = [printed[tray_id] - sent[tray_id] for tray_id in printed]
+    report(name, latencies, len(sent), max(printed.values(), default=started) - started, printers)
+
+async def run_add_label(client, printers, batches, concurrency, drivers, timeout):
+    """Kitchen side adds labels while driver loops long-poll /pending, print and acknowledge them."""
+    tray_ids = [tray_id for batch in batches for tray_id in batch]
+    added: Dict[str, float] = {}
+    done: Dict[str, float] = {}
+    claimed = set()
+
+    async def send(batch, headers):
+        return await client.post("/api/printer/add-label", params={"tray_id": batch[0]}, headers=headers)
+
+    async def driver(printer_client: httpx.AsyncClient):
+        while len(done) < len(tray_ids):
+            response = await client.get("/api/printer/pending", params={"wait": 1})
+            for pending in response.json():
+                if pending["id"] in claimed:
+                    continue
+                claimed.add(pending["id"])
+                # Drivers retry until the printer takes the label
+                while (await printer_client.post("/print-text", json={"text": pending["formatted_label"]})).status_code != 200:
+                    await asyncio.sleep(0.1)
+                await client.post(f"/api/printer/mark-printed/{pending['id']}")
+                done[pending["tray_id"]] = time.time()
+
+    for printer in printers:
+        printer.reset()
+    printer_clients = [httpx.AsyncClient(base_url=printers[i % len(printers)].url) for i in range(drivers)]
+    driver_tasks = [asyncio.create_task(driver(c)) for c in printer_clients]
+    started = time.time()
+    added.update(await drive(client, concurrency, [[t] for t in tray_ids], send))
+    try:
+        await asyncio.wait_for(asyncio.gather(*driver_tasks), timeout)
+    except asyncio.TimeoutError:
+        pass
+    for c in printer_clients:
+        await c.aclose()
+    latencies = [done[t] - added[t] for t in tray_ids if t in done]
+    report("add-label", latencies, len(tray_ids), max(done.values(), default=started) - started, printers)
+
+async def run(args):
+    printers = [
+        FakePrinter(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate).start()
+        for _ in range(args.printers)
+    ]
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    tray_count = args.requests * args.labels_per_request * len(scenarios)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = write_fixtures(workdir, tray_count, printers)
+        env.update({
+            "ENABLE_LABEL_PRINTING": "true",
+            "PRINT_SPOOL_DIR": os.path.join(workdir, "spool"),
+            "PRINT_SPOOL_MAX_BATCH": str(args.max_batch),
+            "PRINT_SPOOL_MAX_DEPTH": str(max(200, tray_count)),
+            "WARM_UP_SERVICES": "false",
+        })
+        api = start_api(args.port, env)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60.0,
+                                         limits=httpx.Limits(max_connections=args.concurrency + args.drivers)) as client:
+                await wait_until_up(client)
+                all_trays = [f"bench-{i:05d}" for i in range(tray_count)]
+                response = await client.post("/api/gastronorm/select", json={"tray_ids": all_trays})
+                response.raise_for_status()
+
+                print(f"{args.printers} printer(s), {args.latency * 1000:.0f} ms/label "
+                      f"+/- {args.jitter * 1000:.0f} ms, {args.failure_rate:.0%} failures, "
+                      f"concurrency {args.concurrency}, {args.labels_per_request} label(s)/request")
+                per_scenario = args.requests * args.labels_per_request
+                for index, name in enumerate(scenarios):
+                    trays = all_trays[index * per_scenario:(index + 1) * per_scenario]
+                    if name == "add-label":
+                        await run_add_label(client, printers, [[t] for t in trays], args.concurrency,
+                                            args.drivers, args.timeout)
+                        continue
+                    batches = [trays[i:i + args.labels_per_request] for i in range(0, len(trays), args.labels_per_request)]
+                    await run_spooled(name, client, printers, batches, args.concurrency, args.timeout)
+        finally:
+            api.terminate()
+            api.wait()
+            for printer in printers:
+                printer.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=200, help="API requests per scenario")
+    parser.add_argument("--labels-per-request", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8, help="API requests in flight")
+    parser.add_argument("--printers", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.02, help="printer seconds per label")
+    parser.add_argument("--jitter", type=float, default=0.0, help="printer +/- seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of printer requests failing with 503")
+    parser.add_argument("--max-batch", type=int, default=10, help="labels per batched printer request")
+    parser.add_argument("--drivers", type=int, default=2, help="driver loops polling /pending for add-label")
+    parser.add_argument("--port", type=int, default=8765, help="port for the API under test")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for labels to print")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark the tray-packing heuristic behind POST /api/gastronorm/pack.
+
+On small random kitchens it is compared with an exact branch-and-bound
+solver, reporting how often it finds the minimum number of pans and how
+many extra pans it uses otherwise. On large kitchens (hundreds of bags)
+only the heuristic runs, and its latency is reported.
+
+    cd backend
+    python -m benchmarks.bench_tray_packing --cases 200 --small-bags 9 --large-bags 500
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Optional
+
+from app.services.tray_packing import EPSILON, pack_bags
+
+# Pan sizes from the gastronorm catalogue, in litres
+PAN_LITRES = [1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 4.5, 5.7, 6.5, 9.0, 13.0]
+
+def kitchen(rng: random.Random, bag_count: int, pan_count: int, dish_count: int):
+    trays = [{"id": f"pan-{i}", "volumeLiters": rng.choice(PAN_LITRES)} for i in range(pan_count)]
+    bags = [
+        {"id": f"bag-{i}", "dish": f"dish-{rng.randrange(dish_count)}", "volume": round(rng.uniform(0.2, 3.0), 2)}
+        for i in range(bag_count)
+    ]
+    return bags, trays
+
+def exact_pans(bags: List[Dict], trays: List[Dict], mix_dishes: bool) -> Optional[int]:
+    """Fewest pans that hold every bag, by branch and bound; None if impossible."""
+    items = sorted(bags, key=lambda b: -b["volume"])
+    capacities = sorted((float(t["volumeLiters"]) for t in trays), reverse=True)
+    best = [len(capacities) + 1]
+    # Open pans as [free, dish]
+    open_pans: List[list] = []
+    unused = list(capacities)
+
+    def search(index: int):
+        if len(open_pans) >= best[0]:
+            return
+        if index == len(items):
+            best[0] = len(open_pans)
+            return
+        bag = items[index]
+        tried = set()
+        for pan in open_pans:
+            if pan[0] + EPSILON < bag["volume"] or (not mix_dishes and pan[1] != bag["dish"]):
+                continue
+            # Pans in the same state are interchangeable
+            key = (round(pan[0], 9), pan[1])
+            if key in tried:
+                continue
+            tried.add(key)
+            pan[0] -= bag["volume"]
+            search(index + 1)
+            pan[0] += bag["volume"]
+        for capacity in sorted(set(unused)):
+            if capacity + EPSILON < bag["volume"]:
+                continue
+            unused.remove(capacity)
+            open_pans.append([capacity - bag["volume"], bag["dish"]])
+            search(index + 1)
+            open_pans.pop()
+            unused.append(capacity)
+
+    search(0)
+    return best[0] if best[0] <= len(capacities) else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=200, help="small kitchens to compare with the exact solver")
+    parser.add_argument("--small-bags", type=int, default=9)
+    parser.add_argument("--small-pans", type=int, default=8)
+    parser.add_argument("--large-bags", type=int, default=500)
+    parser.add_argument("--large-pans", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for mix_dishes in (False, True):
+        compared = optimal = extra = 0
+        heuristic_time = exact_time = 0.0
+        for _ in range(args.cases):
+            bags, trays = kitchen(rng, args.small_bags, args.small_pans, dish_count=4)
+            started = time.perf_counter()
+            exact = exact_pans(bags, trays, mix_dishes)
+            exact_time += time.perf_counter() - started
+            started = time.perf_counter()
+            result = pack_bags(bags, trays, mix_dishes=mix_dishes)
+            heuristic_time += time.perf_counter() - started
+            # Only kitchens where everything fits have a well-defined optimum
+            if exact is None or result["unplaced"]:
+                continue
+            compared += 1
+            optimal += result["pans_used"] == exact
+            extra += result["pans_used"] - exact
+        mode = "mixed dishes" if mix_dishes else "one dish/pan"
+        print(f"{mode:<13} {compared} small kitchens: heuristic optimal in {optimal / max(compared, 1):.0%}, "
+              f"{extra / max(compared, 1):.2f} extra pans on average; "
+              f"heuristic {heuristic_time / args.cases * 1e3:.3f} ms, exact {exact_time / args.cases * 1e3:.1f} ms per case")
+
+    for mix_dishes in (False, True):
+        bags, trays = kitchen(rng, args.large_bags, args.large_pans, dish_count=40)
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            result = pack_bags(bags, trays, mix_dishes=mix_dishes)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        mode = "mixed dishes" if mix_dishes else "one dish/pan"
+        print(f"{mode:<13} {args.large_bags} bags into {args.large_pans} pans: p50 {timings[10] * 1e3:.2f} ms, "
+              f"{result['pans_used']} pans (lower bound {result['lower_bound']}), {len(result['unplaced'])} unplaced")
+
+if __name__ == "__main__":
+    main()
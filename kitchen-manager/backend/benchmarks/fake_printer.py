@@ -0,0 +1,129 @@
+"""
+Stand-in for the Android printer app, for benchmarks and local testing.
+
+Accepts the same requests as the phone (/print-label, /print-labels,
+/print-text, GET /health) and answers after a configurable per-label
+latency with jitter, failing a configurable share of requests with 503.
+It records when each tray's label was "printed" so callers can measure
+end-to-end latency.
+
+Run on its own:
+
+    cd backend
+    python -m benchmarks.fake_printer --port 8080 --latency 0.05 --failure-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+class FakePrinter:
+    def __init__(self, port: int = 0, latency: float = 0.05, jitter: float = 0.0,
+                 failure_rate: float = 0.0, host: str = "127.0.0.1"):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        # tray ID -> wall-clock time its label finished printing
+        self.printed: Dict[str, float] = {}
+        self.requests = 0
+        self.labels = 0
+        self.failures = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        printer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: bytes = b'{"success": true}'):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply(200 if self.path == "/health" else 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/print-labels":
+                    labels = payload.get("labels", [])
+                elif self.path in ("/print-label", "/print-text"):
+                    labels = [payload]
+                else:
+                    self._reply(404)
+                    return
+
+                # The head prints one label at a time
+                delay = printer.latency * len(labels) + random.uniform(-printer.jitter, printer.jitter)
+                time.sleep(max(0.0, delay))
+                with printer.lock:
+                    printer.requests += 1
+                    if random.random() < printer.failure_rate:
+                        printer.failures += 1
+                        failed = True
+                    else:
+                        failed = False
+                        now = time.time()
+                        for label in labels:
+                            printer.labels += 1
+                            tray_id = label.get("trayId")
+                            if tray_id:
+                                printer.printed[tray_id] = now
+                if failed:
+                    self._reply(503, b'{"success": false, "error": "paper jam"}')
+                else:
+                    self._reply(200)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def reset(self):
+        with self.lock:
+            self.printed.clear()
+            self.requests = self.labels = self.failures = 0
+
+    def start(self) -> "FakePrinter":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per label")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    printer = FakePrinter(args.port, args.latency, args.jitter, args.failure_rate, host="0.0.0.0").start()
+    print(f"Fake printer listening on {printer.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{printer.requests} requests, {printer.labels} labels, {printer.failures} failures")
+    except KeyboardInterrupt:
+        printer.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services.event_bus import EventBus, _EventLog
+
+
+def test_subscribers_get_their_topics_until_they_disconnect():
+    async def main():
+        bus = EventBus()
+        jobs = bus.subscribe({"jobs"})
+        everything = bus.subscribe()
+        bus.publish("prep", "prep.updated", {"seq": 1})
+        bus.publish("jobs", "job.created", {"id": "j1"})
+
+        assert (await jobs.get(timeout=1))["type"] == "job.created"
+        assert [(await everything.get(timeout=1))["id"] for _ in range(2)] == [1, 2]
+        assert await jobs.get(timeout=0.01) is None
+
+        jobs.subscribe({"prep"})
+        jobs.unsubscribe({"jobs"})
+        bus.publish("jobs", "job.created", {"id": "j2"})
+        bus.publish("prep", "prep.updated", {"seq": 2})
+        assert (await jobs.get(timeout=1))["data"] == {"seq": 2}
+
+        jobs.close()
+        assert bus.subscriber_count == 1
+        with pytest.raises(EOFError):
+            await jobs.get(timeout=1)
+        await bus.close()
+        assert bus.subscriber_count == 0
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_is_dropped():
+    async def main():
+        bus = EventBus(max_queue=2)
+        slow = bus.subscribe()
+        for seq in range(3):
+            bus.publish("prep", "prep.updated", {"seq": seq})
+        assert slow.overflowed and bus.subscriber_count == 0
+        with pytest.raises(EOFError):
+            while True:
+                await slow.get(timeout=1)
+
+    asyncio.run(main())
+
+
+def test_resuming_replays_missed_events_or_resets():
+    async def main():
+        bus = EventBus(history=3)
+        for seq in range(5):
+            bus.publish("prep", "prep.updated", {"seq": seq})
+        resumed = bus.subscribe(last_event_id=3)
+        assert [(await resumed.get(timeout=1))["id"] for _ in range(2)] == [4, 5]
+        evicted = bus.subscribe(last_event_id=1)
+        assert (await evicted.get(timeout=1))["type"] == "stream.reset"
+        unknown = bus.subscribe(last_event_id=99)
+        assert (await unknown.get(timeout=1))["type"] == "stream.reset"
+        await bus.close()
+
+    asyncio.run(main())
+
+
+def test_events_are_relayed_between_workers(tmp_path):
+    async def main():
+        first = EventBus(relay_dir=str(tmp_path), poll_interval=0.01)
+        second = EventBus(relay_dir=str(tmp_path), poll_interval=0.01)
+        listening = second.subscribe({"jobs"})
+
+        sent = first.publish("jobs", "job.created", {"id": "j1"})
+        received = await listening.get(timeout=1)
+        assert received == sent
+        # IDs continue from the shared log, whichever worker publishes
+        assert second.publish("jobs", "job.state", {"id": "j1"})["id"] == 2
+        assert (await listening.get(timeout=1))["id"] == 2
+
+        # A worker started later can resume a client from the shared history
+        third = EventBus(relay_dir=str(tmp_path))
+        resumed = third.subscribe(last_event_id=1)
+        assert (await resumed.get(timeout=1))["type"] == "job.state"
+        for bus in (first, second, third):
+            await bus.close()
+
+    asyncio.run(main())
+
+
+def test_relay_log_rolls_over_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(_EventLog, "SEGMENT_EVENTS", 4)
+
+    async def main():
+        writer = EventBus(relay_dir=str(tmp_path))
+        reader = EventBus(relay_dir=str(tmp_path), poll_interval=0.01)
+        listening = reader.subscribe()
+        for seq in range(10):
+            writer.publish("prep", "prep.updated", {"seq": seq})
+            await asyncio.sleep(0.03)
+        assert [(await listening.get(timeout=1))["data"]["seq"] for _ in range(10)] == list(range(10))
+        # Only the current segment and the one before it are kept
+        assert sorted(os.listdir(tmp_path)) == ["events-1.log", "events-2.log", "events.lock"]
+
+        # A worker that falls more than a segment behind is told to reload
+        for seq in range(10, 20):
+            writer.publish("prep", "prep.updated", {"seq": seq})
+        assert (await listening.get(timeout=1))["type"] == "stream.reset"
+        seqs = [(await listening.get(timeout=1))["data"]["seq"] for _ in range(5)]
+        assert seqs == list(range(15, 20))
+        await writer.close()
+        await reader.close()
+
+    asyncio.run(main())
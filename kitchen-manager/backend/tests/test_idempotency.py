@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from app.core.idempotency import IdempotencyMiddleware, IdempotencyStore
+from app.services.state_store import FileStateStore
+
+
+class PrintApp:
+    """ASGI app standing in for a print endpoint: counts calls and answers with the call number."""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps({"call": call}).encode()})
+
+
+def client_for(app, store):
+    middleware = IdempotencyMiddleware(app, store=store)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test")
+
+
+def test_repeated_key_replays_the_first_response():
+    async def main():
+        app = PrintApp()
+        async with client_for(app, IdempotencyStore()) as client:
+            headers = {"Idempotency-Key": "tap-1"}
+            first = await client.post("/api/labels/print", json={"tray": "A"}, headers=headers)
+            second = await client.post("/api/labels/print", json={"tray": "A"}, headers=headers)
+            reused = await client.post("/api/labels/print", json={"tray": "B"}, headers=headers)
+        assert app.calls == 1
+        assert second.json() == first.json() == {"call": 1}
+        assert second.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        assert reused.status_code == 422
+
+    asyncio.run(main())
+
+
+def test_identical_requests_without_key_count_as_double_taps():
+    async def main():
+        app = PrintApp()
+        async with client_for(app, IdempotencyStore()) as client:
+            await client.post("/api/printer/add-label?tray_id=A")
+            await client.post("/api/printer/add-label?tray_id=A")
+            await client.post("/api/printer/add-label?tray_id=B")
+            # Not a print endpoint, so never deduplicated
+            await client.post("/api/labels/generate", json=[])
+            await client.post("/api/labels/generate", json=[])
+        assert app.calls == 4
+
+    asyncio.run(main())
+
+
+def test_concurrent_duplicates_wait_for_the_first():
+    async def main():
+        app = PrintApp(delay=0.05)
+        async with client_for(app, IdempotencyStore()) as client:
+            responses = await asyncio.gather(*(
+                client.post("/api/android/print-text", json={"text": "hi"}) for _ in range(5)
+            ))
+        assert app.calls == 1
+        assert {response.json()["call"] for response in responses} == {1}
+
+    asyncio.run(main())
+
+
+def test_failed_requests_are_not_replayed():
+    async def main():
+        app = PrintApp(status=503)
+        async with client_for(app, IdempotencyStore()) as client:
+            headers = {"Idempotency-Key": "tap-2"}
+            await client.post("/api/labels/print", json={}, headers=headers)
+            await client.post("/api/labels/print", json={}, headers=headers)
+        assert app.calls == 2
+
+    asyncio.run(main())
+
+
+def test_duplicates_on_another_worker_are_replayed(tmp_path):
+    async def main():
+        first_app, second_app = PrintApp(delay=0.1), PrintApp()
+        first_store = IdempotencyStore(shared=FileStateStore(str(tmp_path)))
+        second_store = IdempotencyStore(shared=FileStateStore(str(tmp_path)))
+        headers = {"Idempotency-Key": "tap-3"}
+        async with client_for(first_app, first_store) as first, client_for(second_app, second_store) as second:
+            # The second worker gets the duplicate while the first is still printing
+            in_flight = asyncio.ensure_future(first.post("/api/labels/print", json={}, headers=headers))
+            await asyncio.sleep(0.02)
+            duplicate = await second.post("/api/labels/print", json={}, headers=headers)
+            original = await in_flight
+            later = await second.post("/api/labels/print", json={}, headers=headers)
+            reused = await second.post("/api/labels/print", json={"other": 1}, headers=headers)
+        assert first_app.calls == 1 and second_app.calls == 0
+        assert duplicate.json() == original.json() == later.json()
+        assert duplicate.headers["idempotent-replayed"] == "true"
+        assert reused.status_code == 422
+
+    asyncio.run(main())
+
+
+def test_failed_request_releases_the_shared_key(tmp_path):
+    async def main():
+        failing, working = PrintApp(status=500), PrintApp()
+        headers = {"Idempotency-Key": "tap-4"}
+        async with client_for(failing, IdempotencyStore(shared=FileStateStore(str(tmp_path)))) as first, \
+                client_for(working, IdempotencyStore(shared=FileStateStore(str(tmp_path)))) as second:
+            await first.post("/api/labels/print", json={}, headers=headers)
+            retried = await second.post("/api/labels/print", json={}, headers=headers)
+        assert retried.status_code == 200 and working.calls == 1
+
+    asyncio.run(main())
+
+
+def test_shared_entries_are_kept_per_key_and_swept_when_expired(tmp_path):
+    async def main():
+        shared = FileStateStore(str(tmp_path))
+        store = IdempotencyStore(shared=shared)
+        async with client_for(PrintApp(), store) as client:
+            for key in ("tap-5", "tap-6"):
+                await client.post("/api/labels/print", json={}, headers={"Idempotency-Key": key})
+        assert len(shared.keys("idempotency-")) == 2
+
+        entry = shared.keys("idempotency-")[0]
+        with shared.lock(entry):
+            value, _ = shared.get(entry)
+            shared.put(entry, {**value, "expires_at": time.time() - 1})
+        assert store.sweep_shared() == 1
+        kept = shared.keys("idempotency-")
+        assert len(kept) == 1
+        # The swept entry's lock file goes with it
+        assert sorted(os.listdir(tmp_path)) == [f"{kept[0]}.json", f"{kept[0]}.lock"]
+
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import base64
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import android
+from app.services.container import get_label_printer
+from app.services.label_raster import DEFAULT_DOT_WIDTH, LabelRasterizer
+
+LINES = ["Chicken Curry", "Prep: 2026-03-02", "Expiry: 2026-03-05"]
+
+
+def bitmap(raster):
+    rows = np.frombuffer(raster.data, dtype=np.uint8).reshape(raster.height, -1)
+    return np.unpackbits(rows, axis=1)[:, :raster.width].astype(bool)
+
+
+@pytest.fixture
+def rasterizer():
+    return LabelRasterizer()
+
+
+def test_raster_is_the_printer_width_and_has_ink(rasterizer):
+    raster = rasterizer.render(LINES, {"dotWidth": 576})
+    assert raster.width == 576
+    assert len(raster.data) == raster.height * 576 // 8
+    dots = bitmap(raster)
+    assert 0 < dots.sum() < dots.size // 2
+
+    narrow = rasterizer.render(LINES, {})
+    assert narrow.width == DEFAULT_DOT_WIDTH
+    assert narrow.height == raster.height
+
+
+def test_long_lines_wrap_and_feed_adds_blank_rows(rasterizer):
+    short = rasterizer.render(["Curry"], {})
+    wrapped = rasterizer.render(["Curry " * 40], {})
+    assert wrapped.height > short.height
+    fed = bitmap(rasterizer.render(["Curry"], {"linesPerFeed": 2}))
+    assert fed.shape[0] == 3 * short.height
+    assert not fed[short.height:].any()
+
+
+def test_qr_code_only_when_asked_for(rasterizer):
+    plain = rasterizer.render(LINES, {}, qr_data="TRAY-1")
+    with_qr = rasterizer.render(LINES, {"useQRCode": True}, qr_data="TRAY-1")
+    assert with_qr.height > plain.height
+    assert bitmap(with_qr)[plain.height:].any()
+
+
+def test_dark_mode_inverts(rasterizer):
+    light = bitmap(rasterizer.render(LINES, {}))
+    dark = bitmap(rasterizer.render(LINES, {"darkMode": True}))
+    assert (dark == ~light).all()
+
+
+def test_rasters_are_cached_by_content_and_settings(rasterizer):
+    first = rasterizer.render(LINES, {"dotWidth": 384})
+    assert rasterizer.render(list(LINES), {"dotWidth": 384}) is first
+    assert rasterizer.render(LINES, {"dotWidth": 576}) is not first
+
+
+class FakeDispatcher:
+    base_url = "http://phone"
+
+    def __init__(self):
+        self.sent = []
+
+    async def post(self, path, data):
+        self.sent.append((path, data))
+        return type("Response", (), {"status_code": 200})()
+
+
+def test_android_print_label_attaches_the_raster():
+    dispatcher = FakeDispatcher()
+    printer = type("Printer", (), {"dispatcher": dispatcher})()
+    app = FastAPI()
+    app.include_router(android.router)
+    app.dependency_overrides[get_label_printer] = lambda: printer
+    client = TestClient(app)
+
+    label_data = {"dishName": "Curry", "prepDate": "2026-03-02", "expiryDate": "2026-03-05", "trayId": "T1"}
+    response = client.post("/print-label", json={
+        "label_data": label_data, "settings": {"rasterize": True, "dotWidth": 576, "useQRCode": True},
+    })
+    assert response.status_code == 200
+    path, sent = dispatcher.sent[0]
+    raster = sent["raster"]
+    assert path == "/print-label"
+    assert (raster["width"], raster["format"]) == (576, "1bpp-msb")
+    assert len(base64.b64decode(raster["data"])) == raster["height"] * 576 // 8
+
+    client.post("/print-label", json={"label_data": label_data, "settings": {}})
+    client.post("/print-text", json={"text": "Curry\nT1", "settings": {"rasterize": True}})
+    assert "raster" not in dispatcher.sent[1][1]
+    assert dispatcher.sent[2][1]["raster"]["width"] == DEFAULT_DOT_WIDTH
@@ -0,0 +1,112 @@
+import json
+import os
+
+from app.services.label_storage import LabelStorage
+
+
+def make_storage(path, **kwargs):
+    return LabelStorage(storage_dir=str(path), compact_interval=0, **kwargs)
+
+
+def label(label_id, **fields):
+    return {"label_id": label_id, "parsed_data": {"dish": fields.pop("dish", "Soup")}, **fields}
+
+
+def test_replay_restores_saves_and_deletes(tmp_path):
+    storage = make_storage(tmp_path)
+    storage.save_labels([label("a"), label("b"), label("c")])
+    storage.save_label(label("a", dish="Stew"))
+    assert storage.delete_label("b")
+    assert not storage.delete_label("missing")
+    storage.close()
+
+    reopened = make_storage(tmp_path)
+    labels = {item["label_id"]: item for item in reopened.get_labels()}
+    assert sorted(labels) == ["a", "c"]
+    assert labels["a"]["parsed_data"]["dish"] == "Stew"
+    assert "timestamp" in labels["a"]
+    reopened.close()
+
+
+def test_sees_writes_from_another_instance(tmp_path):
+    first = make_storage(tmp_path)
+    second = make_storage(tmp_path)
+    first.save_label(label("a"))
+    assert second.get_label("a")["label_id"] == "a"
+    second.delete_label("a")
+    assert first.get_label("a") is None
+    first.close()
+    second.close()
+
+
+def test_torn_tail_is_ignored_and_truncated_by_next_write(tmp_path):
+    storage = make_storage(tmp_path)
+    storage.save_label(label("a"))
+    storage.close()
+    with open(os.path.join(tmp_path, "labels.log"), "ab") as f:
+        f.write(b'{"op":"put","label":{"label_id":"torn"')
+
+    reopened = make_storage(tmp_path)
+    assert [item["label_id"] for item in reopened.get_labels()] == ["a"]
+    reopened.save_label(label("b"))
+    with open(os.path.join(tmp_path, "labels.log"), "rb") as f:
+        lines = f.read().splitlines()
+    # Every line is a complete record again
+    assert [json.loads(line)["op"] for line in lines][-2:] == ["put", "put"]
+    assert b"torn" not in b"".join(lines)
+    reopened.close()
+
+
+def test_compaction_keeps_only_live_labels(tmp_path):
+    storage = make_storage(tmp_path, compact_min_records=10)
+    for i in range(10):
+        storage.save_label(label("a", dish=f"v{i}"))
+    storage.save_label(label("b"))
+    storage.delete_label("b")
+    assert storage.compact()
+    with open(os.path.join(tmp_path, "labels.log"), "rb") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["op"] for record in records] == ["snapshot", "put"]
+    assert records[1]["label"]["parsed_data"]["dish"] == "v9"
+    assert not storage.compact()
+    storage.close()
+
+
+def test_other_instance_replays_after_compaction(tmp_path):
+    first = make_storage(tmp_path)
+    second = make_storage(tmp_path)
+    first.save_labels([label("a"), label("b")])
+    assert len(second.get_labels()) == 2
+    first.delete_label("a")
+    first.compact(force=True)
+    first.save_label(label("c"))
+    assert sorted(item["label_id"] for item in second.get_labels()) == ["b", "c"]
+    first.close()
+    second.close()
+
+
+def test_compaction_detected_when_inode_is_reused(tmp_path):
+    first = make_storage(tmp_path)
+    second = make_storage(tmp_path)
+    first.save_labels([label("a"), label("b"), label("c")])
+    assert len(second.get_labels()) == 3
+    first.delete_label("a")
+    first.compact(force=True)
+    # Pretend the new log got the inode the other instance remembers
+    stat = os.stat(os.path.join(tmp_path, "labels.log"))
+    second._log_identity = (stat.st_dev, stat.st_ino, second._log_identity[2])
+    assert sorted(item["label_id"] for item in second.get_labels()) == ["b", "c"]
+    first.close()
+    second.close()
+
+
+def test_results_do_not_alias_the_index(tmp_path):
+    storage = make_storage(tmp_path)
+    saved = label("a")
+    storage.save_label(saved)
+    saved["parsed_data"]["dish"] = "changed by caller"
+    fetched = storage.get_label("a")
+    fetched["parsed_data"]["dish"] = "changed again"
+    storage.get_labels()[0]["parsed_data"]["dish"] = "and again"
+    assert storage.get_label_by_id("a")["parsed_data"]["dish"] == "Soup"
+    storage.close()
@@ -0,0 +1,64 @@
+from app.services.label_templates import (
+    PREP_BAG_LABEL, SAVED_LABEL, TRAY_LABEL, Blank, Items, LabelRenderer, LabelTemplate, Line, Section,
+)
+
+TRAY_VALUES = {
+    "tray_name": "GN 1/3", "tray_size": "1/3", "tray_material": "Steel", "tray_volume": "4.0L",
+    "dish_name": "Curry", "prep_date": "2026-03-02", "expiry_date": "2026-03-05",
+    "ingredients": ["rice", "chicken"], "allergens": [], "notes": "Keep chilled",
+}
+
+
+def test_tray_label_renders_sections_only_when_filled():
+    rendered = TRAY_LABEL.render(TRAY_VALUES)
+    assert rendered.lines == (
+        "Tray: GN 1/3", "Size: 1/3", "Material: Steel", "Volume: 4.0L", "",
+        "Dishes: Curry", "Prep Date: 2026-03-02", "Expiry Date: 2026-03-05", "",
+        "Ingredients:", "- rice", "- chicken",
+        "", "Notes: Keep chilled",
+    )
+    assert rendered.text.startswith("Tray: GN 1/3\nSize: 1/3")
+
+
+def test_optional_lines_and_joined_fields():
+    rendered = PREP_BAG_LABEL.render({"dish_name": "Curry", "prep_date": "2026-03-02",
+                                      "expiry_date": "2026-03-05", "ingredients": ["rice", "chicken"]})
+    assert rendered.lines == ("Curry", "Prep: 2026-03-02", "Expiry: 2026-03-05", "Ingredients: rice, chicken")
+    assert rendered.fields["ingredients"] == "rice, chicken"
+    assert rendered.fields["tray_id"] == ""
+
+
+def test_identical_labels_are_rendered_once():
+    renderer = LabelRenderer([TRAY_LABEL, SAVED_LABEL])
+    first = renderer.render("tray", TRAY_VALUES)
+    again = renderer.render("tray", dict(TRAY_VALUES))
+    assert again is first
+    assert (renderer.hits, renderer.misses) == (1, 1)
+
+    renderer.render("tray", {**TRAY_VALUES, "notes": ""})
+    assert (renderer.hits, renderer.misses) == (1, 2)
+
+
+def test_cache_evicts_the_least_recently_used():
+    renderer = LabelRenderer([SAVED_LABEL], max_entries=2)
+    for name in ("a", "b", "a", "c"):
+        renderer.render("saved_label", {"product_name": name})
+    renderer.render("saved_label", {"product_name": "a"})
+    assert renderer.hits == 2
+    renderer.render("saved_label", {"product_name": "b"})
+    assert renderer.misses == 4
+
+
+def test_replacing_a_template_drops_its_cached_labels():
+    renderer = LabelRenderer([SAVED_LABEL, TRAY_LABEL])
+    values = {"product_name": "Soup", "employee_name": "Sam", "dates": ["2026-03-02"]}
+    assert renderer.render("saved_label", values).lines[0] == "Product: Soup"
+    tray = renderer.render("tray", TRAY_VALUES)
+
+    renderer.register(LabelTemplate("saved_label", [
+        Line("{product_name} by {employee_name}"),
+        Section("dates", [Blank(), Items("dates", "* {}")]),
+    ]))
+    assert renderer.render("saved_label", values).lines == ("Soup by Sam", "", "* 2026-03-02")
+    # Other layouts keep their cached labels
+    assert renderer.render("tray", TRAY_VALUES) is tray
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import labels
+from app.services.container import get_label_generator, get_label_printer
+from app.services.label_generator import LabelGenerator
+from app.services.printer_registry import PrinterNotFoundError
+
+
+class FakePrinter:
+    """Queues labels in memory; stations other than ``known`` have no printer."""
+
+    def __init__(self, known=("hot", None)):
+        self.known = known
+        self.queued = []
+
+    async def print_label(self, **label):
+        if label["station"] not in self.known:
+            raise PrinterNotFoundError(f"No printer for station {label['station']}")
+        self.queued.append(label["tray_id"])
+        return f"job-{len(self.queued)}"
+
+
+@pytest.fixture
+def printer():
+    return FakePrinter()
+
+
+@pytest.fixture
+def client(printer):
+    app = FastAPI()
+    app.include_router(labels.router)
+    app.dependency_overrides[get_label_generator] = lambda: LabelGenerator(tray_repository=object())
+    app.dependency_overrides[get_label_printer] = lambda: printer
+    return TestClient(app)
+
+
+def label(tray_id, **fields):
+    return {"tray_id": tray_id, "dish_name": "Curry", "prep_date": "2026-03-02",
+            "expiry_date": "2026-03-05", **fields}
+
+
+def test_print_reports_an_unknown_station_for_that_label_only(client, printer):
+    response = client.post("/print", json={"labels": [
+        label("T1"),
+        label("T2", station="pastry"),
+        label("T3", station="hot"),
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(r["tray_id"], r["status"]) for r in results] == [("T1", "queued"), ("T2", "error"), ("T3", "queued")]
+    assert "pastry" in results[1]["error"]
+    assert printer.queued == ["T1", "T3"]
+
+
+def bulk_body(count):
+    lines = []
+    for i in range(count):
+        if i % 50 == 7:
+            lines.append('{"tray_id": "T%d", "dish_name": "Curry"}' % i)
+        elif i % 50 == 21:
+            lines.append("not json")
+        else:
+            lines.append(json.dumps(label(f"T{i}", ingredients=["rice"], notes=f"bag {i}")))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def without_ids(items):
+    return [{k: v for k, v in item.items() if k not in ("id", "created_at")} for item in items]
+
+
+def test_streamed_bulk_matches_the_batch_route(client, monkeypatch):
+    monkeypatch.setattr(labels, "BULK_CHUNK_LINES", 64)
+    body = bulk_body(450)
+
+    def in_pieces(size=997):
+        # Piece boundaries fall mid-line, as network reads do
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+
+    streamed = client.post("/generate-bulk", content=in_pieces())
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert client.post("/generate-bulk", content=body).text.count("\n") == len(lines) == 450
+
+    errors = [line for line in lines if "error" in line]
+    assert [error["line"] for error in errors] == [i + 1 for i in range(450) if i % 50 in (7, 21)]
+    assert len(errors) == 18
+
+    valid = [json.loads(line) for line in body.splitlines() if b'"expiry_date"' in line]
+    batch = client.post("/generate", json={"labels": valid})
+    assert batch.status_code == 200
+    assert without_ids(line for line in lines if "error" not in line) == without_ids(batch.json())
+
+
+def test_bulk_takes_a_last_line_without_newline(client):
+    response = client.post("/generate-bulk", content=json.dumps(label("T1")).encode())
+    assert [item["tray_id"] for item in map(json.loads, response.text.splitlines())] == ["T1"]
@@ -0,0 +1,111 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from app.services import prep_history
+from app.services.prep_history import PrepHistory
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Set ``clock.now_value`` to move the history's idea of the current time."""
+
+    class Clock(datetime):
+        now_value = datetime(2026, 3, 2, 22, 0)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.now_value
+
+    class Today(date):
+        @classmethod
+        def today(cls):
+            return Clock.now_value.date()
+
+    monkeypatch.setattr(prep_history, "datetime", Clock)
+    monkeypatch.setattr(prep_history, "date", Today)
+    return Clock
+
+
+def event(kind, bag_id, dish="Curry", tray_id="T1", rice=200):
+    return {
+        "type": f"bag.{kind}",
+        "dish_id": f"dish-{dish}",
+        "dish": dish,
+        "tray_id": tray_id,
+        "bag_id": bag_id,
+        "ingredients": [{"name": "rice", "weight": rice, "unit": "g"}],
+        "addedIngredients": [],
+    }
+
+
+def test_reopen_the_next_day_comes_off_the_completion_day(tmp_path, clock):
+    history = PrepHistory(str(tmp_path))
+    history.record([event("completed", "b1"), event("completed", "b2")])
+
+    clock.now_value = datetime(2026, 3, 3, 8, 0)
+    history.record([event("reopened", "b1")])
+    history.record([event("completed", "b3")])
+
+    assert history.daily() == [
+        {"day": "2026-03-02", "bags": 1, "dishes": {"Curry": 1}, "trays": {"T1": 1}},
+        {"day": "2026-03-03", "bags": 1, "dishes": {"Curry": 1}, "trays": {"T1": 1}},
+    ]
+    assert history.recent(1)[0]["bag_id"] == "b3"
+    assert history.recent(2)[1]["completed_day"] == "2026-03-02"
+    history.close()
+
+
+@pytest.mark.parametrize("checkpoint_every", [1, 1000])
+def test_completion_days_survive_a_restart(tmp_path, clock, checkpoint_every):
+    history = PrepHistory(str(tmp_path), checkpoint_every=checkpoint_every)
+    history.record([event("completed", "b1")])
+    history.close()
+
+    clock.now_value = datetime(2026, 3, 3, 8, 0)
+    reopened = PrepHistory(str(tmp_path), checkpoint_every=checkpoint_every)
+    reopened.record([event("reopened", "b1")])
+    assert reopened.daily() == []
+    reopened.close()
+
+
+def test_reopen_is_seen_by_another_worker(tmp_path, clock):
+    first = PrepHistory(str(tmp_path))
+    second = PrepHistory(str(tmp_path))
+    first.record([event("completed", "b1")])
+
+    clock.now_value = datetime(2026, 3, 4, 9, 0)
+    second.record([event("reopened", "b1")])
+    assert first.daily() == second.daily() == []
+    first.close()
+    second.close()
+
+
+def test_unknown_or_expired_reopen_leaves_the_totals(tmp_path, clock):
+    history = PrepHistory(str(tmp_path), checkpoint_every=1, reopen_days=7)
+    history.record([event("completed", "b1")])
+
+    clock.now_value = datetime(2026, 3, 20, 9, 0)
+    history.record([event("reopened", "never-completed")])
+    # b1 is older than reopen_days and was forgotten at that checkpoint
+    history.record([event("completed", "b2")])
+    history.record([event("reopened", "b1")])
+
+    assert [(row["day"], row["bags"]) for row in history.daily()] == [("2026-03-02", 1), ("2026-03-20", 1)]
+    history.close()
+
+
+def test_legacy_reopen_without_completed_day_uses_its_own_day(tmp_path):
+    records = [
+        {**event("completed", "b1"), "at": "2026-03-02T22:00:00", "day": "2026-03-02"},
+        {**event("completed", "b2"), "at": "2026-03-02T23:00:00", "day": "2026-03-02"},
+        {**event("reopened", "b1"), "at": "2026-03-03T09:00:00", "day": "2026-03-03"},
+    ]
+    (tmp_path / "events.log").write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    history = PrepHistory(str(tmp_path))
+    # 2026-03-03 nets to -1 bags and is left out of the reports
+    assert [(row["day"], row["bags"]) for row in history.daily()] == [("2026-03-02", 2)]
+    assert history.dishes()[0]["days"] == 1
+    history.close()
@@ -0,0 +1,147 @@
+import pytest
+
+from app.api.prep_tracking import prep_tracking_data
+from app.services.prep_state import PrepState, PrepVersionConflict
+
+
+def bag(bag_id, complete=True, **ingredients):
+    return {
+        "id": bag_id,
+        "isComplete": complete,
+        "ingredients": [{"name": name, "weight": weight, "unit": "g"} for name, weight in ingredients.items()],
+    }
+
+
+def dish(dish_id, tray_id, *bags, **fields):
+    return {"id": dish_id, "name": f"Dish {dish_id}", "trayId": tray_id, "prepBags": list(bags), **fields}
+
+
+def view(state):
+    return {
+        "dishes": state.dishes(),
+        "completed": state.completed_bags(),
+        "trays": state.tray_contents(),
+    }
+
+
+def test_deltas_end_in_the_same_state_as_a_snapshot():
+    state = PrepState()
+    state.replace([
+        dish("d1", "T1", bag("b1", rice=200), bag("b2", complete=False, rice=200)),
+        dish("d2", "T1", bag("b3", chicken=150, rice=100)),
+        dish("d3", "T2", bag("b4", beans=500)),
+    ])
+
+    result = state.apply_delta([
+        {"op": "upsert_bag", "dish_id": "d1", "bag": bag("b2", rice=250)},
+        {"op": "remove_bag", "dish_id": "d2", "bag_id": "b3"},
+        {"op": "upsert_bag", "dish_id": "d2", "bag": bag("b5", chicken=300)},
+        {"op": "remove_dish", "dish_id": "d3"},
+        {"op": "upsert_dish", "dish": dish("d4", "T3", bag("b6", kale=80))},
+    ], base_seq=state.seq)
+    assert result["applied"] == 5 and not result["rejected"]
+    assert result["changed_trays"] == ["T1", "T2", "T3"]
+
+    expected = PrepState()
+    expected.replace([
+        dish("d1", "T1", bag("b1", rice=200), bag("b2", rice=250)),
+        dish("d2", "T1", bag("b5", chicken=300)),
+        dish("d4", "T3", bag("b6", kale=80)),
+    ])
+    assert view(state) == view(expected)
+    assert state.tray("T1")["ingredients"]["rice"]["total_weight"] == pytest.approx(450)
+    assert state.tray("T2") == {"dishes": [], "total_bags": 0, "ingredients": {}}
+
+
+def test_stale_delta_is_refused_and_stale_ops_ignored():
+    state = PrepState()
+    seq = state.replace([dish("d1", "T1", bag("b1", rice=200))])
+
+    with pytest.raises(PrepVersionConflict):
+        state.apply_delta([{"op": "remove_dish", "dish_id": "d1"}], base_seq=seq - 1)
+
+    state.apply_delta([{"op": "upsert_bag", "dish_id": "d1", "bag": bag("b1", rice=300), "version": 2}])
+    result = state.apply_delta([{"op": "upsert_bag", "dish_id": "d1", "bag": bag("b1", rice=100), "version": 1}])
+    assert result["ignored"] == 1
+    assert state.tray("T1")["ingredients"]["rice"]["total_weight"] == pytest.approx(300)
+
+
+def test_snapshot_keeps_fields_it_does_not_declare():
+    sent = dish("d1", "T1", {**bag("b1", rice=200), "station": "hot"}, allergens=["gluten"])
+    sent["prepBags"][0]["ingredients"][0]["batch"] = "B-12"
+    data = prep_tracking_data.validate_python({"dishes": [sent], "selectedTrays": ["T1"], "shift": "am"})
+    assert data["shift"] == "am"
+
+    snapshot = PrepState()
+    snapshot.replace(data["dishes"])
+    delta = PrepState()
+    delta.apply_delta([{"op": "upsert_dish", "dish": sent}])
+    assert snapshot.dishes() == delta.dishes() == [sent]
+
+
+def measured_bag(bag_id, *ingredients, added=()):
+    """A completed bag of ``(name, weight, unit)`` ingredients."""
+    def listed(items):
+        return [{"name": name, "weight": weight, "unit": unit} for name, weight, unit in items]
+    return {"id": bag_id, "isComplete": True, "ingredients": listed(ingredients), "addedIngredients": listed(added)}
+
+
+MIXED_DISHES = [
+    dish("d1", "T1",
+         measured_bag("b1", ("rice", 500, "g"), ("stock", 250, "ml"), ("eggs", 2, "pcs")),
+         measured_bag("b2", ("rice", 1, "kg"), ("stock", 0.5, "L"), ("eggs", 3, "each"))),
+    dish("d2", "T1",
+         measured_bag("b3", ("saffron", 2, "pinch"), ("rice", 200, "g"), added=[("oil", 2, "tbsp")]),
+         measured_bag("b4", ("rice", 300, "ml"), ("saffron", 1, "pinch"))),
+    dish("d3", "T2", measured_bag("b5", ("rice", 1.5, "kg"), ("stock", 1, "l"))),
+]
+
+
+def test_totals_add_up_across_units():
+    state = PrepState()
+    state.replace(MIXED_DISHES)
+    ingredients = state.tray("T1")["ingredients"]
+
+    # 500 g + 1 kg + 200 g, reported in the unit first seen
+    assert ingredients["rice (g)"] == {"total_weight": pytest.approx(1700), "unit": "g"}
+    # 250 ml + 0.5 l
+    assert ingredients["stock"] == {"total_weight": pytest.approx(750), "unit": "ml"}
+    # Counts: pcs and each are the same unit
+    assert ingredients["eggs"] == {"total_weight": pytest.approx(5), "unit": "pcs"}
+    # Rice measured by volume is not added to rice by weight
+    assert ingredients["rice (ml)"] == {"total_weight": pytest.approx(300), "unit": "ml"}
+    # An unknown unit is kept as it is, not converted or merged
+    assert ingredients["saffron"] == {"total_weight": pytest.approx(3), "unit": "pinch"}
+    assert state.tray("T2")["ingredients"]["rice"] == {"total_weight": pytest.approx(1.5), "unit": "kg"}
+
+
+def test_volumes_count_weight_and_volume_but_not_pieces():
+    state = PrepState()
+    state.replace(MIXED_DISHES)
+    volumes = {bag["id"]: bag["volume"] for bag in state.completed_bags()}
+    # 500 g + 250 ml with the 20% buffer; eggs take no counted space
+    assert volumes["b1"] == pytest.approx(0.75 * 1.2)
+    assert volumes["b2"] == pytest.approx(1.5 * 1.2)
+    # Unknown units add nothing; added ingredients do (2 tbsp = 30 ml)
+    assert volumes["b3"] == pytest.approx(0.23 * 1.2)
+
+
+def test_batch_measurement_matches_measuring_bag_by_bag():
+    batch = PrepState()
+    batch.replace(MIXED_DISHES)
+    by_bag = PrepState()
+    by_bag.apply_delta([{"op": "upsert_dish", "dish": dish(d["id"], d["trayId"])} for d in MIXED_DISHES])
+    by_bag.apply_delta([{"op": "upsert_bag", "dish_id": d["id"], "bag": b}
+                        for d in MIXED_DISHES for b in d["prepBags"]])
+
+    def approx(contents):
+        return {tray_id: {name: {"total_weight": pytest.approx(totals["total_weight"]), "unit": totals["unit"]}
+                          for name, totals in tray["ingredients"].items()}
+                for tray_id, tray in contents.items()}
+
+    assert approx(batch.tray_contents()) == approx(by_bag.tray_contents())
+    assert [bag["volume"] for bag in batch.completed_bags()] == pytest.approx(
+        [bag["volume"] for bag in by_bag.completed_bags()])
+    # Both keep the ingredients in the order they were first seen
+    assert [list(tray["ingredients"]) for tray in batch.tray_contents().values()] == \
+        [list(tray["ingredients"]) for tray in by_bag.tray_contents().values()]
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+import pytest
+
+from app.api.labels import spool_full_exception
+from app.services.print_spool import PrintSpool, SpoolFullError
+from app.services.printer_health import PrinterUnavailableError
+
+
+class FakePrinter:
+    """Dispatcher stand-in answering each request with the next queued status."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    async def post(self, path, payload):
+        self.requests.append((path, payload))
+        return httpx.Response(self.statuses.pop(0) if self.statuses else 200)
+
+
+def make_spool(tmp_path, printers, **kwargs):
+    kwargs.setdefault("base_delay", 0.001)
+    kwargs.setdefault("max_delay", 0.01)
+    return PrintSpool(printers.__getitem__, spool_dir=str(tmp_path), **kwargs)
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+def journal(tmp_path):
+    with open(os.path.join(tmp_path, "spool.log"), "rb") as f:
+        return [json.loads(line) for line in f]
+
+
+def journaled_failures(tmp_path):
+    return sum(1 for record in journal(tmp_path) if record.get("fields", {}).get("state") == "failed")
+
+
+def test_failed_attempts_are_retried_until_printed(tmp_path):
+    async def main():
+        printer = FakePrinter([500, 503])
+        spool = make_spool(tmp_path, {"a": printer})
+        job = await spool.submit("a", "/print-text", {"text": "hi"})
+        await wait_for(lambda: spool.completed == 1)
+        assert len(printer.requests) == 3
+        assert spool.get_job(job["id"]) is None
+        await spool.close()
+
+    asyncio.run(main())
+
+
+def test_job_that_uses_up_its_attempts_leaves_the_queue(tmp_path):
+    async def main():
+        printer = FakePrinter([500] * 10)
+        spool = make_spool(tmp_path, {"a": printer}, max_attempts=3, max_failed=1)
+        first = await spool.submit("a", "/print-text", {"text": "one"})
+        await wait_for(lambda: spool.stats()["failed"] == 1)
+        assert spool.depth("a") == 0
+        assert spool.get_job(first["id"])["state"] == "failed"
+        second = await spool.submit("a", "/print-text", {"text": "two"})
+        await wait_for(lambda: spool.get_job(second["id"])["state"] == "failed")
+        # Only the most recent failures are kept
+        assert spool.get_job(first["id"]) is None
+        assert spool.stats()["failed"] == 1
+        await wait_for(lambda: journaled_failures(tmp_path) == 2)
+        await spool.close()
+
+        reopened = make_spool(tmp_path, {"a": FakePrinter()})
+        assert reopened.depth("a") == 0
+        assert reopened.get_job(second["id"])["state"] == "failed"
+        await reopened.close()
+
+    asyncio.run(main())
+
+
+def test_full_queue_refuses_jobs_with_retry_after(tmp_path):
+    async def main():
+        spool = make_spool(tmp_path, {"a": FakePrinter()}, max_depth=2)
+        # No worker runs until the loop yields, so the queue fills up
+        spool._ensure_worker = lambda printer_id: None
+        spool._wakeups["a"] = asyncio.Event()
+        await spool.submit("a", "/print-text", {"text": "1"})
+        await spool.submit("a", "/print-text", {"text": "2"})
+        with pytest.raises(SpoolFullError) as raised:
+            await spool.submit("a", "/print-text", {"text": "3"})
+        assert spool.depth("a") == 2
+        assert not spool.stats()["printers"]["a"]["accepting"]
+        error = spool_full_exception(raised.value)
+        assert error.status_code == 429
+        assert int(error.headers["Retry-After"]) >= 1
+        await spool.close()
+
+    asyncio.run(main())
+
+
+def test_queued_jobs_survive_a_restart(tmp_path):
+    async def main():
+        spool = make_spool(tmp_path, {"a": FakePrinter()})
+        spool._ensure_worker = lambda printer_id: None
+        spool._wakeups["a"] = asyncio.Event()
+        jobs = [await spool.submit("a", "/print-text", {"text": str(i)}) for i in range(3)]
+        await spool.close()
+
+        printer = FakePrinter()
+        reopened = make_spool(tmp_path, {"a": printer})
+        reopened.start()
+        await wait_for(lambda: reopened.completed == 3)
+        assert [payload["text"] for _, payload in printer.requests] == ["0", "1", "2"]
+        assert all(reopened.get_job(job["id"]) is None for job in jobs)
+        await reopened.close()
+
+    asyncio.run(main())
+
+
+def test_label_jobs_fall_back_to_single_requests(tmp_path):
+    async def main():
+        printer = FakePrinter([404])
+        spool = make_spool(tmp_path, {"a": printer})
+        spool._ensure_worker = lambda printer_id: None
+        spool._wakeups["a"] = asyncio.Event()
+        jobs = [await spool.submit("a", "/print-label", {"n": i}) for i in range(3)]
+        del spool._ensure_worker
+        spool._ensure_worker("a")
+        await wait_for(lambda: spool.completed == 3)
+        assert [path for path, _ in printer.requests] == ["/print-labels"] + ["/print-label"] * 3
+        assert all(spool.get_job(job["id"]) is None for job in jobs)
+        await spool.close()
+
+    asyncio.run(main())
+
+
+def test_batch_trimmed_by_fallback_is_queued_again(tmp_path):
+    async def main():
+        spool = make_spool(tmp_path, {"a": FakePrinter([404, 500])})
+        jobs = [{"id": str(i), "path": "/print-label", "payload": {}, "state": "printing"} for i in range(3)]
+        batch = list(jobs)
+        with pytest.raises(RuntimeError):
+            await spool._send("a", batch)
+        # The head stays with the worker; the rest wait for their own turn
+        assert batch == jobs[:1]
+        assert [job["state"] for job in jobs] == ["printing", "queued", "queued"]
+        await spool.close()
+
+    asyncio.run(main())
+
+
+def test_compaction_drops_finished_jobs(tmp_path, monkeypatch):
+    # Durability is not under test here, only how the journal grows
+    monkeypatch.setattr(os, "fsync", lambda fd: None)
+
+    async def main():
+        spool = make_spool(tmp_path, {"a": FakePrinter()}, max_depth=1000)
+        for i in range(600):
+            await spool.submit("a", "/print-text", {"text": str(i)})
+        await wait_for(lambda: spool.completed == 600)
+        # 1200 records, all finished: the journal was rewritten at least once
+        assert len(journal(tmp_path)) < 1000
+        await spool.close()
+
+    asyncio.run(main())
+
+
+def test_each_spool_claims_its_own_slot(tmp_path):
+    async def main():
+        first = make_spool(tmp_path, {"a": FakePrinter()})
+        second = make_spool(tmp_path, {"a": FakePrinter()})
+        assert first._journal.spool_dir == str(tmp_path)
+        assert second._journal.spool_dir == os.path.join(tmp_path, "worker-1")
+        await first.close()
+        third = make_spool(tmp_path, {"a": FakePrinter()})
+        assert third._journal.spool_dir == str(tmp_path)
+        await second.close()
+        await third.close()
+
+    asyncio.run(main())
+
+
+def test_jobs_left_in_an_unclaimed_slot_are_adopted(tmp_path):
+    async def main():
+        spools = [make_spool(tmp_path, {"a": FakePrinter()}) for _ in range(3)]
+        for spool in spools:
+            spool._ensure_worker = lambda printer_id: None
+            spool._wakeups["a"] = asyncio.Event()
+        for index in (1, 2):
+            for i in range(2):
+                await spools[index].submit("a", "/print-text", {"text": f"{index}-{i}"})
+        for spool in spools[::2]:
+            await spool.close()
+
+        # Back to one worker, while worker-1 is still running: only worker-2 is adopted
+        printer = FakePrinter()
+        survivor = make_spool(tmp_path, {"a": printer})
+        assert survivor._journal.spool_dir == str(tmp_path)
+        assert not os.path.exists(os.path.join(tmp_path, "worker-2", "spool.log"))
+        survivor.start()
+        await wait_for(lambda: survivor.completed == 2)
+        assert [payload["text"] for _, payload in printer.requests] == ["2-0", "2-1"]
+        assert spools[1].depth("a") == 2
+
+        await spools[1].close()
+        await survivor.close()
+        printer = FakePrinter()
+        last = make_spool(tmp_path, {"a": printer})
+        last.start()
+        await wait_for(lambda: last.completed == 2)
+        assert [payload["text"] for _, payload in printer.requests] == ["1-0", "1-1"]
+        await last.close()
+
+    asyncio.run(main())
+
+
+def test_jobs_submitted_while_moving_to_failover_are_not_lost(tmp_path):
+    async def main():
+        down_calls = []
+
+        class DownPrinter:
+            async def post(self, path, payload):
+                down_calls.append(payload)
+                raise PrinterUnavailableError("a", 1.0)
+
+        backup = FakePrinter()
+        spool = make_spool(tmp_path, {"a": DownPrinter(), "b": backup},
+                           failover=lambda printer_id: "b" if printer_id == "a" else None)
+        spool._ensure_worker = lambda printer_id: None
+        spool._wakeups["a"] = asyncio.Event()
+        await spool.submit("a", "/print-text", {"text": "first"})
+
+        # Hold the second job's journal write so it finishes while the queue is being moved
+        append = spool._journal.append
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_append(records):
+            if records[0]["op"] == "put" and records[0]["job"]["payload"]["text"] == "second":
+                writing.set()
+                release.wait(2)
+            append(records)
+
+        spool._journal.append = slow_append
+        second = asyncio.ensure_future(spool.submit("a", "/print-text", {"text": "second"}))
+        await wait_for(writing.is_set)
+        del spool._ensure_worker
+        spool._ensure_worker("a")
+        await wait_for(lambda: down_calls)
+        await asyncio.sleep(0.05)
+        release.set()
+        await second
+
+        await wait_for(lambda: spool.completed == 2)
+        assert [payload["text"] for _, payload in backup.requests] == ["first", "second"]
+        await spool.close()
+
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import prep_tracking
+from app.services.container import get_recipe_cache
+from app.services.recipe_cache import RecipeCache
+
+RECIPES = b'[{"id": "r1", "name": "Curry"}]'
+
+
+class Upstream:
+    """Stands in for the recipe-upscaler: counts requests and answers 304 to its own ETag."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=RECIPES, headers={"etag": '"v1"', "content-type": "application/json"})
+
+
+def cache_for(upstream, **kwargs):
+    cache = RecipeCache("http://recipes", **kwargs)
+    cache._client = httpx.AsyncClient(base_url=cache.base_url, transport=httpx.MockTransport(upstream))
+    return cache
+
+
+def test_concurrent_requests_share_one_fetch_then_revalidate():
+    async def main():
+        upstream = Upstream(delay=0.05)
+        cache = cache_for(upstream, ttl=60)
+        served = await asyncio.gather(*(cache.recipes() for _ in range(10)))
+        assert len(upstream.requests) == 1
+        assert {status for _, status in served} == {"miss"}
+        assert all(recipes is served[0][0] for recipes, _ in served)
+        assert (await cache.recipes())[1] == "hit"
+
+        cache.invalidate()
+        recipes, status = await cache.recipes()
+        assert status == "revalidated" and recipes is served[0][0]
+        assert upstream.requests[-1].headers["if-none-match"] == '"v1"'
+        await cache.close()
+
+    asyncio.run(main())
+
+
+def test_route_answers_304_to_a_matching_etag():
+    cache = cache_for(Upstream(), ttl=60)
+    app = FastAPI()
+    app.include_router(prep_tracking.router)
+    app.dependency_overrides[get_recipe_cache] = lambda: cache
+    client = TestClient(app)
+
+    first = client.get("/recipes")
+    assert first.status_code == 200 and first.content == RECIPES
+    etag = first.headers["etag"]
+    assert first.headers["x-cache"] == "miss"
+
+    for header in (etag, f'"other", W/{etag}', "*"):
+        response = client.get("/recipes", headers={"If-None-Match": header})
+        assert response.status_code == 304 and response.headers["etag"] == etag
+    # A tag that merely contains ours, or a different one, gets the list
+    for header in (etag[:-1] + 'x"', f'"x{etag[1:]}', '"other"'):
+        assert client.get("/recipes", headers={"If-None-Match": header}).status_code == 200
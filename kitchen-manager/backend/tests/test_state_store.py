@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from app.services.state_store import FileStateStore, MemoryStateStore, StateStore, TraySelection
+from app.services.tray_repository import TrayRepository
+
+
+class CountingStore(MemoryStateStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def version(self, key):
+        self.reads += 1
+        return super().version(key)
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def test_selection_is_seen_by_another_worker(tmp_path):
+    first = TraySelection(FileStateStore(str(tmp_path)))
+    second = TraySelection(FileStateStore(str(tmp_path)))
+    assert first.replace(["T2", "T1", "T2"]) == ["T2", "T1"]
+    assert second.ids() == ["T2", "T1"]
+    assert "T1" in second and "T3" not in second
+
+
+def test_selected_reads_the_selection_once(tmp_path):
+    path = tmp_path / "GN.json"
+    path.write_text(json.dumps([{"id": f"T{i}"} for i in range(50)]))
+    store = CountingStore()
+    selection = TraySelection(store)
+    selection.replace(["T3", "T1", "T99"])
+    repository = TrayRepository(str(path), selection)
+
+    store.reads = 0
+    assert [tray["id"] for tray in repository.selected()] == ["T1", "T3"]
+    assert store.reads == 1
+
+
+def test_rewrite_with_the_same_inode_mtime_and_size_is_seen(tmp_path):
+    writer, reader = FileStateStore(str(tmp_path)), FileStateStore(str(tmp_path))
+    writer.put("prep", {"seq": 1})
+    assert reader.get("prep")[0] == {"seq": 1}
+    path = tmp_path / "prep.json"
+    before = os.stat(path)
+
+    # Write the next value's bytes into the same inode and wind the clock
+    # back, as when a file is rewritten within the timestamp granularity
+    writer.put("scratch", {"seq": 2})
+    with open(path, "r+b") as f:
+        f.write((tmp_path / "scratch.json").read_bytes())
+    os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns))
+    after = os.stat(path)
+    assert (after.st_ino, after.st_mtime_ns, after.st_size) == (before.st_ino, before.st_mtime_ns, before.st_size)
+
+    assert reader.get("prep")[0] == {"seq": 2}
+
+
+def test_files_written_before_headers_are_read(tmp_path):
+    (tmp_path / "selected_trays.json").write_text(json.dumps(["T1"]))
+    store = FileStateStore(str(tmp_path))
+    value, version = store.get("selected_trays")
+    assert value == ["T1"] and version == store.version("selected_trays")
+    assert store.put("selected_trays", ["T2"]) != version
+    assert store.get("selected_trays")[0] == ["T2"]
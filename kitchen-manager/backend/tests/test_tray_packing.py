@@ -0,0 +1,126 @@
+import itertools
+import random
+import time
+
+import pytest
+
+from app.services.tray_packing import EPSILON, capacity_lower_bound, pack_bags
+
+SIZES = [1.0, 2.0, 4.0, 6.5]
+
+
+def trays(*capacities):
+    return [{"id": f"T{i}", "name": f"Pan {i}", "volumeLiters": capacity} for i, capacity in enumerate(capacities)]
+
+
+def bags(*volumes, dish="Curry"):
+    return [{"id": f"{dish}-{i}", "dish": dish, "volume": volume} for i, volume in enumerate(volumes)]
+
+
+def fits(volumes, capacities):
+    """Whether the volumes can be split between pans of these capacities."""
+    volumes = sorted(volumes, reverse=True)
+    loads = [0.0] * len(capacities)
+
+    def place(index):
+        if index == len(volumes):
+            return True
+        tried = set()
+        for pan, capacity in enumerate(capacities):
+            if (capacity, loads[pan]) in tried or loads[pan] + volumes[index] > capacity + EPSILON:
+                continue
+            tried.add((capacity, loads[pan]))
+            loads[pan] += volumes[index]
+            if place(index + 1):
+                return True
+            loads[pan] -= volumes[index]
+        return False
+
+    return place(0)
+
+
+def fewest_pans(volumes, available):
+    """Exact minimum number of pans, by trying every set of pans smallest count first."""
+    capacities = sorted(float(t["volumeLiters"]) for t in available)
+    for count in range(1, len(capacities) + 1):
+        if any(fits(volumes, combo) for combo in set(itertools.combinations(capacities, count))):
+            return count
+    return None
+
+
+def check_assignment(result, packed, available):
+    """Every bag is placed once or reported unplaced, and no pan is overfilled or reused."""
+    capacity = {t["id"]: float(t["volumeLiters"]) for t in available}
+    volume = {bag["id"]: bag["volume"] for bag in packed}
+    placed = [bag_id for pan in result["assignments"] for bag_id in pan["bags"]]
+    assert sorted(placed + [bag["id"] for bag in result["unplaced"]]) == sorted(volume)
+    assert len({pan["tray_id"] for pan in result["assignments"]}) == result["pans_used"]
+    for pan in result["assignments"]:
+        assert sum(volume[bag_id] for bag_id in pan["bags"]) <= capacity[pan["tray_id"]] + EPSILON
+        assert pan["capacity_liters"] == capacity[pan["tray_id"]]
+
+
+def test_lower_bound_uses_the_largest_pans_first():
+    assert capacity_lower_bound([], trays(1.0)) == 0
+    assert capacity_lower_bound([3.0, 2.5], trays(1.0, 6.5, 2.0)) == 1
+    assert capacity_lower_bound([4.0, 4.0], trays(1.0, 2.0, 4.0, 1.0)) == 4
+
+
+def test_each_dish_gets_the_smallest_pan_that_holds_it():
+    available = trays(6.5, 1.0, 4.0, 2.0)
+    packed = bags(0.8, 0.9, dish="Rice") + bags(0.5, 0.4, dish="Salsa")
+    result = pack_bags(packed, available)
+    check_assignment(result, packed, available)
+    assert {pan["tray_id"]: pan["dishes"] for pan in result["assignments"]} == {"T3": ["Rice"], "T1": ["Salsa"]}
+
+
+def test_a_dish_too_big_for_one_pan_spans_several():
+    available = trays(2.0, 2.0, 2.0, 1.0)
+    packed = bags(1.5, 1.5, 1.5, 0.4)
+    result = pack_bags(packed, available)
+    check_assignment(result, packed, available)
+    assert result["pans_used"] == 3
+    assert not result["unplaced"]
+
+
+def test_oversized_bags_and_running_out_of_pans_are_reported():
+    available = trays(1.0, 1.0)
+    packed = bags(3.0, dish="Stock") + bags(0.9, 0.9, 0.9, dish="Rice")
+    result = pack_bags(packed, available)
+    check_assignment(result, packed, available)
+    reasons = sorted(bag["reason"] for bag in result["unplaced"])
+    assert reasons == ["No free pan is large enough", "Not enough free pans"]
+
+
+@pytest.mark.parametrize("mix_dishes", [False, True])
+def test_matches_an_exact_solver_within_one_pan(mix_dishes):
+    rng = random.Random(48)
+    for _ in range(200):
+        available = trays(*(rng.choice(SIZES) for _ in range(6)))
+        dishes = 1 if not mix_dishes else 3
+        packed = [
+            {"id": f"b{i}", "dish": f"d{rng.randrange(dishes)}", "volume": round(rng.uniform(0.2, 3.0), 2)}
+            for i in range(rng.randrange(2, 8))
+        ]
+        result = pack_bags(packed, available, mix_dishes=mix_dishes)
+        check_assignment(result, packed, available)
+        if result["unplaced"]:
+            continue
+        optimum = fewest_pans([bag["volume"] for bag in packed], available)
+        assert result["lower_bound"] <= optimum <= result["pans_used"] <= optimum + 1
+
+
+@pytest.mark.parametrize("mix_dishes", [False, True])
+def test_hundreds_of_bags_pack_quickly(mix_dishes):
+    rng = random.Random(480)
+    available = trays(*(rng.choice(SIZES) for _ in range(300)))
+    packed = [{"id": f"b{i}", "dish": f"d{rng.randrange(40)}", "volume": rng.uniform(0.2, 3.0)} for i in range(500)]
+
+    started = time.perf_counter()
+    result = pack_bags(packed, available, mix_dishes=mix_dishes)
+    elapsed = time.perf_counter() - started
+
+    check_assignment(result, packed, available)
+    assert result["pans_used"] >= result["lower_bound"]
+    # Milliseconds in practice; the margin is for slow CI machines
+    assert elapsed < 1.0
@@ -0,0 +1,129 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import label_processor
+from app.services.container import get_label_store
+from app.services.write_behind import LabelBufferFullError, WriteBehindLabelStore
+
+
+class FakeStore:
+    """Label store whose writes can be made to fail, as when MongoDB is down."""
+
+    def __init__(self):
+        self.labels = {}
+        self.batches = []
+        self.failing = False
+
+    def save_labels(self, labels):
+        if self.failing:
+            raise ConnectionError("store is down")
+        self.batches.append([label["label_id"] for label in labels])
+        for label in labels:
+            self.labels[label["label_id"]] = label
+        return labels
+
+    def save_label(self, label):
+        return self.save_labels([label])[0]
+
+    def get_label_by_id(self, label_id):
+        return self.labels.get(label_id)
+
+    def get_labels(self):
+        return list(self.labels.values())
+
+    def delete_label(self, label_id):
+        return self.labels.pop(label_id, None) is not None
+
+
+def label(label_id, dish="Soup"):
+    return {"label_id": label_id, "parsed_data": {"dish": dish}}
+
+
+@pytest.fixture
+def store():
+    return FakeStore()
+
+
+def make_buffer(store, **kwargs):
+    # A long interval keeps the background flusher out of the way
+    kwargs = {"max_pending": 3, "batch_size": 10, "flush_interval": 60.0, **kwargs}
+    return WriteBehindLabelStore(store, **kwargs)
+
+
+def test_reads_see_unflushed_saves(store):
+    store.labels["old"] = label("old")
+    buffer = make_buffer(store)
+    buffer.save_label(label("a"))
+    buffer.save_label(label("old", dish="Stew"))
+
+    assert store.labels == {"old": label("old")}
+    assert buffer.get_label_by_id("a") == label("a")
+    assert buffer.get_label_by_id("old")["parsed_data"]["dish"] == "Stew"
+    assert sorted(item["label_id"] for item in buffer.get_labels()) == ["a", "old"]
+
+    assert buffer.delete_label("a")
+    assert buffer.get_label_by_id("a") is None
+    assert buffer.flush() == 1
+    assert store.labels == {"old": label("old", dish="Stew")}
+    buffer.close()
+
+
+def test_full_buffer_flushes_inline(store):
+    buffer = make_buffer(store)
+    for label_id in "abc":
+        buffer.save_label(label(label_id))
+    assert store.batches == []
+
+    buffer.save_label(label("d"))
+    assert store.batches == [["a", "b", "c"]]
+    assert buffer.pending_count == 1
+    buffer.close()
+    assert sorted(store.labels) == ["a", "b", "c", "d"]
+
+
+def test_full_buffer_refuses_saves_while_the_store_is_down(store):
+    buffer = make_buffer(store)
+    store.failing = True
+    for label_id in "abc":
+        buffer.save_label(label(label_id))
+
+    with pytest.raises(LabelBufferFullError):
+        buffer.save_label(label("d"))
+    assert buffer.pending_count == 3
+    assert buffer.get_label_by_id("d") is None
+    # Saving a label already buffered needs no room
+    buffer.save_label(label("a", dish="Stew"))
+
+    store.failing = False
+    buffer.save_label(label("d"))
+    assert store.labels["a"]["parsed_data"]["dish"] == "Stew"
+    buffer.close()
+    assert sorted(store.labels) == ["a", "b", "c", "d"]
+
+
+def test_background_flush_writes_in_batches(store):
+    buffer = make_buffer(store, max_pending=100, batch_size=2)
+    buffer.save_label(label("a"))
+    buffer.save_label(label("b"))
+    buffer.save_label(label("c"))
+    buffer.close()
+    assert [label_id for batch in store.batches for label_id in batch] == ["a", "b", "c"]
+    assert store.batches[0] == ["a", "b"]
+
+
+def test_save_route_answers_503_when_the_buffer_is_full(store):
+    buffer = make_buffer(store, max_pending=1)
+    store.failing = True
+    app = FastAPI()
+    app.include_router(label_processor.router)
+    app.dependency_overrides[get_label_store] = lambda: buffer
+    client = TestClient(app)
+
+    assert client.post("/save-label", json=label("a")).status_code == 200
+    response = client.post("/save-label", json=label("b"))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "60"
+
+    store.failing = False
+    buffer.close()